@@ -0,0 +1,205 @@
+# Microbenchmarks of the per step hot paths of each backend folder, parameterized over npc and nact.
+# Each folder is benchmarked in its own process, since the folders share module names (model, env).
+# Results are written as JSON, named by commit, and compared against an earlier file with --compare. e.g.
+# python benchmarks/micro.py --npc 16 64 256 1024 4096
+# python benchmarks/micro.py --compare benchmarks/results/micro_<commit>.json
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ['numpy/1D', 'numpy/2D', 'jax/1D', 'jax/2D']
+
+
+def bench(func, mintime=0.2, repeat=5, setup=None):
+    # seconds per call, best and median over repeat runs of number calls, number calibrated to mintime/repeat
+    timer = timeit.Timer(func)
+    number, elapsed = 1, 0.0
+    while True:
+        if setup is not None:
+            setup()
+        elapsed = timer.timeit(number)
+        if elapsed >= mintime / repeat:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(mintime / repeat / elapsed) + 1))
+    times = []
+    for r in range(repeat):
+        if setup is not None:
+            setup()
+        times.append(timer.timeit(number) / number)
+    return {'min_us': min(times)*1e6, 'median_us': float(np.median(times))*1e6, 'number': number, 'repeat': repeat}
+
+
+def get_cases_numpy1d(npcs, nacts):
+    from model import uniform_pc_weights, PlaceFieldParams, predict_placecell, predict_action_prob, get_onehot_action, ActionSampler, learn
+    from env import OneDimNav
+    state, newstate = np.array([0.1]), np.array([0.12])
+    etas = [1e-4, 1e-4, 1e-4, 1e-3, 1e-3]
+    for nact in nacts:
+        for npc in npcs:
+            params = PlaceFieldParams(uniform_pc_weights(npc, nact, 0))
+            aprob = predict_action_prob(params, predict_placecell(params, state))
+            sampler = ActionSampler(np.random.default_rng(0))
+            yield 'predict_placecell', npc, nact, lambda: predict_placecell(params, state)
+            yield 'learn', npc, nact, lambda: learn(params, 0.0, newstate, state, 1, aprob, 0.9, etas)
+            yield 'get_onehot_action', npc, nact, lambda: get_onehot_action(aprob, nact)
+            yield 'ActionSampler.sample', npc, nact, lambda: sampler.sample(aprob)
+        env = OneDimNav(nact, rng=np.random.default_rng(0))
+        yield 'OneDimNav.step', None, nact, (lambda: env.step(1)), env.reset
+
+
+def get_cases_numpy2d(npcs, nacts):
+    from model import uniform_2D_pc_weights, PlaceFieldParams, LearnWorkspace, predict_placecell, predict_action_prob, get_onehot_action, ActionSampler
+    from model import learn, learn_diag, invert_matrices, correct_covariance_matrices
+    from env import NDimNav
+    state, newstate = np.array([0.1, -0.2]), np.array([0.12, -0.18])
+    etas = [1e-4, 1e-4, 1e-4, 1e-3, 1e-3]
+    for nact in nacts:
+        for npc in npcs:
+            params = PlaceFieldParams(uniform_2D_pc_weights(npc, nact, 0))
+            aprob = predict_action_prob(params, predict_placecell(params, state))
+            sampler = ActionSampler(np.random.default_rng(0))
+            ws = LearnWorkspace(npc, nact)
+            yield 'predict_placecell', npc, nact, lambda: predict_placecell(params, state)
+            yield 'invert_matrices', npc, nact, lambda: invert_matrices(params[1])
+            yield 'correct_covariance_matrices', npc, nact, lambda: correct_covariance_matrices(params[1], 1e-5, 0.5)
+            yield 'learn', npc, nact, lambda: learn(params, 0.0, newstate, state, 1, aprob, 0.9, etas)
+            yield 'learn_ws', npc, nact, lambda: learn(params, 0.0, newstate, state, 1, aprob, 0.9, etas, ws=ws)
+            yield 'learn_diag', npc, nact, lambda: learn_diag(params, 0.0, newstate, state, 1, aprob, 0.9, etas)
+            yield 'get_onehot_action', npc, nact, lambda: get_onehot_action(aprob, nact)
+            yield 'ActionSampler.sample', npc, nact, lambda: sampler.sample(aprob)
+        if nact == 4:  # the arena has four directions
+            env = NDimNav(nact, startcoord=[[-0.75,-0.75],[0.0,0.75]], rng=np.random.default_rng(0))
+            yield 'NDimNav.step', None, nact, (lambda: env.step(1)), env.reset
+
+
+def get_cases_jax(npcs, nacts, dim, steps=100):
+    # update_td_params on one episode of steps transitions, compiled before timing
+    import jax
+    import model
+    rng = np.random.default_rng(0)
+    for nact in nacts:
+        for npc in npcs:
+            if dim == 1:
+                params = model.uniform_pc_weights(npc, nact, 0)
+                coords = rng.uniform(-1, 1, (steps+1, 1))
+            else:
+                params = model.uniform_2D_pc_weights(npc, nact, 0)
+                coords = rng.uniform(-1, 1, (steps+1, 2))
+            actions = np.eye(nact)[rng.integers(nact, size=steps)]
+            rewards = np.zeros(steps)
+            etas, betas = [1e-4, 1e-4, 1e-4, 1e-3, 1e-3], [0.5, 0.0]
+            def update():
+                newparams, grads, loss = model.update_td_params(params, coords, actions, rewards, etas, 0.9, betas)
+                return jax.block_until_ready(newparams)
+            start = time.time()
+            update()
+            yield 'update_td_params', npc, nact, update, None, {'steps': steps, 'compile_s': time.time() - start}
+
+
+def run_worker(backend, npcs, nacts, mintime):
+    sys.path.insert(0, os.path.join(ROOT, backend))
+    os.chdir(os.path.join(ROOT, backend))
+    dim = int(backend.split('/')[1][0])
+    if backend.startswith('numpy'):
+        cases = get_cases_numpy1d(npcs, nacts) if dim == 1 else get_cases_numpy2d(npcs, nacts)
+    else:
+        cases = get_cases_jax(npcs, nacts, dim)
+    results = []
+    with np.errstate(all='ignore'):
+        for case in cases:
+            name, npc, nact, func = case[:4]
+            setup = case[4] if len(case) > 4 else None
+            extra = case[5] if len(case) > 5 else {}
+            result = {'name': name, 'backend': backend, 'dim': dim, 'npc': npc, 'nact': nact, **bench(func, mintime, setup=setup), **extra}
+            print(f"{backend} {name} npc {npc} nact {nact} {result['min_us']:.2f}us", file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def get_versions():
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    try:
+        import jax
+        versions['jax'] = jax.__version__
+    except ImportError:
+        pass
+    return versions
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def get_key(result):
+    return (result['backend'], result['name'], result['npc'], result['nact'])
+
+
+def compare(results, baseline, threshold=1.1):
+    # ratio of the best times against a baseline file, > threshold is reported as a regression
+    base = {get_key(r): r for r in baseline['results']}
+    regressions = 0
+    print(f"{'backend':10} {'name':28} {'npc':>5} {'nact':>4} {'base us':>10} {'now us':>10} {'ratio':>6}")
+    for result in results:
+        old = base.get(get_key(result))
+        if old is None:
+            continue
+        ratio = result['min_us'] / old['min_us']
+        flag = ' slower' if ratio > threshold else (' faster' if ratio < 1/threshold else '')
+        regressions += ratio > threshold
+        print(f"{result['backend']:10} {result['name']:28} {str(result['npc']):>5} {result['nact']:>4} {old['min_us']:10.2f} {result['min_us']:10.2f} {ratio:6.2f}{flag}")
+    print(f"{regressions} cases slower than {threshold}x of {baseline['commit']}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', type=str, nargs='+', required=False, help='folders to benchmark', default=BACKENDS)
+    parser.add_argument('--npc', type=int, nargs='+', required=False, help='number of fields (2D: total, a square number)', default=[16, 64, 256, 1024, 4096])
+    parser.add_argument('--nact', type=int, nargs='+', required=False, help='number of actions, default 2 in 1D and 4 in 2D', default=[])
+    parser.add_argument('--mintime', type=float, required=False, help='seconds per case', default=0.2)
+    parser.add_argument('--outfile', type=str, required=False, help='JSON results, default benchmarks/results/micro_<commit>.json', default='')
+    parser.add_argument('--compare', type=str, required=False, help='earlier JSON results to compare against', default='')
+    parser.add_argument('--threshold', type=float, required=False, help='slowdown ratio reported as a regression', default=1.1)
+    parser.add_argument('--worker', type=str, required=False, help=argparse.SUPPRESS, default='')
+    args = parser.parse_args()
+
+    if args.worker:
+        nacts = args.nact or ([2] if args.worker.endswith('1D') else [4])
+        json.dump(run_worker(args.worker, args.npc, nacts, args.mintime), sys.stdout)
+        sys.exit(0)
+
+    results = []
+    for backend in args.backends:
+        argv = [sys.executable, os.path.abspath(__file__), '--worker', backend, '--npc'] + [str(n) for n in args.npc] + ['--mintime', str(args.mintime)]
+        if args.nact:
+            argv += ['--nact'] + [str(n) for n in args.nact]
+        env = dict(os.environ, MPLBACKEND='Agg')
+        proc = subprocess.run(argv, stdout=subprocess.PIPE, env=env, text=True)
+        if proc.returncode != 0:
+            print(f'{backend} failed with exit code {proc.returncode}', file=sys.stderr)
+            continue
+        results += json.loads(proc.stdout)
+
+    commit = get_commit()
+    record = {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': platform.platform(),
+              'processor': platform.processor(), 'versions': get_versions(), 'mintime': args.mintime, 'results': results}
+    outfile = args.outfile or os.path.join(ROOT, 'benchmarks', 'results', f'micro_{commit}.json')
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    with open(outfile, 'w') as file:
+        json.dump(record, file, indent=1)
+    print(f'{len(results)} cases written to {outfile}')
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file), args.threshold)
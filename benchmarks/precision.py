@@ -0,0 +1,127 @@
+# Validation of the --precision and --storage policies. Each backend folder is trained over several seeds with every
+# policy (compute dtype, history dtype), and G, score and drift are compared against the float64 runs of the same
+# seeds. A policy passes when its mean differs from the reference mean by less than --tol relative, or less than
+# two standard errors of the reference across seeds. Also reports the history bytes and the run time, e.g.
+# python benchmarks/precision.py
+# python benchmarks/precision.py --backends numpy/2D --seeds 0 1 2 3 --episodes 500
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+from micro import ROOT, get_commit, get_versions
+
+# options per folder, jax/1D runs the online learner, which has the same per step update as numpy/1D
+BACKENDS = {
+    'numpy/1D': {'episodes': 1000, 'npc': 64, 'tmax': 100},
+    'numpy/2D': {'episodes': 200, 'npc': 8, 'tmax': 300},
+    'jax/1D': {'episodes': 1000, 'npc': 64, 'tmax': 100, 'learner': 'online'},
+}
+# (precision, storage), the first is the reference
+POLICIES = [('float64', 'float64'), ('float32', 'float32'), ('float32', 'bfloat16'), ('float64', 'bfloat16')]
+
+
+def run_worker(folder, config):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+    os.chdir(os.path.join(ROOT, folder))
+    from experiment import run_experiment
+
+    config = dict(config, plot=0)
+    if folder.startswith('numpy'):
+        config['processes'] = 0
+    start = time.time()
+    with tempfile.TemporaryDirectory() as datadir, contextlib.redirect_stdout(open(os.devnull, 'w')):
+        result = run_experiment(config, datadir=datadir+'/')
+    elapsed = time.time() - start
+
+    metrics = getattr(result, 'metrics', None) or {}
+    memory = getattr(result, 'memory', None)
+    nbytes = memory['bytes_logparams'] + memory['bytes_allcoords'] if memory else result.logparams.nbytes
+    return {'backend': folder, **config, 'seconds': elapsed, 'history_bytes': int(nbytes),
+            'G': float(np.mean(np.ravel(result.allrewards)[-100:])),
+            'score': float(metrics['score']) if 'score' in metrics else None,
+            'drift': float(metrics['drift']) if 'drift' in metrics else None}
+
+
+def validate(results, tol=0.05):
+    # mean over seeds per policy against the reference policy, returns the rows and the number of failures
+    rows, failures = [], 0
+    for backend in dict.fromkeys(r['backend'] for r in results):
+        runs = [r for r in results if r['backend'] == backend]
+        get_runs = lambda policy: [r for r in runs if (r['precision'], r['storage']) == policy]
+        reference = get_runs(POLICIES[0])
+        for policy in POLICIES:
+            row = {'backend': backend, 'precision': policy[0], 'storage': policy[1], 'ok': True,
+                   'seconds': float(np.mean([r['seconds'] for r in get_runs(policy)])),
+                   'history_bytes': int(np.mean([r['history_bytes'] for r in get_runs(policy)]))}
+            for name in ['G', 'score', 'drift']:
+                values = [r[name] for r in get_runs(policy) if r[name] is not None]
+                refvalues = [r[name] for r in reference if r[name] is not None]
+                if not values or not refvalues:
+                    continue
+                mean, refmean = np.mean(values), np.mean(refvalues)
+                sem = np.std(refvalues, ddof=1) / np.sqrt(len(refvalues)) if len(refvalues) > 1 else 0.0
+                row[name] = float(mean)
+                row[name+'_rel'] = float(abs(mean - refmean) / abs(refmean)) if refmean != 0 else 0.0
+                row['ok'] &= bool(abs(mean - refmean) <= max(tol * abs(refmean), 2 * sem))
+            failures += not row['ok']
+            rows.append(row)
+    return rows, failures
+
+
+def print_table(rows):
+    print(f"{'backend':9} {'compute':8} {'storage':8} {'G':>7} {'dG':>6} {'score':>10} {'dscore':>6} {'drift':>9} {'ddrift':>6} {'hist MB':>8} {'s':>6}")
+    fmt = lambda row, name, spec: format(row[name], spec) if name in row else '-'
+    for row in rows:
+        print(f"{row['backend']:9} {row['precision']:8} {row['storage']:8} {fmt(row, 'G', '.3f'):>7} {fmt(row, 'G_rel', '.3f'):>6} "
+              f"{fmt(row, 'score', '.1f'):>10} {fmt(row, 'score_rel', '.3f'):>6} {fmt(row, 'drift', '.2e'):>9} {fmt(row, 'drift_rel', '.3f'):>6} "
+              f"{row['history_bytes']/1024**2:8.2f} {row['seconds']:6.1f}{'' if row['ok'] else '  FAIL'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', type=str, nargs='+', required=False, help='folders to validate', default=list(BACKENDS))
+    parser.add_argument('--seeds', type=int, nargs='+', required=False, help='seeds per policy', default=[0, 1, 2])
+    parser.add_argument('--episodes', type=int, required=False, help='episodes per run, 0 for the folder default', default=0)
+    parser.add_argument('--tol', type=float, required=False, help='relative tolerance on the mean of G, score and drift', default=0.05)
+    parser.add_argument('--outfile', type=str, required=False, help='JSON results, default benchmarks/results/precision_<commit>.json', default='')
+    parser.add_argument('--worker', type=str, required=False, help=argparse.SUPPRESS, default='')
+    args = parser.parse_args()
+
+    if args.worker:
+        folder, config = json.loads(args.worker)
+        json.dump(run_worker(folder, config), sys.stdout)
+        sys.exit(0)
+
+    results = []
+    for folder in args.backends:
+        config = dict(BACKENDS[folder], episodes=args.episodes) if args.episodes else BACKENDS[folder]
+        for precision, storage in POLICIES:
+            for seed in args.seeds:
+                runconfig = dict(config, precision=precision, storage=storage, seed=seed)
+                argv = [sys.executable, os.path.abspath(__file__), '--worker', json.dumps([folder, runconfig])]
+                proc = subprocess.run(argv, stdout=subprocess.PIPE, env=dict(os.environ, MPLBACKEND='Agg'), text=True)
+                if proc.returncode != 0:
+                    print(f'{folder} {precision} {storage} seed {seed} failed with exit code {proc.returncode}', file=sys.stderr)
+                    continue
+                results.append(json.loads(proc.stdout))
+                print(f"{folder} {precision} {storage} seed {seed} {results[-1]['seconds']:.1f}s", file=sys.stderr)
+
+    rows, failures = validate(results, args.tol)
+    commit = get_commit()
+    record = {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': platform.platform(),
+              'versions': get_versions(), 'tol': args.tol, 'summary': rows, 'results': results}
+    outfile = args.outfile or os.path.join(ROOT, 'benchmarks', 'results', f'precision_{commit}.json')
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    with open(outfile, 'w') as file:
+        json.dump(record, file, indent=1)
+
+    print_table(rows)
+    print(f'{failures} policies outside the tolerance, {len(results)} runs written to {outfile}')
+    sys.exit(1 if failures else 0)
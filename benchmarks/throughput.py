@@ -0,0 +1,127 @@
+# End to end throughput of short fixed seed training runs of each backend folder, and of the offline SR learning of 1D_sr.py.
+# Each workload runs run_experiment (the training part of main.py, without plots or analysis) in its own process,
+# and reports episodes/s, steps/s, peak RSS and, for JAX, the time spent compiling.
+# The numpy and JAX folders get identical configs, so the table compares the backends per workload. e.g.
+# python benchmarks/throughput.py
+# python benchmarks/throughput.py --workloads 2D --episodes 100 --npc 8 16
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+from micro import ROOT, get_commit, get_versions
+
+# workload: folders and options shared by all of them, npc is per side in 2D
+WORKLOADS = {
+    '1D': (['numpy/1D', 'jax/1D'], {'episodes': 200, 'npc': 64, 'tmax': 100}),
+    '2D': (['numpy/2D', 'jax/2D'], {'episodes': 50, 'npc': 8, 'tmax': 300}),
+    '1D_sr': (['numpy/1D'], {'episodes': 200, 'npc': 64, 'tmax': 100}),
+    '1D_online': (['numpy/1D', 'jax/1D'], {'episodes': 200, 'npc': 64, 'tmax': 100, 'learner': 'online'}),  # per step learning in both
+}
+
+
+def get_rss():
+    # peak resident set size of this process in MB, ru_maxrss is in kB on linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024**2 if sys.platform == 'darwin' else maxrss / 1024
+
+
+def run_worker(folder, workload, config):
+    start = time.time()
+    sys.path.insert(0, os.path.join(ROOT, folder))
+    os.chdir(os.path.join(ROOT, folder))
+    from experiment import run_experiment
+
+    compile_s = [0.0]
+    if folder.startswith('jax'):
+        import jax.monitoring
+        def add_compile_time(event, duration, **kwargs):
+            if event.startswith('/jax/core/compile/'):
+                compile_s[0] += duration
+        jax.monitoring.register_event_duration_secs_listener(add_compile_time)
+    import_s = time.time() - start
+    import_rss = get_rss()
+
+    config = dict(config, seed=0, plot=0)
+    if folder.startswith('numpy'):
+        # skip the history and the analysis, except for the SR which learns from the recorded trajectories
+        config['analysis'] = 'full' if workload == '1D_sr' else 'online'
+    start = time.time()
+    with tempfile.TemporaryDirectory() as datadir, contextlib.redirect_stdout(open(os.devnull, 'w')):
+        if workload == '1D_sr':
+            from sr_utils import learn_sr_offline
+            result = run_experiment(config, datadir=datadir+'/')
+            start = time.time()
+            U, Us = learn_sr_offline(result.logparams, result.allcoords, 0.0025, 0.9, trials=[config['episodes']])
+            steps = int(sum(len(coords) for coords in result.allcoords))
+        else:
+            result = run_experiment(config, datadir=datadir+'/')
+            steps = int(sum(np.array(result.latencys)+1))
+    elapsed = time.time() - start
+
+    return {'workload': workload, 'backend': folder, **config, 'steps': steps, 'seconds': elapsed,
+            'episodes_per_s': config['episodes']/elapsed, 'steps_per_s': steps/elapsed,
+            'compile_s': compile_s[0], 'import_s': import_s, 'import_rss_mb': import_rss, 'peak_rss_mb': get_rss(),
+            'final_reward': float(np.mean(result.allrewards[-10:])) if len(result.allrewards) else None}
+
+
+def print_table(results):
+    # backends side by side per workload and config, the speedup is relative to the first backend
+    print(f"{'workload':9} {'npc':>4} {'backend':9} {'episodes/s':>11} {'steps/s':>9} {'compile s':>9} {'peak MB':>8} {'speedup':>7}")
+    first = {}
+    for result in results:
+        key = (result['workload'], result['npc'])
+        first.setdefault(key, result['steps_per_s'])
+        speedup = result['steps_per_s'] / first[key]
+        print(f"{result['workload']:9} {result['npc']:>4} {result['backend']:9} {result['episodes_per_s']:11.2f} {result['steps_per_s']:9.0f} {result['compile_s']:9.2f} {result['peak_rss_mb']:8.0f} {speedup:7.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workloads', type=str, nargs='+', required=False, help='workloads to run', default=list(WORKLOADS))
+    parser.add_argument('--backends', type=str, nargs='+', required=False, help='restrict to these folders', default=[])
+    parser.add_argument('--episodes', type=int, required=False, help='episodes per run, 0 for the workload default', default=0)
+    parser.add_argument('--npc', type=int, nargs='+', required=False, help='number of fields (per side in 2D), default per workload', default=[])
+    parser.add_argument('--outfile', type=str, required=False, help='JSON results, default benchmarks/results/throughput_<commit>.json', default='')
+    parser.add_argument('--worker', type=str, required=False, help=argparse.SUPPRESS, default='')
+    args = parser.parse_args()
+
+    if args.worker:
+        folder, workload, config = json.loads(args.worker)
+        json.dump(run_worker(folder, workload, config), sys.stdout)
+        sys.exit(0)
+
+    results = []
+    for workload in args.workloads:
+        folders, config = WORKLOADS[workload]
+        if args.episodes:
+            config = dict(config, episodes=args.episodes)
+        for npc in args.npc or [config['npc']]:
+            for folder in folders:
+                if args.backends and folder not in args.backends:
+                    continue
+                argv = [sys.executable, os.path.abspath(__file__), '--worker', json.dumps([folder, workload, dict(config, npc=npc)])]
+                proc = subprocess.run(argv, stdout=subprocess.PIPE, env=dict(os.environ, MPLBACKEND='Agg'), text=True)
+                if proc.returncode != 0:
+                    print(f'{workload} {folder} npc {npc} failed with exit code {proc.returncode}', file=sys.stderr)
+                    continue
+                results.append(json.loads(proc.stdout))
+                print(f"{workload} {folder} npc {npc} {results[-1]['seconds']:.1f}s", file=sys.stderr)
+
+    commit = get_commit()
+    record = {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': platform.platform(),
+              'processor': platform.processor(), 'cpus': os.cpu_count(), 'versions': get_versions(), 'results': results}
+    outfile = args.outfile or os.path.join(ROOT, 'benchmarks', 'results', f'throughput_{commit}.json')
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    with open(outfile, 'w') as file:
+        json.dump(record, file, indent=1)
+
+    print_table(results)
+    print(f'{len(results)} runs written to {outfile}')
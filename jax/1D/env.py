@@ -1,10 +1,11 @@
 import numpy as np
-import matplotlib.pyplot as plt
+import jax.numpy as jnp
 
 
 class OneDimNav:
-    def __init__(self,nact,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=100, goalcoord=[0.8], startcoord=[-0.8], initvelocity=0.0, max_reward=5) -> None:
+    def __init__(self,nact,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=100, goalcoord=[0.8], startcoord=[-0.8], initvelocity=0.0, max_reward=5, rng=None) -> None:
         self.tmax = tmax  # maximum steps per trial
+        self.rng = np.random if rng is None else rng  # numpy Generator, the global numpy RNG by default
         self.minsize = -envsize  # arena size
         self.maxsize = envsize
         self.state = 0
@@ -34,13 +35,15 @@ class OneDimNav:
         return rx * (rx>threshold)
     
     def action2velocity(self, g):
-        # convert onehot action vector from actor to velocity
+        # convert onehot action vector or action index from actor to velocity
+        if np.ndim(g) == 0:
+            return self.onehot2dirmat[g]
         return np.matmul(g, self.onehot2dirmat)
 
     
     def reset(self):
         if len(self.starts) > 1:  # choose from multiple start locations
-            startidx = np.random.choice(np.arange(len(self.starts)),1)
+            startidx = self.rng.choice(np.arange(len(self.starts)),1)
             self.state = self.starts[startidx].copy()
             if len(self.goals)>1:
                 self.goal = self.goals[startidx].copy()
@@ -114,10 +117,11 @@ class OneDimNav:
         return self.state, self.reward, self.done
 
     def random_action(self):
-        action = np.random.uniform(low=-1, high=1,size=self.actionsize)
+        action = self.rng.uniform(low=-1, high=1,size=self.actionsize)
         return action 
 
     def plot_trajectory(self, title=None):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(4,2))
         plt.title(f'1D {title}')
         plt.hlines(xmin=self.minsize,xmax=self.maxsize, y=1, colors='k')
@@ -129,6 +133,21 @@ class OneDimNav:
             elif i == 1:
                 plt.eventplot(s, color='g') 
             else:
-                plt.eventplot(s, color='b', zorder=1) 
-   
+                plt.eventplot(s, color='b', zorder=1)
 
+
+def nav_step(env, state, velocity, action, goal):
+    # jittable OneDimNav.step with the gauss reward for the online learner: state and velocity are carried by the
+    # caller, env only provides the constants. Returns the new state, velocity and the reward as a scalar
+    acceleration = jnp.asarray(env.onehot2dirmat)[action] * env.maxspeed
+    velocity = velocity + env.tauact * (-velocity + acceleration)
+    newstate = state + velocity
+
+    # stay and stop at the boundary
+    out = (newstate > env.maxsize) | (newstate < -env.maxsize)
+    newstate = jnp.where(out, state, newstate)
+    velocity = jnp.where(out, 0.0, velocity)
+
+    rx = env.amp * jnp.exp(-0.5*((newstate - goal)/env.goalsize)**2)
+    reward = jnp.sum(rx * (rx > env.reward_threshold))
+    return newstate, velocity, reward
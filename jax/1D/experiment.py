@@ -0,0 +1,300 @@
+# Copyright (c) 2024 M Ganesh Kumar
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+# importable version of main.py: run_experiment(config) trains one agent and returns a RunResult.
+# Training only needs jax, numpy, env and model. utils (matplotlib, scipy) is imported when the
+# run saves or plots, so that sweep workers start quickly.
+
+import os
+os.environ.setdefault("XLA_PYTHON_CLIENT_MEM_FRACTION", "0.2")
+import time
+import argparse
+from functools import partial
+from dataclasses import dataclass
+import jax.numpy as jnp
+import numpy as np
+import jax
+from jax import config, lax
+from jax.experimental import enable_x64
+config.update('jax_platform_name', 'cpu')
+from env import OneDimNav, nav_step
+from history import ParamHistory, HostCopier
+from model import uniform_pc_weights, random_all_pc_weights, predict_placecell, predict_action_prob, ActionSampler, get_onehot, update_td_params, learn, add_noise
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--episodes', type=int, required=False, help='episodes', default=50000)
+    parser.add_argument('--tmax', type=int, required=False, help='tmax', default=100)
+
+    parser.add_argument('--goalcoords', type=float,nargs='+', required=False, help='goal coords', default=[[0.5]])
+    parser.add_argument('--startcoods', type=float,nargs='+', required=False, help='start coods', default=[-0.75])
+    parser.add_argument('--rsz', type=float, required=False, help='reward radius', default=0.05)
+    parser.add_argument('--rmax', type=int, required=False, help='max rewards to accumulate', default=5)
+
+    parser.add_argument('--seed', type=int, required=False, help='seed', default=0)
+    parser.add_argument('--pcinit', type=str, required=False, help='homogeneous or heterogenous field population', default='homo')
+    parser.add_argument('--bptype', type=str, required=False, help='backprop TD error using', default='both')
+    parser.add_argument('--npc', type=int, required=False, help='number of fields', default=64)
+    parser.add_argument('--alpha', type=float, required=False, help='alpha init', default=1)
+    parser.add_argument('--sigma', type=float, required=False, help='sigma init', default=0.1)
+
+    parser.add_argument('--plr', type=float, required=False, help='actor learning rate', default=0.01)
+    parser.add_argument('--clr', type=float, required=False, help='critic lr', default=0.01)
+    parser.add_argument('--llr', type=float, required=False, help='lambda lr', default=0.0001) 
+    parser.add_argument('--alr', type=float, required=False, help='alpha lr', default=0.0001) 
+    parser.add_argument('--slr', type=float, required=False, help='sigma lr', default=0.0001)
+    parser.add_argument('--gamma', type=float, required=False, help='gamma', default=0.9)
+    parser.add_argument('--nact', type=int, required=False, help='number of actions', default=2)
+    parser.add_argument('--beta', type=float, required=False, help='action beta', default=1)
+
+    parser.add_argument('--bsigma', type=float, required=False, help='L2 penalty for sigma', default=0.0)
+    parser.add_argument('--balpha', type=float, required=False, help='L2 penalty for alpha', default=0.0)
+    parser.add_argument('--sigmaclip', type=float, required=False, help='clip to max sigma value', default=0.0)
+    parser.add_argument('--alphaclip', type=float, required=False, help='clip to max alpha value', default=0.0)
+
+    parser.add_argument('--paramsindex', type=int,nargs='+', required=False, help='which params to add noise to', default=[0,1,2])
+    parser.add_argument('--noise', type=float, required=False, help='noise variance magnitude', default=0.00)
+
+    parser.add_argument('--learner', type=str, required=False, help='episode (update_td_params after each episode) or online (per step learn, as in the numpy folder)', default='episode')
+    parser.add_argument('--precision', type=str, required=False, help='dtype of params, activations and trajectories: float32 or float64 (enables jax_enable_x64)', default='float32')
+    parser.add_argument('--storage', type=str, required=False, help='dtype of the logparams history: float32, float64 or bfloat16 (emulated), default precision', default='')
+    parser.add_argument('--compilecache', type=str, required=False, help='directory of the persistent compilation cache, shared across runs', default='')
+    parser.add_argument('--precompile', type=str, required=False, help='episode lengths to compile update_td_params for before training: tmax, all or none', default='tmax')
+    parser.add_argument('--analysis', type=str, required=False, help='analysis', default='na')
+    parser.add_argument('--datadir', type=str, required=False, help='datadir', default='./data/')
+    parser.add_argument('--figdir', type=str, required=False, help='figdir', default='./fig/')
+    parser.add_argument('--plot', type=int, required=False, help='1 to plot the analysis figure', default=1)
+    return parser
+
+def get_config(config=None, **kwargs):
+    # defaults of main.py updated by config (argparse Namespace or dict) and keyword arguments
+    args = get_parser().parse_args([])
+    if config is not None:
+        vars(args).update(config if isinstance(config, dict) else vars(config))
+    vars(args).update(kwargs)
+    return args
+
+def configure_compile_cache(cachedir):
+    # persistent on disk cache of compiled programs, so that later processes load update_td_params instead of
+    # compiling it. jax 0.4 only caches CPU programs built with the XLA runtime, and XLA_FLAGS is read when the
+    # backend starts, i.e. at the first jax operation of the process
+    if '--xla_cpu_use_xla_runtime' not in os.environ.get('XLA_FLAGS', ''):
+        os.environ['XLA_FLAGS'] = (os.environ.get('XLA_FLAGS', '') + ' --xla_cpu_use_xla_runtime=true').strip()
+    config.update('jax_compilation_cache_dir', cachedir)
+    config.update('jax_persistent_cache_min_compile_time_secs', 0)
+
+def precompile_update(params, lengths, dim, nact, etas, gamma, betas):
+    # ahead of time lowering and compilation of update_td_params for episodes of the given lengths,
+    # returns the executables by episode length and the seconds spent
+    start = time.time()
+    compiled = {}
+    for T in lengths:
+        coords = jax.ShapeDtypeStruct((T+1, dim), params[0].dtype)
+        actions = jax.ShapeDtypeStruct((T, nact), params[0].dtype)
+        rewards = jax.ShapeDtypeStruct((T,), params[0].dtype)
+        compiled[T] = update_td_params.lower(params, coords, actions, rewards, etas, gamma, betas).compile()
+    return compiled, time.time() - start
+
+def get_exptname(args):
+    exptname = f'1D_td_{args.nact}a_{args.npc}n_{args.seed}s_{args.episodes}e_{args.rsz}gs_{args.plr}plr_{args.llr}llr_{args.alr}alr_{args.slr}slr_{args.balpha}ba'
+    if args.learner == 'online':
+        exptname += f'_online_{args.bptype}_{args.noise}ns'
+    if args.precision != 'float32':
+        exptname += f'_{args.precision}'
+    return exptname
+
+
+@dataclass
+class RunResult:
+    exptname: str
+    args: argparse.Namespace
+    params: list  # fields and weights after training
+    logparams: list  # per episode snapshots
+    allcoords: list
+    allrewards: list
+    latencys: list
+    losses: list
+    env: OneDimNav = None
+    compile: dict = None  # precompiled episode lengths and compile seconds
+
+
+# inner loop training loop
+def run_trial(params, env, args, sampler):
+    coords = []
+    actions = []
+    rewards = []
+
+    state, goal, eucdist, done = env.reset()
+    totR = 0
+
+    for t in range(args.tmax):
+
+        pcact = predict_placecell(params, state)
+
+        aprob = predict_action_prob(params, pcact)
+
+        action = sampler.sample(aprob)
+
+        newstate, reward, done = env.step(action)
+
+        coords.append(state)
+        actions.append(get_onehot(action, args.nact))  # td_loss takes onehot actions
+        rewards.append(reward)
+
+        state = newstate.copy()
+
+        totR += reward
+
+        if done:
+            coords.append(newstate)  # include new state for value computation
+            break
+
+    return jnp.array(coords, args.precision), jnp.array(rewards, args.precision).reshape(-1), jnp.array(actions, args.precision), t
+
+
+def make_online_trial(env, args, etas):
+    # one episode of per step learning as a jitted lax.scan over tmax steps, steps after done leave the carry as
+    # it is. Actions and noise come from the episode key. Returns the params, the final state, the total reward
+    # and per step states, actions, rewards, TD errors and which steps were taken
+    b_sig_alp = [args.bsigma, args.balpha]
+    clip_sig_alp = [args.sigmaclip, args.alphaclip]
+    paramsindex = args.paramsindex if args.noise > 0 else []
+
+    @partial(jax.jit, donate_argnums=0)
+    def online_trial(params, state, goal, key):
+
+        def step(carry, key):
+            params, state, velocity, total, t, done = carry
+
+            def active(carry):
+                pcact = predict_placecell(params, state)
+                aprob = predict_action_prob(params, pcact)
+                skey, nkey = jax.random.split(key)
+                cdf = jnp.cumsum(aprob)
+                action = jnp.minimum(jnp.searchsorted(cdf, jax.random.uniform(skey) * cdf[-1], side='right'), args.nact-1)
+                newstate, newvelocity, reward = nav_step(env, state, velocity, action, goal)
+
+                newparams, td = learn(params, reward, newstate, state, jax.nn.one_hot(action, args.nact), aprob, args.gamma, etas, b_sig_alp, clip_sig_alp, args.beta, args.bptype)
+                newparams = add_noise(newparams, nkey, args.noise, paramsindex)
+                newdone = (total + reward >= env.max_reward) | (t + 1 == env.tmax)
+                return (newparams, newstate, newvelocity, total + reward, t + 1, newdone), (state, action, reward, td, True)
+
+            def skip(carry):
+                return carry, (state, jnp.int32(0), jnp.zeros((), state.dtype), jnp.zeros((), state.dtype), False)
+
+            return lax.cond(done, skip, active, carry)
+
+        carry = (params, state, jnp.zeros_like(state), jnp.zeros((), state.dtype), jnp.int32(0), False)
+        (params, state, velocity, total, t, done), (states, actions, rewards, tds, taken) = lax.scan(step, carry, jax.random.split(key, args.tmax))
+        return params, state, total, states, actions, rewards, tds, taken
+
+    return online_trial
+
+def run_trial_online(online_trial, params, env, args, key):
+    # host side of an online episode: reset the env, run the scan, keep the steps taken and update env for plotting
+    state, goal, eucdist, done = env.reset()
+    goal = jnp.asarray(np.reshape(env.goal, -1), args.precision)
+    params, newstate, total, states, actions, rewards, tds, taken = online_trial(params, jnp.asarray(state, args.precision), goal, key)
+    # trimmed on the host, slicing the device arrays would compile for every episode length
+    newstate, total, states, actions, rewards, tds, taken = jax.device_get((newstate, total, states, actions, rewards, tds, taken))
+    T = int(np.sum(taken))
+    coords = np.concatenate([states[:T], newstate[None]])  # include new state, as in run_trial
+    env.total_reward = float(total)
+    env.track += list(states[:T])
+    return params, coords, rewards[:T], np.eye(args.nact, dtype=args.precision)[actions[:T]], T-1, np.sum(tds[:T]**2)
+
+
+def run_experiment(config=None, **kwargs):
+    args = get_config(config, **kwargs)
+    # jax_enable_x64 only for this run and thread, so later runs in the process keep their own precision
+    with enable_x64(args.precision == 'float64'):
+        return train(args)
+
+
+def train(args):
+    if args.compilecache:
+        configure_compile_cache(args.compilecache)
+
+    # env pararms
+    envsize = 1
+    maxspeed = 0.1
+    goalsize = args.rsz
+    train_episodes = args.episodes
+
+    etas = [args.llr, args.slr, args.alr, args.plr, args.clr]
+    betas = [0.5,args.balpha]  # beta for critic is 0.5
+    exptname = get_exptname(args)
+
+    if args.pcinit=='homo':
+        params = uniform_pc_weights(args.npc, args.nact, args.seed, sigma=args.sigma, alpha=args.alpha, envsize=envsize)
+    elif args.pcinit == 'hetero':
+        params = random_all_pc_weights(args.npc, args.nact, args.seed, sigma=args.sigma, alpha=args.alpha, envsize=envsize)
+    params = [jnp.asarray(p, args.precision) for p in params]
+
+    initparams = params.copy()
+    # one Generator per run for actions and start locations, independent of the global RNG
+    rng = np.random.default_rng(args.seed)
+    sampler = ActionSampler(rng)
+    key = jax.random.PRNGKey(args.seed)  # actions and noise of the online learner
+    # compile the update for the expected episode lengths before training, other lengths compile on first use
+    lengths = {'tmax': [args.tmax], 'all': range(1, args.tmax+1), 'none': []}[args.precompile] if args.learner == 'episode' else []
+    compiled, compile_s = precompile_update(params, lengths, 1, args.nact, etas, args.gamma, betas)
+    print(f'Compiled update_td_params for {len(compiled)} episode lengths in {compile_s:.2f}s')
+    if args.plot:
+        from utils import plot_place_cells, flatten
+        plot_place_cells(initparams, startcoord=args.startcoods, goalcoord=flatten([args.goalcoords[0]]),goalsize=goalsize, title='Fields before learning',envsize=envsize)
+
+    losses = []
+    latencys = []
+    allcoords = []
+    # columnar host history, filled from the device by the copier
+    logparams = ParamHistory(params, train_episodes*len(args.goalcoords)+1, args.storage or args.precision)
+    logparams.append(initparams)
+    copier = HostCopier(logparams)
+    allrewards = []
+
+    for goalcoord in args.goalcoords:
+        env = OneDimNav(startcoord=args.startcoods, goalcoord=[goalcoord], goalsize=goalsize, tmax=args.tmax,
+                        maxspeed=maxspeed,envsize=envsize, nact=args.nact, max_reward=args.rmax, rng=rng)
+        if args.learner == 'online':
+            online_trial = make_online_trial(env, args, etas)
+
+        for episode in range(train_episodes):
+
+            if args.learner == 'online':
+                key, episodekey = jax.random.split(key)
+                copier.sync()  # the last snapshot is on the host before its buffers are donated
+                params, coords, rewards, actions, latency, loss = run_trial_online(online_trial, params, env, args, episodekey)
+            else:
+                # the copy of the last snapshot overlaps the episode
+                coords, rewards, actions, latency = run_trial(params, env, args, sampler)
+
+                update = compiled.get(len(rewards), update_td_params)
+                copier.sync()
+                params, grads, loss = update(params, coords, actions, rewards, etas, args.gamma, betas)
+
+            allcoords.append(np.array(coords))  # a copy, not a view of the device buffer
+            copier.put(params)
+            latencys.append(latency)
+            losses.append(loss)  # read from the device after training
+            allrewards.append(np.ravel(env.total_reward)[0])
+
+            print(f'Trial {episode+1}, G {allrewards[-1]:.3f}, t {latency}')
+
+    copier.close()
+    losses = [float(loss) for loss in jax.device_get(losses)]
+    result = RunResult(exptname, args, params, logparams, allcoords, allrewards, latencys, losses, env=env, compile={'cache': args.compilecache, 'lengths': len(compiled), 'seconds': compile_s})
+
+    if args.analysis == 'full':
+        from utils import saveload
+        saveload(args.datadir+'full_'+exptname, [logparams.tolist(), allrewards, allcoords], 'save')
+
+    if args.plot:
+        from utils import plot_analysis
+        env.plot_trajectory()
+        plot_analysis(logparams, allrewards, allcoords, train_episodes//2, exptname=exptname, rsz=goalsize)
+
+    return result
@@ -1,4 +1,5 @@
 
+from functools import partial
 import jax.numpy as jnp
 from jax import grad, jit, vmap, random, nn, lax, value_and_grad
 import numpy as np
@@ -55,7 +56,7 @@ def compute_probas_and_values(params, coord):
     pcact = predict_placecell(params, coord)
     aprob = predict_action_prob(params, pcact)
     value = predict_value(params, pcact)
-    return aprob.astype(jnp.float16), value.astype(jnp.float16)
+    return aprob, value  # in the dtype of params, see --precision
 
 vmap_prob_val = vmap(compute_probas_and_values, in_axes=(None, 0))
 
@@ -70,7 +71,7 @@ def td_loss(params, coords, actions, rewards, gamma, betas):
     tot_loss = actor_loss + betas[0] * critic_loss + betas[1] * alpha_reg
     return tot_loss
 
-@jit
+@partial(jit, donate_argnums=0)  # params buffers are reused for the new params
 def update_td_params(params, coords, actions, rewards, etas, gamma, betas):
     loss, grads = value_and_grad(td_loss)(params, coords,actions, rewards, gamma, betas)
     pc_centers, pc_sigmas, pc_constant, actor_weights,critic_weights = params
@@ -85,12 +86,101 @@ def update_td_params(params, coords, actions, rewards, etas, gamma, betas):
     newcritic_weights = critic_weights + critic_eta * dcri  # gradient descent
     return [newpc_centers, newpc_sigma,newpc_const, newactor_weights,newcritic_weights], grads, loss
 
+def td_step_objective(params, state, onehotg, td, beta=1):
+    # surrogate of one transition whose gradient is the online update for bptype 'both': td * (V(s) + log pi(a|s))
+    pcact = predict_placecell(params, state)
+    logprob = nn.log_softmax(beta * jnp.matmul(pcact, params[3]))
+    return td * (predict_value(params, pcact)[0] + jnp.sum(onehotg * logprob))
+
+def learn(params, reward, newstate,state, onehotg,aprob, gamma, etas,b_sig_alp=[0.0,0.0],clip_sig_alp=[0,0], beta=1, bptype='both'):
+    # per step TD update of numpy/1D learn as a pure function for jit and lax.scan, noise is added by add_noise.
+    # bptype 'autodiff' takes the gradients of td_step_objective with jax.grad instead of the derived ones. These
+    # equal those of 'both' without b_sig_alp. The L2 penalties differ: autodiff applies them as plain weight
+    # decay, -2*b*sigma and -2*b*alpha. The derived update, like numpy/1D, scales the sigma penalty by
+    # post_td * pcact and broadcasts the alpha penalty of the first field to every field
+    pcact = predict_placecell(params, state)
+    newpcact = predict_placecell(params, newstate)
+    td = (reward + gamma * predict_value(params, newpcact) - predict_value(params, pcact))[0]  # TD error
+
+    if bptype == 'autodiff':
+        grads = grad(td_step_objective)(params, state, onehotg, lax.stop_gradient(td), beta)
+        # L2 penalties on sigma and alpha as plain weight decay
+        grads[1] = grads[1] - b_sig_alp[0] * 2*params[1]
+        grads[2] = grads[2] - b_sig_alp[1] * 2*params[2]
+    else:
+        # get critic grads
+        dcri = pcact[:,None] * td
+
+        # get actor grads
+        if bptype == 'actg':
+            decay = beta * (onehotg[:,None])  # from Foster et al. 2000, simplified form of the derivative
+        else:
+            decay = beta * (onehotg[:,None]- aprob[:,None])  # derived from softmax grads
+        dact = (pcact[:,None] @ decay.T) * td
+
+        # TD error backpropagated through actor/critic
+        if bptype == 'both':
+            post_td = (params[3] @ decay + params[4]) * td
+        elif bptype == 'cri':
+            post_td = params[4] * td
+        elif bptype in ['act', 'actg']:
+            post_td = (params[3] @ decay) * td
+        elif bptype == 'none':
+            post_td = td
+
+        l2_grad_alpha = b_sig_alp[1] * 2*params[2]
+        l2_grad_sigma = b_sig_alp[0] * 2*params[1]
+
+        dpcc = (post_td * (pcact[:,None]) * ((state - params[0])/params[1]**2)[:,None])[:,0]
+        dpcs = (post_td * (pcact[:,None]) * (((state - params[0])**2/params[1]**3) - l2_grad_sigma)[:,None])[:,0]
+        dpca = (post_td * (pcact[:,None]) * ((2 / params[2][:,None])) - l2_grad_alpha)[:,0]
+        grads = [dpcc, dpcs, dpca, dact, dcri]
+
+    # update weights by gradient ascent
+    params = [p + eta * g for p, eta, g in zip(params, etas, grads)]
+
+    # clip large fields, sigma and alpha are kept above 1e-5
+    if clip_sig_alp[0] > 0:
+        params[1] = jnp.clip(params[1], 1e-5, clip_sig_alp[0])
+    if clip_sig_alp[1] > 0:
+        params[2] = jnp.clip(params[2], 1e-5, clip_sig_alp[1])
+    return params, td
+
+def add_noise(params, key, noise, paramsindex):
+    # Gaussian noise on the params in paramsindex, one key per step
+    params = list(params)
+    for p, k in zip(paramsindex, random.split(key, len(paramsindex))):
+        params[p] = params[p] + noise * random.normal(k, params[p].shape, params[p].dtype)
+    return params
+
 def get_onehot_action(prob, nact=3):
     A = np.random.choice(a=np.arange(nact), p=np.array(prob))
     onehotg = np.zeros(nact)
     onehotg[A] = 1
     return onehotg
 
+def get_onehot(action, nact):
+    onehotg = np.zeros(nact)
+    onehotg[action] = 1
+    return onehotg
+
+class ActionSampler:
+    # categorical action sampling by inverse CDF over blocks of uniforms drawn from a numpy Generator,
+    # returns integer action indices
+    def __init__(self, rng=None, block=4096):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.uniforms = self.rng.random(block)
+        self.i = 0
+
+    def sample(self, prob):
+        if self.i == len(self.uniforms):
+            self.rng.random(out=self.uniforms)
+            self.i = 0
+        u = self.uniforms[self.i]
+        self.i += 1
+        cdf = np.asarray(prob).cumsum()
+        return min(int(cdf.searchsorted(u * cdf[-1], side='right')), len(cdf)-1)
+
 def get_discounted_rewards(rewards, gamma=0.9, norm=False):
     discounted_rewards = []
     cumulative = 0
@@ -1,10 +1,10 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 class NDimNav:
-    def __init__(self,nact=4,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=300, goalcoord=[0.8,0.8], startcoord=[[-0.8,-0.8]], max_reward=5, obstacles=True, obscoord=[-0.2,0.2,-1,0.5],rtype='gauss') -> None:
+    def __init__(self,nact=4,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=300, goalcoord=[0.8,0.8], startcoord=[[-0.8,-0.8]], max_reward=5, obstacles=True, obscoord=[-0.2,0.2,-1,0.5],rtype='gauss', rng=None) -> None:
         self.tmax = tmax  # maximum steps per trial
+        self.rng = np.random if rng is None else rng  # numpy Generator, the global numpy RNG by default
         self.minsize = -envsize  # arena size
         self.maxsize = envsize
         self.state = np.zeros(2)
@@ -38,13 +38,15 @@ class NDimNav:
         return rx * (rx>threshold)
     
     def action2velocity(self, g):
-        # convert onehot action vector from actor to velocity
+        # convert onehot action vector or action index from actor to velocity
+        if np.ndim(g) == 0:
+            return self.onehot2dirmat[g]
         return np.matmul(g, self.onehot2dirmat)
 
     
     def reset(self):
         if len(self.starts) > 1:
-            startidx = np.random.choice(np.arange(len(self.starts)),1)
+            startidx = self.rng.choice(np.arange(len(self.starts)),1)
             self.state = self.starts[startidx].copy()[0]
         else:
             self.state = self.starts.copy()
@@ -111,6 +113,7 @@ class NDimNav:
         return self.state, self.reward, self.done
 
     def plot_trajectory(self, title=None):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(3,2))
         plt.title(f'2D {title}')
         plt.axis([self.minsize, self.maxsize, self.minsize, self.maxsize])
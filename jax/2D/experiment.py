@@ -0,0 +1,248 @@
+# Copyright (c) 2024 M Ganesh Kumar
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+# importable version of main.py: run_experiment(config) trains one agent and returns a RunResult.
+# Training only needs jax, numpy, env and model. utils (matplotlib, scipy) is imported when the
+# run saves or plots, so that sweep workers start quickly.
+
+import os
+os.environ.setdefault("XLA_PYTHON_CLIENT_MEM_FRACTION", "0.2")
+import time
+import argparse
+from copy import deepcopy
+from dataclasses import dataclass
+import jax.numpy as jnp
+import numpy as np
+import jax
+from jax import config
+from jax.experimental import enable_x64
+config.update('jax_platform_name', 'cpu')  # need to fix 2D to use GPU
+from env import NDimNav
+from history import ParamHistory, HostCopier
+from model import uniform_2D_pc_weights, random_all_pc_weights, predict_placecell, predict_action_prob, ActionSampler, get_onehot, update_td_params
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--episodes', type=int, required=False, help='episodes', default=5000)
+    parser.add_argument('--tmax', type=int, required=False, help='tmax', default=600)
+    parser.add_argument('--obs', type=bool, required=False, help='obs', default=True)
+    parser.add_argument('--startcoords', type=float,nargs='+', required=False, help='startcoods', default=[[-0.75,-0.75],[0.0,0.75]])
+    parser.add_argument('--goalcoords', type=float,nargs='+', required=False, help='goalcoords', default=[[0.75,-0.75]])
+    parser.add_argument('--obscoords', type=float,nargs='+', required=False, help='obscoords', default=[[-0.2,0.2,-1,0.5]])
+    parser.add_argument('--rsz', type=float, required=False, help='rsz', default=0.1)
+    parser.add_argument('--rmax', type=int, required=False, help='rmax', default=5)
+
+    parser.add_argument('--seed', type=int, required=False, help='seed', default=0)
+    parser.add_argument('--pcinit', type=str, required=False, help='pcinit', default='homo')
+    parser.add_argument('--npc', type=int, required=False, help='npc', default=16)
+    parser.add_argument('--alpha', type=float, required=False, help='alpha', default=1)
+    parser.add_argument('--sigma', type=float, required=False, help='sigma', default=0.05)
+
+    parser.add_argument('--plr', type=float, required=False, help='plr', default=0.01)
+    parser.add_argument('--clr', type=float, required=False, help='clr', default=0.01)
+    parser.add_argument('--llr', type=float, required=False, help='llr', default=0.0001) 
+    parser.add_argument('--alr', type=float, required=False, help='alr', default=0.0001) 
+    parser.add_argument('--slr', type=float, required=False, help='slr', default=0.0001)
+    parser.add_argument('--gamma', type=float, required=False, help='gamma', default=0.95)
+    parser.add_argument('--nact', type=int, required=False, help='nact', default=4)
+    parser.add_argument('--beta', type=float, required=False, help='beta', default=1)
+
+    parser.add_argument('--balpha', type=float, required=False, help='balpha', default=0.0)
+    parser.add_argument('--paramsindex', type=int,nargs='+', required=False, help='paramsindex', default=[0,1,2])
+    parser.add_argument('--noise', type=float, required=False, help='noise', default=0.000)
+
+    parser.add_argument('--precision', type=str, required=False, help='dtype of params, activations and trajectories: float32 or float64 (enables jax_enable_x64)', default='float32')
+    parser.add_argument('--storage', type=str, required=False, help='dtype of the logparams history: float32, float64 or bfloat16 (emulated), default precision', default='')
+    parser.add_argument('--compilecache', type=str, required=False, help='directory of the persistent compilation cache, shared across runs', default='')
+    parser.add_argument('--precompile', type=str, required=False, help='episode lengths to compile update_td_params for before training: tmax, all or none', default='tmax')
+    parser.add_argument('--analysis', type=str, required=False, help='analysis', default='na')
+    parser.add_argument('--datadir', type=str, required=False, help='datadir', default='./data/')
+    parser.add_argument('--figdir', type=str, required=False, help='figdir', default='./fig/')
+    parser.add_argument('--plot', type=int, required=False, help='1 to plot the analysis figure', default=1)
+    return parser
+
+def get_config(config=None, **kwargs):
+    # defaults of main.py updated by config (argparse Namespace or dict) and keyword arguments
+    args = get_parser().parse_args([])
+    if config is not None:
+        vars(args).update(config if isinstance(config, dict) else vars(config))
+    vars(args).update(kwargs)
+    return args
+
+def configure_compile_cache(cachedir):
+    # persistent on disk cache of compiled programs, so that later processes load update_td_params instead of
+    # compiling it. jax 0.4 only caches CPU programs built with the XLA runtime, and XLA_FLAGS is read when the
+    # backend starts, i.e. at the first jax operation of the process
+    if '--xla_cpu_use_xla_runtime' not in os.environ.get('XLA_FLAGS', ''):
+        os.environ['XLA_FLAGS'] = (os.environ.get('XLA_FLAGS', '') + ' --xla_cpu_use_xla_runtime=true').strip()
+    config.update('jax_compilation_cache_dir', cachedir)
+    config.update('jax_persistent_cache_min_compile_time_secs', 0)
+
+def precompile_update(params, lengths, dim, nact, etas, gamma, betas):
+    # ahead of time lowering and compilation of update_td_params for episodes of the given lengths,
+    # returns the executables by episode length and the seconds spent
+    start = time.time()
+    compiled = {}
+    for T in lengths:
+        coords = jax.ShapeDtypeStruct((T+1, dim), params[0].dtype)
+        actions = jax.ShapeDtypeStruct((T, nact), params[0].dtype)
+        rewards = jax.ShapeDtypeStruct((T,), params[0].dtype)
+        compiled[T] = update_td_params.lower(params, coords, actions, rewards, etas, gamma, betas).compile()
+    return compiled, time.time() - start
+
+def get_exptname(args):
+    piname = ''.join(map(str, args.paramsindex))
+    exptname = f'2D_td_{args.noise}ns_{piname}p_{args.npc**2}n_{args.plr}plr_{args.clr}clr_{args.llr}llr_{args.alr}alr_{args.slr}slr_{args.pcinit}_{args.nact}a_{args.seed}s_{args.episodes}e_{args.rmax}rmax_{args.rsz}rsz'
+    if args.precision != 'float32':
+        exptname += f'_{args.precision}'
+    return exptname
+
+
+@dataclass
+class RunResult:
+    exptname: str
+    args: argparse.Namespace
+    params: list  # fields and weights after training
+    logparams: list  # per episode snapshots
+    allcoords: list
+    allrewards: list
+    latencys: list
+    losses: list
+    env: NDimNav = None
+    compile: dict = None  # precompiled episode lengths and compile seconds
+
+
+# inner loop training loop
+def run_trial(params, env, args, sampler):
+    coords = []
+    actions = []
+    rewards = []
+
+    state, goal, eucdist, done = env.reset()
+    totR = 0
+
+    for t in range(args.tmax):
+
+        pcact = predict_placecell(params, state)
+
+        aprob = predict_action_prob(params, pcact)
+
+        action = sampler.sample(aprob)
+
+        newstate, reward, done = env.step(action)
+
+        coords.append(state)
+        actions.append(get_onehot(action, args.nact))  # td_loss takes onehot actions
+        rewards.append(reward)
+
+        state = newstate.copy()
+
+        totR += reward
+
+        if done:
+            coords.append(newstate)  # include new state for value computation
+            break
+
+    return jnp.array(coords, args.precision), jnp.array(rewards, args.precision).reshape(-1), jnp.array(actions, args.precision), t
+
+
+def run_experiment(config=None, **kwargs):
+    args = get_config(config, **kwargs)
+    # jax_enable_x64 only for this run and thread, so later runs in the process keep their own precision
+    with enable_x64(args.precision == 'float64'):
+        return train(args)
+
+
+def train(args):
+    if args.compilecache:
+        configure_compile_cache(args.compilecache)
+
+    # env pararms
+    envsize = 1
+    maxspeed = 0.1
+    goalsize = args.rsz
+    train_episodes = args.episodes
+    npc = args.npc**2
+
+    etas = [args.llr, args.slr, args.alr, args.plr, args.clr]
+    betas = [0.5,args.balpha]
+    exptname = get_exptname(args)
+    print(exptname)
+
+    if args.pcinit=='homo':
+        params = uniform_2D_pc_weights(npc, args.nact, args.seed, sigma=args.sigma, alpha=args.alpha, envsize=envsize)
+    elif args.pcinit == 'hetero':
+        params = random_all_pc_weights(npc, args.nact, args.seed, sigma=args.sigma, alpha=args.alpha, envsize=envsize)
+    params = [jnp.asarray(p, args.precision) for p in params]
+
+    initparams = deepcopy(params)
+    # one Generator per run for actions and start locations, independent of the global RNG
+    rng = np.random.default_rng(args.seed)
+    sampler = ActionSampler(rng)
+    # compile the update for the expected episode lengths before training, other lengths compile on first use
+    lengths = {'tmax': [args.tmax], 'all': range(1, args.tmax+1), 'none': []}[args.precompile]
+    compiled, compile_s = precompile_update(params, lengths, 2, args.nact, etas, args.gamma, betas)
+    print(f'Compiled update_td_params for {len(compiled)} episode lengths in {compile_s:.2f}s')
+    if args.plot:
+        from utils import plot_all_pc
+        plot_all_pc([initparams],0)
+
+    losses = []
+    latencys = []
+    allcoords = []
+    # columnar host history, filled from the device by the copier
+    logparams = ParamHistory(params, train_episodes*len(args.goalcoords)*len(args.obscoords)+1, args.storage or args.precision)
+    logparams.append(initparams)
+    copier = HostCopier(logparams)
+    allrewards = []
+
+    for goalcoord in args.goalcoords:
+
+        for obscoord in args.obscoords:
+            env = NDimNav(startcoord=args.startcoords, goalcoord=goalcoord, goalsize=goalsize, tmax=args.tmax,
+                            maxspeed=maxspeed,envsize=envsize, nact=args.nact, max_reward=args.rmax, obstacles=args.obs, obscoord=obscoord, rng=rng)
+
+            for episode in range(train_episodes):
+
+                coords, rewards, actions, latency = run_trial(params, env, args, sampler)
+
+                copier.sync()  # the last snapshot is on the host before its buffers are donated
+                update = compiled.get(len(rewards), update_td_params)
+                params, grads, loss = update(params, coords, actions, rewards, etas, args.gamma, betas)
+
+                allcoords.append(np.array(coords))  # a copy, not a view of the device buffer
+                copier.put(params)
+                latencys.append(latency)
+                losses.append(float(loss))
+                allrewards.append(env.total_reward)
+
+                print(f'Start {env.track[1]}, Trial {episode+1}, G {env.total_reward:.3f}, t {latency}')
+
+    copier.close()
+    result = RunResult(exptname, args, params, logparams, allcoords, allrewards, latencys, losses, env=env, compile={'cache': args.compilecache, 'lengths': len(compiled), 'seconds': compile_s})
+
+    if args.analysis == 'full':
+        from utils import saveload
+        saveload(args.datadir+exptname, [logparams.tolist(), allrewards, allcoords], 'save')
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        from utils import plot_all_pc, plot_analysis
+        env.plot_trajectory()
+        plot_all_pc(logparams,-1)
+        f,score, drift = plot_analysis(logparams, latencys,allrewards, allcoords, train_episodes//2, exptname=exptname, rsz=goalsize)
+
+        trials = [0,train_episodes//4, train_episodes]
+        f,ax = plt.subplots(1,len(trials),figsize=(3*len(trials),2*1))
+
+        for t,trial in enumerate(trials):
+            xy = logparams[trial][0]
+            ax[t].scatter(xy[:,0], xy[:,1],s=2,color='k')
+            ax[t].set_aspect('equal')
+            ax[t].set_title(f'COM $T={trial}$')
+        f.tight_layout()
+
+    return result
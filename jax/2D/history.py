@@ -0,0 +1,101 @@
+import queue
+import threading
+import numpy as np
+
+# host side parameter history of the JAX trainers. ParamHistory keeps one preallocated numpy column per parameter,
+# [snapshots, *shape], and indexes like the list of params it replaces. HostCopier drains device snapshots into it
+# on a background thread, so that no per episode device buffers are kept alive. Columns are kept in dtype, by default
+# that of the params, with bfloat16 emulated as the upper 16 bits of float32.
+
+
+def to_bfloat16(x):
+    # float32 rounded to nearest even at 8 mantissa bits, as the upper 16 bits. For finite values
+    bits = np.ascontiguousarray(x, dtype=np.float32).view(np.uint32)
+    return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+
+
+def from_bfloat16(x):
+    return (x.astype(np.uint32) << 16).view(np.float32)
+
+
+class ParamHistory:
+    def __init__(self, params, total, dtype=None):
+        self.bfloat16 = dtype == 'bfloat16'
+        dtype = np.uint16 if self.bfloat16 else dtype
+        self.columns = [np.empty((total,)+np.shape(p), dtype=dtype or np.result_type(p)) for p in params]
+        self.length = 0
+
+    def append(self, params):
+        if self.length == len(self.columns[0]):  # more snapshots than expected, double the columns
+            self.columns = [np.concatenate([column, np.empty_like(column)]) for column in self.columns]
+        for column, p in zip(self.columns, params):
+            column[self.length] = to_bfloat16(p) if self.bfloat16 else np.asarray(p)
+        self.length += 1
+
+    @property
+    def nbytes(self):
+        return sum(column[:self.length].nbytes for column in self.columns)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(f'params index {i} out of range')
+        if self.bfloat16:
+            return [from_bfloat16(column[i]) for column in self.columns]
+        return [column[i] for column in self.columns]
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self[i]
+
+    def tolist(self):
+        # plain list of params for saving
+        return list(self)
+
+
+class HostCopier:
+    # double buffered device to host copy of params. put() starts the asynchronous transfer of a snapshot and
+    # returns, the thread waits for it and appends it to history. sync() waits until every snapshot is on the host
+    # and has to be called before their buffers are donated, so the device holds the current params and at most
+    # the one being copied. Up to depth snapshots are in flight, put blocks beyond that.
+    def __init__(self, history, depth=2):
+        self.history = history
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def put(self, params):
+        for p in params:
+            if hasattr(p, 'copy_to_host_async'):
+                p.copy_to_host_async()
+        self.queue.put(params)
+
+    def drain(self):
+        while True:
+            params = self.queue.get()
+            try:
+                if params is None:
+                    return
+                self.history.append(params)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def sync(self):
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
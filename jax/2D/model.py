@@ -1,9 +1,8 @@
 
+from functools import partial
 import jax.numpy as jnp
 from jax import grad, jit, vmap, random, nn, lax,value_and_grad, lax
 import numpy as np
-from scipy import stats
-import matplotlib.pyplot as plt
 
 def invert_matrices(tensor):
     """ Compute the inverse for each 2x2 matrix in an N x 2 x 2 tensor efficiently using vectorized operations. """
@@ -80,11 +79,33 @@ def get_onehot_action(prob, nact=4):
     onehotg[A] = 1
     return onehotg
 
+def get_onehot(action, nact):
+    onehotg = np.zeros(nact)
+    onehotg[action] = 1
+    return onehotg
+
+class ActionSampler:
+    # categorical action sampling by inverse CDF over blocks of uniforms drawn from a numpy Generator,
+    # returns integer action indices
+    def __init__(self, rng=None, block=4096):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.uniforms = self.rng.random(block)
+        self.i = 0
+
+    def sample(self, prob):
+        if self.i == len(self.uniforms):
+            self.rng.random(out=self.uniforms)
+            self.i = 0
+        u = self.uniforms[self.i]
+        self.i += 1
+        cdf = np.asarray(prob).cumsum()
+        return min(int(cdf.searchsorted(u * cdf[-1], side='right')), len(cdf)-1)
+
 def compute_probas_and_values(params, coord):
     pcact = predict_placecell(params, coord)
     aprob = predict_action_prob(params, pcact)
     value = predict_value(params, pcact)
-    return aprob.astype(jnp.float16), value.astype(jnp.float16)
+    return aprob, value  # in the dtype of params, see --precision
 
 vmap_prob_val = vmap(compute_probas_and_values, in_axes=(None, 0))
 
@@ -102,7 +123,7 @@ def td_loss(params, coords, actions, rewards, gamma, betas):
     tot_loss = actor_loss + 0.5 * critic_loss + betas[1] * alpha_reg
     return tot_loss
 
-@jit
+@partial(jit, donate_argnums=0)  # params buffers are reused for the new params
 def update_td_params(params, coords, actions, rewards, etas, gamma, betas):
     loss, grads = value_and_grad(td_loss)(params, coords,actions, rewards, gamma, betas)
     pc_centers, pc_sigmas, pc_constant, actor_weights,critic_weights = params
@@ -116,9 +137,10 @@ def update_td_params(params, coords, actions, rewards, etas, gamma, betas):
     newactor_weights = actor_weights + actor_eta * dact
     newcritic_weights = critic_weights + critic_eta * dcri  # gradient descent
     
-    # clip large fields
-    # newpc_const = jnp.clip(newpc_const, 1e-5,2)
-    # newpc_sigma = correct_covariance_matrices(newpc_sigma,1e-5, 0.5)
+    # project the updated params, on device so params stay there between episodes: amplitudes are clipped to
+    # [1e-5, 2] and covariances projected by correct_covariance_matrices, so the update is not the plain gradient step
+    newpc_const = jnp.clip(newpc_const, 1e-5,2)
+    newpc_sigma = correct_covariance_matrices(newpc_sigma,1e-5, 0.5)
     return [newpc_centers, newpc_sigma,newpc_const, newactor_weights,newcritic_weights], grads, loss
 
 def compute_reward_prediction_error(rewards, values, gamma=0.9):
@@ -173,36 +195,23 @@ def correct_covariance_matrices_(matrices, min_val=1e-5, max_val=0.5):
     return matrices
 
 def correct_covariance_matrices(matrices, min_val=1e-5, max_val=0.5):
-    """ Correct each 2x2 covariance matrix in an N x 2 x 2 array using JAX operations. """
+    """ Correct each 2x2 covariance matrix in an N x 2 x 2 array using JAX operations, branch free so it traces under jit. """
     # Ensure each matrix is symmetric
     matrices = (matrices + jnp.transpose(matrices, axes=(0, 2, 1))) / 2
 
-    # Clip diagonal elements to be within min_val and max_val
-    matrices = matrices.at[:, 0, 0].set(jnp.clip(matrices[:, 0, 0], min_val, max_val))
-    matrices = matrices.at[:, 1, 1].set(jnp.clip(matrices[:, 1, 1], min_val, max_val))
-
-    # Clip off-diagonal elements to be within -max_val and max_val
-    matrices = matrices.at[:, 0, 1].set(jnp.clip(matrices[:, 0, 1], -max_val, max_val))
-    matrices = matrices.at[:, 1, 0].set(jnp.clip(matrices[:, 1, 0], -max_val, max_val))
-    
-    # Ensure positive definiteness by adjusting the off-diagonal elements
-    det = matrices[:, 0, 0] * matrices[:, 1, 1] - matrices[:, 0, 1] ** 2
-    adjustment_needed = det <= 0
-
-    # Use jax.numpy functionality to adjust the matrices where needed
-    matrices = vmap(adjust_matrix)(matrices, adjustment_needed, min_val, max_val)
-
-    return matrices
-
-def adjust_matrix(m, is_adjustment_needed, min_val=1e-5, max_val=0.5):
-    if is_adjustment_needed:
-        max_off_diag = jnp.sqrt(m[0, 0] * m[1, 1]) - min_val
-        max_off_diag = jnp.clip(max_off_diag, -max_val, max_val)
-        new_off_diag = jnp.sign(m[0, 1]) * jnp.minimum(max_off_diag, jnp.abs(m[0, 1]))
-        return m.at[0, 1].set(new_off_diag).at[1, 0].set(new_off_diag)
-    return m
+    # Clip diagonal elements to be within min_val and max_val, and the off-diagonal to be within -max_val and max_val
+    s00 = jnp.clip(matrices[:, 0, 0], min_val, max_val)
+    s11 = jnp.clip(matrices[:, 1, 1], min_val, max_val)
+    s01 = jnp.clip(matrices[:, 0, 1], -max_val, max_val)
 
+    # Ensure positive definiteness by shrinking the off-diagonal elements where the determinant is not positive.
+    # det <= 0 is tested as |s01| >= sqrt(s00 s11), since XLA fuses s00 s11 - s01**2 into an fma under jit,
+    # which leaves singular matrices with a determinant of either sign
+    root = jnp.sqrt(s00 * s11)
+    max_off_diag = jnp.clip(root - min_val, -max_val, max_val)
+    s01 = jnp.where(jnp.abs(s01) >= root, jnp.sign(s01) * jnp.minimum(max_off_diag, jnp.abs(s01)), s01)
 
+    return jnp.stack([jnp.stack([s00, s01], axis=-1), jnp.stack([s01, s11], axis=-1)], axis=-2)
 
 def correct_covariance_matrices_np(matrices, min_val=1e-5, max_val=0.5):
     # Check and correct each 2x2 covariance matrix in an N x 2 x 2 array to correctly compute gradients for update. 
@@ -5,7 +5,7 @@ from model import *
 from utils import *
 from sr_utils import *
 import numpy as np
-from copy import deepcopy
+from store import SnapshotStore
 
 # training params
 train_episodes = 50000
@@ -28,6 +28,10 @@ nact = 2
 lr = 0.0025  # lr for successor fields 
 gamma = 0.9 # gamma for successor fields 
 seed = 1
+offline = True  # learn SR from the trajectories recorded during training instead of re-simulating each episode
+warmstart = False  # start TD from the closed form SR of the final policy instead of the identity
+srsnapshots = 'log:1000'  # SR snapshot policy between the analysed trials, all, every:k or log:n
+srcodec = 'none'  # compression of U-I: none, delta (sparse changes, best with all or every:k) or lowrank:r, kept in float32
 
 exptname = f"full_1D_td_online_both_0.0ns_012p_{npc}n_0.01plr_0.01clr_0.0llr_0.0alr_0.0slr_homo_0.5a_0.1s_2a_{seed}s_50000e_5rmax_0.05rsz"
 [logparams, allrewards, allcoords] = saveload(f"./data/{exptname}",1,"load")
@@ -72,22 +76,37 @@ def run_trial(params, env, U):
 xs = np.linspace(-1,1,1001)
 ca3 = predict_batch_placecell(logparams[0], xs)
 
-Us = []
-ca1s = []
-U = np.eye(npc)
-Us.append(deepcopy(U))
-env = OneDimNav(startcoord=startcoord, goalcoord=goalcoord, goalsize=goalsize, tmax=tmax, 
-                maxspeed=maxspeed,envsize=envsize, nact=nact, max_reward=max_reward)
+if warmstart:
+    env = OneDimNav(startcoord=startcoord, goalcoord=goalcoord, goalsize=goalsize, tmax=tmax, 
+                    maxspeed=maxspeed,envsize=envsize, nact=nact, max_reward=max_reward)
+    U0, ca1_ref, xs_ref = solve_sr(logparams[train_episodes-1], env, gamma)
+else:
+    U0 = np.eye(npc)
 
-for episode in range(train_episodes):
+# trials the figures below read from Us, with the gap episodes before each, kept under any srsnapshots policy
+gap = 50
+trials = np.linspace(gap, train_episodes, dtype=int, num=51)
+srtrials = [gap, train_episodes//10, train_episodes] + [trial-g for trial in trials for g in range(gap+1)]
+Us = SnapshotStore('Us', srsnapshots, train_episodes+1, dtype=np.float32, base=np.eye(npc), codec=srcodec, keep=srtrials)
+if offline:
+    U, Us = learn_sr_offline(logparams, allcoords[:train_episodes], lr, gamma, U=U0, store=Us)
+    print(f'Trial {train_episodes}, U {np.max(U)}')
+else:
+    ca1s = []
+    U = U0.copy()
+    Us.append(U)
+    env = OneDimNav(startcoord=startcoord, goalcoord=goalcoord, goalsize=goalsize, tmax=tmax, 
+                    maxspeed=maxspeed,envsize=envsize, nact=nact, max_reward=max_reward)
+
+    for episode in range(train_episodes):
 
-    params = logparams[episode]
+        params = logparams[episode]
 
-    U = run_trial(params, env,U)
+        U = run_trial(params, env,U)
 
-    Us.append(deepcopy(U))
+        Us.append(U)
 
-    print(f'Trial {episode+1}, U {np.max(Us[-1])}')
+        print(f'Trial {episode+1}, U {np.max(U)}')
 
 
 saveload(f'./data/sr_data/sr_{lr}_{exptname}',[Us, ca3], 'save')
@@ -99,7 +118,6 @@ saveload(f'./data/sr_data/sr_{lr}_{exptname}',[Us, ca3], 'save')
 
 #%%
 # plot field area, COM shift and examples
-gap = 50
 f,axs = plt.subplots(2,3,figsize=(12,6))
 
 plot_frequency(allcoords, [gap, train_episodes//10, train_episodes], ax=axs[0,0], gap=gap)
@@ -111,30 +129,30 @@ plot_density(logparams, [gap, train_episodes//10, train_episodes], ax=axs[0,2])
 axs[0,2].set_title('Density learnd using RL')
 
 
-fxs, dxs, Rs = plot_fxdx_trials(allcoords, logparams,np.linspace(gap, train_episodes,dtype=int, num=51), ax=axs[1,0], gap=gap)
+fxs, dxs, Rs = plot_fxdx_trials(allcoords, logparams,trials, ax=axs[1,0], gap=gap)
 axs[1,0].set_title('f(x):d(x) correlation with learning')
 print(Rs)
 
-fxs, dxs, Rs = plot_sr_fxdx_trials_kde(allcoords, Us,logparams, np.linspace(gap, train_episodes,dtype=int, num=51), gap=gap, ax=axs[1,0])
+fxs, dxs, Rs = plot_sr_fxdx_trials_kde(allcoords, Us,logparams, trials, gap=gap, ax=axs[1,0])
 print(Rs)
 
 
-plot_field_area(logparams, np.linspace(gap, train_episodes, num=51, dtype=int), ax=axs[1,1])
+plot_field_area(logparams, trials, ax=axs[1,1])
 axs[1,1].set_title('Field area increase with learning')
 axs[1,1].plot([],[],label='RM', color='tab:blue')
 axs[1,1].plot([],[],label='SR',color='tab:orange')
 axs[1,1].legend(frameon=False, loc='best')
 
-areas = plot_sr_field_area(Us, ca3, np.linspace(gap, train_episodes, num=51, dtype=int),ax=axs[1,1].twinx())
+areas = plot_sr_field_area(Us, ca3, trials,ax=axs[1,1].twinx())
 
 # change in field location
-plot_field_center(logparams, np.linspace(gap, train_episodes, num=51, dtype=int), ax=axs[1,2])
+plot_field_center(logparams, trials, ax=axs[1,2])
 axs[1,2].set_title('Fields shift backward with learning')
 axs[1,2].plot([],[],label='RM',color='tab:blue')
 axs[1,2].plot([],[],label='SR', color='tab:orange')
 axs[1,2].legend(frameon=False, loc='best')
 
-plot_sr_center(Us,ca3, np.linspace(gap, train_episodes, num=51, dtype=int),ax=axs[1,2].twinx())
+plot_sr_center(Us,ca3, trials,ax=axs[1,2].twinx())
 
 f.tight_layout()
 
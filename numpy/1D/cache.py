@@ -0,0 +1,120 @@
+import os
+import pickle
+import hashlib
+import inspect
+import functools
+import numpy as np
+
+# arguments holding run data. They are identified by the run name instead of being hashed when run= is given
+DATA_ARGS = ('logparams', 'params', 'param', 'allcoords', 'allrewards', 'latencys', 'Us', 'ca3')
+# modules next to the analysis function that analyses call into, part of the code version
+DEPENDENCIES = ('model.py', 'env.py', 'utils.py', 'metrics.py', 'sr_utils.py')
+
+
+def get_keyrepr(x):
+    # stable, hashable description of an argument
+    if isinstance(x, np.ndarray):
+        return ('nd', str(x.dtype), x.shape, hashlib.sha1(np.ascontiguousarray(x).tobytes()).hexdigest())
+    if isinstance(x, (list, tuple)):
+        return tuple(get_keyrepr(v) for v in x)
+    if isinstance(x, dict):
+        return tuple((k, get_keyrepr(x[k])) for k in sorted(x))
+    if isinstance(x, np.generic):
+        return x.item()
+    if hasattr(x, '__getitem__') and hasattr(x, '__len__') and not isinstance(x, str):
+        return tuple(get_keyrepr(x[i]) for i in range(len(x)))
+    return repr(x)
+
+
+def get_code_version(func, dependencies=DEPENDENCIES):
+    # any change to the file that defines the analysis function, or to the modules next to it that it may call,
+    # invalidates its cached results
+    try:
+        sourcefile = inspect.getsourcefile(func)
+    except TypeError:
+        return ''
+    if sourcefile is None:
+        return ''
+    directory = os.path.dirname(os.path.abspath(sourcefile))
+    sha = hashlib.sha1()
+    for path in [sourcefile] + [os.path.join(directory, name) for name in dependencies]:
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                sha.update(file.read())
+    return sha.hexdigest()
+
+
+class AnalysisCache:
+    # disk backed memoization of analysis functions with a least recently used size limit. version is added to
+    # the code version of every key, for changes outside the hashed modules
+    def __init__(self, cachedir='./cache/', maxbytes=2*1024**3, version=''):
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cachedir, exist_ok=True)
+
+    def get_key(self, func, run, args, kwargs, data):
+        signature = inspect.signature(func)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = []
+        for name, value in bound.arguments.items():
+            if run is not None and name in data:
+                continue  # identified by the run name
+            key.append((name, get_keyrepr(value)))
+        key = repr((func.__module__, func.__qualname__, get_code_version(func), self.version, run, tuple(key)))
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def memoize(self, func, data=DATA_ARGS):
+        # cached = cache.memoize(get_pvcorr); cached(logparams, start, end, num, run=exptname)
+        @functools.wraps(func)
+        def wrapper(*args, run=None, **kwargs):
+            filename = os.path.join(self.cachedir, self.get_key(func, run, args, kwargs, data) + '.pickle')
+            if os.path.isfile(filename):
+                try:
+                    with open(filename, 'rb') as file:
+                        result = pickle.load(file)
+                    os.utime(filename)  # mark as recently used
+                    self.hits += 1
+                    return result
+                except (EOFError, pickle.UnpicklingError):
+                    os.remove(filename)
+            self.misses += 1
+            result = func(*args, **kwargs)
+            self.put(filename, result)
+            return result
+        return wrapper
+
+    def put(self, filename, result):
+        tmpname = f'{filename}.{os.getpid()}.tmp'
+        with open(tmpname, 'wb') as file:
+            pickle.dump(result, file)
+        os.replace(tmpname, filename)  # atomic, so concurrent notebooks never read a partial file
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.cachedir):
+            if name.endswith('.pickle'):
+                stat = os.stat(os.path.join(self.cachedir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def nbytes(self):
+        return sum(size for mtime, size, name in self.entries())
+
+    def evict(self):
+        # remove least recently used results until the cache fits in maxbytes
+        entries = self.entries()
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in entries:
+            if total <= self.maxbytes:
+                break
+            os.remove(os.path.join(self.cachedir, name))
+            total -= size
+
+    def clear(self):
+        for mtime, size, name in self.entries():
+            os.remove(os.path.join(self.cachedir, name))
@@ -1,23 +1,24 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 class OneDimNav:
-    def __init__(self,nact,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=100, goalcoord=[0.8], startcoord=[-0.8], initvelocity=0.0, max_reward=5) -> None:
+    def __init__(self,nact,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=100, goalcoord=[0.8], startcoord=[-0.8], initvelocity=0.0, max_reward=5, rng=None, dtype=np.float64) -> None:
         self.tmax = tmax  # maximum steps per trial
+        self.rng = np.random if rng is None else rng  # numpy Generator, the global numpy RNG by default
         self.minsize = -envsize  # arena size
         self.maxsize = envsize
         self.state = 0
         self.done = False
         self.goalsize = goalsize
-        self.goals = np.array(goalcoord)
-        self.starts = np.array(startcoord)
+        self.dtype = dtype  # of states, velocities and rewards
+        self.goals = np.array(goalcoord, dtype=dtype)
+        self.starts = np.array(startcoord, dtype=dtype)
         self.statesize = 1
         self.actionsize = nact
         self.maxspeed = maxspeed  # max agent speed per step
         self.tauact = 0.2  # smooth action transition
         self.total_reward = 0
-        self.initvelocity = np.array(initvelocity)
+        self.initvelocity = np.array(initvelocity, dtype=dtype)
         self.max_reward = max_reward
         self.reward_type = 'gauss' # gauss or box
         self.amp = 1 # reward magnitude
@@ -25,22 +26,24 @@ class OneDimNav:
 
         # convert agent's onehot vector action to direction in the arena
         if self.actionsize ==3:
-            self.onehot2dirmat = np.array([[-1], [1], [0]])  # actions: move left, right, lick/stay
+            self.onehot2dirmat = np.array([[-1], [1], [0]], dtype=dtype)  # actions: move left, right, lick/stay
         else:
-            self.onehot2dirmat = np.array([[-1], [1]])  # actions: move left, right
+            self.onehot2dirmat = np.array([[-1], [1]], dtype=dtype)  # actions: move left, right
 
     def reward_func(self,x, threshold=0):
         rx =  self.amp * np.exp(-0.5*((x - self.goal)/self.goalsize)**2)
         return rx * (rx>threshold)
     
     def action2velocity(self, g):
-        # convert onehot action vector from actor to velocity
+        # convert onehot action vector or action index from actor to velocity
+        if np.ndim(g) == 0:
+            return self.onehot2dirmat[g]
         return np.matmul(g, self.onehot2dirmat)
 
     
     def reset(self):
         if len(self.starts) > 1:  # choose from multiple start locations
-            startidx = np.random.choice(np.arange(len(self.starts)),1)
+            startidx = self.rng.choice(np.arange(len(self.starts)),1)
             self.state = self.starts[startidx].copy()
             if len(self.goals)>1:
                 self.goal = self.goals[startidx].copy()
@@ -61,7 +64,7 @@ class OneDimNav:
         self.track.append(self.goal.copy())
         self.track.append(self.state.copy())
 
-        self.velocity = np.zeros(self.statesize)
+        self.velocity = np.zeros(self.statesize, dtype=self.dtype)
         self.velocity += self.initvelocity
         return self.state, self.goal, self.reward, self.done
 
@@ -79,7 +82,7 @@ class OneDimNav:
         # check if new state crosses boundary
         if newstate > self.maxsize or newstate < -self.maxsize:
             newstate = self.state.copy()
-            self.velocity = np.zeros(self.statesize)
+            self.velocity = np.zeros(self.statesize, dtype=self.dtype)
         
         # if new state does not violate boundary or obstacles, update new state
         self.state = newstate.copy()
@@ -114,10 +117,11 @@ class OneDimNav:
         return self.state, self.reward, self.done
 
     def random_action(self):
-        action = np.random.uniform(low=-1, high=1,size=self.actionsize)
+        action = self.rng.uniform(low=-1, high=1,size=self.actionsize)
         return action 
 
     def plot_trajectory(self, title=None):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(4,2))
         plt.title(f'1D {title}')
         plt.hlines(xmin=self.minsize,xmax=self.maxsize, y=1, colors='k')
@@ -0,0 +1,338 @@
+# Copyright (c) 2024 M Ganesh Kumar
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+# importable version of main.py: run_experiment(config) trains one agent and returns a RunResult.
+# Training only needs numpy, env and model. utils and metrics (matplotlib, scipy) are imported when
+# the run saves, analyses or plots, so that sweep workers start quickly.
+
+import argparse
+from dataclasses import dataclass
+import numpy as np
+from env import OneDimNav
+from store import SnapshotStore, MemoryBudget, get_nbytes, get_itemsize
+from model import uniform_pc_weights, random_all_pc_weights, predict_placecell, predict_action_prob, PlaceFieldParams, ActionSampler, NoiseSource, learn, learn_batch, get_batch_error, init_lstd, solve_lstd
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--episodes', type=int, required=False, help='episodes', default=50000)
+    parser.add_argument('--tmax', type=int, required=False, help='tmax', default=100)
+
+    parser.add_argument('--goalcoords', type=float,nargs='+', required=False, help='goal coords', default=[[0.5]])
+    parser.add_argument('--startcoods', type=float,nargs='+', required=False, help='start coods', default=[-0.75])
+    parser.add_argument('--rsz', type=float, required=False, help='reward radius', default=0.05)
+    parser.add_argument('--rmax', type=int, required=False, help='max rewards to accumulate', default=5)
+
+    parser.add_argument('--seed', type=int, required=False, help='seed', default=0)
+    parser.add_argument('--rngstate', type=int,nargs='+', required=False, help='seed words for the Generator of actions, starts and noise (default seed), set by sweep.py', default=[])
+    parser.add_argument('--pcinit', type=str, required=False, help='homogeneous or heterogenous field population', default='homo')
+    parser.add_argument('--bptype', type=str, required=False, help='backprop TD error using', default='both')
+    parser.add_argument('--npc', type=int, required=False, help='number of fields', default=64)
+    parser.add_argument('--alpha', type=float, required=False, help='alpha init', default=1)
+    parser.add_argument('--sigma', type=float, required=False, help='sigma init', default=0.1)
+
+    parser.add_argument('--plr', type=float, required=False, help='actor learning rate', default=0.01)
+    parser.add_argument('--clr', type=float, required=False, help='critic lr', default=0.01)
+    parser.add_argument('--llr', type=float, required=False, help='lambda lr', default=0.0001) 
+    parser.add_argument('--alr', type=float, required=False, help='alpha lr', default=0.0001) 
+    parser.add_argument('--slr', type=float, required=False, help='sigma lr', default=0.0001)
+    parser.add_argument('--gamma', type=float, required=False, help='gamma', default=0.9)
+    parser.add_argument('--nact', type=int, required=False, help='number of actions', default=2)
+    parser.add_argument('--beta', type=float, required=False, help='action beta', default=1)
+
+    parser.add_argument('--bsigma', type=float, required=False, help='L2 penalty for sigma', default=0.0)
+    parser.add_argument('--balpha', type=float, required=False, help='L2 penalty for alpha', default=0.0)
+    parser.add_argument('--sigmaclip', type=float, required=False, help='clip to max sigma value', default=0.0)
+    parser.add_argument('--alphaclip', type=float, required=False, help='clip to max alpha value', default=0.0)
+
+    parser.add_argument('--paramsindex', type=int,nargs='+', required=False, help='which params to add noise to', default=[0,1,2])
+    parser.add_argument('--noise', type=float, required=False, help='noise variance magnitude', default=0.00)
+    parser.add_argument('--noisescale', type=float,nargs='+', required=False, help='noise multiplier per paramsindex entry', default=[])
+    parser.add_argument('--noisetau', type=float, required=False, help='correlation time in steps of Ornstein-Uhlenbeck drift, 0 for white noise', default=0.0)
+    parser.add_argument('--noisedtype', type=str, required=False, help='noise precision, float64 or float32, default precision', default='')
+
+    parser.add_argument('--critic', type=str, required=False, help='critic learning: td or lstd (least squares, for fixed fields)', default='td')
+    parser.add_argument('--lstdfreq', type=int, required=False, help='steps between lstd critic solves', default=10)
+    parser.add_argument('--lstdridge', type=float, required=False, help='lstd ridge regularization', default=1e-3)
+    parser.add_argument('--batch', type=int, required=False, help='steps of TD gradients applied as one update, 0 for per step updates, -1 for whole episodes', default=0)
+    parser.add_argument('--batchtol', type=float, required=False, help='if > 0, check each batched update against per step updates and stop above this relative deviation', default=0.0)
+
+    parser.add_argument('--watchdog', type=str, required=False, help='divergence watchdog policy: off, warn, abort or checkpoint (abort and save the last good params)', default='warn')
+    parser.add_argument('--wdtdmax', type=float, required=False, help='watchdog limit on the summed squared TD error of an episode', default=1e6)
+    parser.add_argument('--wdsigmamin', type=float, required=False, help='watchdog lower limit on sigma', default=1e-4)
+    parser.add_argument('--wdpatience', type=int, required=False, help='trials for the moving average latency to fall below wdthreshold, 0 to not check', default=0)
+    parser.add_argument('--wdthreshold', type=float, required=False, help='watchdog convergence latency, as in evaluate_loss', default=35)
+
+    parser.add_argument('--analysis', type=str, required=False, help='analysis: na, full or online (no parameter history kept)', default='na')
+    parser.add_argument('--snapshots', type=str, required=False, help='history snapshot policy: all, every:k or log:n', default='all')
+    parser.add_argument('--precision', type=str, required=False, help='dtype of params, activations and trajectories: float64 or float32', default='float64')
+    parser.add_argument('--storage', type=str, required=False, help='dtype of the logparams and allcoords histories: float64, float32 or bfloat16 (emulated), default precision', default='')
+    parser.add_argument('--memcap', type=float, required=False, help='GB cap on the projected history, 0 for no cap', default=0)
+    parser.add_argument('--memaction', type=str, required=False, help='over memcap: downgrade (keep every k-th snapshot) or refuse', default='downgrade')
+    parser.add_argument('--telemetry', type=str, required=False, help='jsonl file to stream per episode metrics', default='')
+    parser.add_argument('--profile', type=str, required=False, help='file for the collapsed stack dump of run_trial phase times, also adds them to telemetry', default='')
+    parser.add_argument('--plot', type=int, required=False, help='1 to plot the analysis figure, 0 for metrics only', default=1)
+    parser.add_argument('--processes', type=int, required=False, help='worker processes for metrics, 0 to compute serially', default=None)
+    parser.add_argument('--csvfile', type=str, required=False, help='csv file to store score and drift', default='')
+    parser.add_argument('--datadir', type=str, required=False, help='datadir', default='./data/')
+    parser.add_argument('--figdir', type=str, required=False, help='figdir', default='./fig/')
+    return parser
+
+def get_config(config=None, **kwargs):
+    # defaults of main.py updated by config (argparse Namespace or dict) and keyword arguments
+    args = get_parser().parse_args([])
+    if config is not None:
+        vars(args).update(config if isinstance(config, dict) else vars(config))
+    vars(args).update(kwargs)
+    return args
+
+def get_exptname(args):
+    piname = ''.join(map(str, args.paramsindex))
+    exptname = f'1D_td_online_{args.bptype}_{args.noise}ns_{piname}p_{args.npc}n_{args.plr}plr_{args.clr}clr_{args.llr}llr_{args.alr}alr_{args.slr}slr_{args.pcinit}_{args.alpha}a_{args.sigma}s_{args.nact}a_{args.seed}s_{args.episodes}e_{args.rmax}rmax_{args.rsz}rsz'
+    if args.critic == 'lstd':
+        exptname += '_lstd'
+    if args.noisetau > 0:
+        exptname += f'_{args.noisetau}tau'
+    if args.batch != 0:
+        exptname += f'_{args.batch}b'
+    if args.precision != 'float64':
+        exptname += f'_{args.precision}'
+    return exptname
+
+
+@dataclass
+class RunResult:
+    exptname: str
+    args: argparse.Namespace
+    params: list  # fields and weights after training
+    logparams: list  # per episode snapshots, empty for analysis=online
+    allcoords: list
+    allrewards: list
+    latencys: list
+    losses: list
+    drift: dict  # OnlineDrift summary
+    metrics: dict = None  # compute_metrics output, None for analysis=online
+    env: OneDimNav = None
+    watchdog: dict = None  # Watchdog summary, reason is empty if the run passed
+    phases: dict = None  # PhaseTimer summary with --profile
+    memory: dict = None  # MemoryBudget summary, live bytes and policy of each history
+
+
+def learn_transitions(params, batch, args, etas, lstd=None, noisesource=None, rng=np.random):
+    # one learn_batch update from the transitions collected in run_trial
+    states, newstates, rewards, actions, aprobs = zip(*batch)
+    states, newstates, actions, aprobs = np.array(states), np.array(newstates), np.array(actions), np.array(aprobs)
+    rewards = np.array([np.sum(reward) for reward in rewards])  # scalar or (1,1) array rewards
+    b_sig_alp = [args.bsigma, args.balpha]
+    clip_sig_alp = [args.sigmaclip, args.alphaclip]
+    if args.batchtol > 0:
+        error = get_batch_error(params, rewards, newstates, states, actions, aprobs, args.gamma, etas, b_sig_alp, clip_sig_alp, args.beta, args.bptype)
+        if error > args.batchtol:
+            raise ValueError(f'batched update deviates by {error:.2e} from per step updates, more than batchtol {args.batchtol}')
+    return learn_batch(params, rewards, newstates, states, actions, aprobs, args.gamma, etas, b_sig_alp, clip_sig_alp, args.noise, args.paramsindex, args.beta, args.bptype, lstd=lstd, rng=rng, noisesource=noisesource)
+
+
+# inner loop training loop
+def run_trial(params, env, args, etas, sampler, lstd=None, noisesource=None, timer=None):
+    coords = []
+    actions = []
+    rewards = []
+    tds = []
+    batch = []  # transitions of the next batched update
+
+    b_sig_alp = [args.bsigma, args.balpha]
+    clip_sig_alp = [args.sigmaclip, args.alphaclip]
+
+    state, goal, eucdist, done = env.reset()
+    totR = 0
+    
+    if timer is not None:
+        timer.start()
+
+    for t in range(args.tmax):
+
+        pcact = predict_placecell(params, state)
+        if timer is not None:
+            timer.lap('field')
+
+        aprob = predict_action_prob(params, pcact)
+        if timer is not None:
+            timer.lap('policy')
+
+        action = sampler.sample(aprob)
+        if timer is not None:
+            timer.lap('sample')
+
+        newstate, reward, done = env.step(action)
+        if timer is not None:
+            timer.lap('env')
+
+        if args.batch == 0:
+            params, td = learn(params, reward, newstate, state, action,aprob, args.gamma, etas,b_sig_alp,clip_sig_alp, args.noise, args.paramsindex,args.beta, args.bptype, lstd=lstd, rng=sampler.rng, noisesource=noisesource, timer=timer)
+            tds.append(td**2)
+        else:
+            batch.append((state, newstate, reward, action, aprob))
+            if len(batch) == args.batch or done or t == args.tmax-1:
+                params, td = learn_transitions(params, batch, args, etas, lstd, noisesource, sampler.rng)
+                tds.extend(td**2)
+                batch = []
+                if timer is not None:
+                    timer.lap('learn')
+
+        if lstd is not None and (t+1) % args.lstdfreq == 0:
+            params[4] = solve_lstd(lstd)
+            if timer is not None:
+                timer.lap('learn')
+
+        coords.append(state)
+        actions.append(action)
+        rewards.append(reward)
+
+        state = newstate.copy()
+
+        totR += reward
+        if timer is not None:
+            timer.lap('logging')
+
+        if done:
+            break
+
+    return np.array(coords), np.array(rewards), np.array(actions),np.sum(tds), t, params
+
+
+def run_experiment(config=None, **kwargs):
+    args = get_config(config, **kwargs)
+    from metrics import OnlineDrift, Watchdog, PhaseTimer, write_telemetry
+
+    # env pararms
+    envsize = 1
+    maxspeed = 0.1
+    goalsize = args.rsz
+    train_episodes = args.episodes
+
+    etas = [args.llr, args.slr, args.alr, args.plr, args.clr]
+    exptname = get_exptname(args)
+    print(exptname)
+
+    lstd = None
+    if args.critic == 'lstd':
+        # critic weights are solved from the least squares statistics instead of per step TD updates. The
+        # statistics are only consistent while the features are fixed
+        if args.llr != 0 or args.slr != 0 or args.alr != 0:
+            raise ValueError(f'critic lstd needs fixed fields, got llr {args.llr}, slr {args.slr} and alr {args.alr}')
+        etas[4] = 0.0
+        lstd = init_lstd(args.npc, args.lstdridge)
+
+    if args.pcinit=='homo':
+        params = uniform_pc_weights(args.npc, args.nact, args.seed, sigma=args.sigma, alpha=args.alpha, envsize=envsize)
+    elif args.pcinit == 'hetero':
+        params = random_all_pc_weights(args.npc, args.nact, args.seed, sigma=args.sigma, alpha=args.alpha, envsize=envsize)
+
+    params = PlaceFieldParams(params, dtype=args.precision)  # one buffer, snapshots and updates are single array ops
+    initparams = params.copy()
+    # one Generator per run for actions, start locations and noise, independent of the global RNG
+    rng = np.random.default_rng(args.rngstate if args.rngstate else args.seed)
+    sampler = ActionSampler(rng)
+    noisesource = None
+    if args.noise > 0 and args.paramsindex:
+        noisesource = NoiseSource([params[p].shape for p in args.paramsindex], args.noise, rng, dtype=args.noisedtype or args.precision, scales=args.noisescale, tau=args.noisetau)
+    if args.plot:
+        from utils import plot_place_cells, flatten
+        plot_place_cells(initparams, startcoord=args.startcoods, goalcoord=flatten([args.goalcoords[0]]),goalsize=goalsize, title='Fields before learning',envsize=envsize)
+
+    losses = []
+    latencys = []
+    allrewards = []
+    # histories are projected from the episode budget and thinned or refused beyond memcap
+    runs = train_episodes * len(args.goalcoords)
+    policy = 'none' if args.analysis == 'online' else args.snapshots
+    budget = MemoryBudget(args.memcap * 1024**3, args.memaction)
+    # histories in the storage dtype, encoded only when it differs from the precision
+    storage = args.storage or args.precision
+    histdtype = None if storage == args.precision else storage
+    logparams = budget.add(SnapshotStore('logparams', policy, runs+1, dtype=histdtype), get_nbytes(initparams) // get_itemsize(args.precision) * get_itemsize(storage))
+    allcoords = budget.add(SnapshotStore('allcoords', policy, runs, dtype=histdtype), args.tmax * 1 * get_itemsize(storage))
+    budget.check()
+    logparams.append(initparams)
+
+    # online drift estimators, measured from stable_perf as in plot_analysis
+    drift = OnlineDrift(start=train_episodes//2, envsize=envsize)
+    telemetry = open(args.telemetry, 'a') if args.telemetry else None
+    watchdog = Watchdog(args.watchdog, args.wdtdmax, args.wdsigmamin, args.wdpatience, args.wdthreshold)
+    timer = PhaseTimer() if args.profile else None  # None skips every lap
+
+    for goalcoord in args.goalcoords:
+        env = OneDimNav(startcoord=args.startcoods, goalcoord=[goalcoord], goalsize=goalsize, tmax=args.tmax, 
+                        maxspeed=maxspeed,envsize=envsize, nact=args.nact, max_reward=args.rmax, rng=rng, dtype=args.precision)
+
+        for episode in range(train_episodes):
+            coords, rewards, actions,tds, latency, params = run_trial(params, env, args, etas, sampler, lstd, noisesource, timer)
+
+            if args.analysis != 'online':
+                allcoords.append(coords)
+                logparams.append(params.copy())
+            latencys.append(latency)
+            losses.append(tds)
+            allrewards.append(env.total_reward[0,0])
+
+            driftstats = drift.update(params, episode+1)
+            phasestats = timer.end_episode() if timer is not None else {}
+            flag = watchdog.check(params, tds, latency, episode+1)
+            if telemetry is not None:
+                write_telemetry(telemetry, {'goal': goalcoord, 'episode': episode+1, 'G': allrewards[-1], 't': latency, 'L': tds, 'flag': flag, **driftstats, **phasestats, **budget.report()})
+
+            print(f'Goal {goalcoord}, Trial {episode+1}, G {allrewards[-1]:.3f}, t {latency}, L {tds:.3f}')
+            if watchdog.stopped:
+                break
+        if watchdog.stopped:
+            break
+
+    if telemetry is not None:
+        telemetry.close()
+
+    result = RunResult(exptname, args, params, logparams, allcoords, allrewards, latencys, losses, drift.summary(), env=env, watchdog=watchdog.summary(), memory=budget.summary())
+    if timer is not None:
+        result.phases = timer.summary()
+        timer.dump(args.profile)
+
+    if watchdog.stopped:
+        # diverged or stalled, the history is incomplete so the analysis is skipped
+        if args.watchdog == 'checkpoint':
+            from utils import saveload
+            saveload(args.datadir+'checkpoint_'+exptname, [watchdog.lastparams, result.watchdog, allrewards, latencys], 'save')
+        if args.csvfile:
+            from utils import store_csv
+            store_csv(args.csvfile, args, np.nan, np.nan, watchdog.reason)
+        return result
+
+    # save variables
+    if args.analysis == 'full':
+        from utils import saveload
+        saveload(args.datadir+'full_'+exptname, [logparams.tolist(), allrewards, allcoords.tolist()], 'save')  # plain lists, as before the stores
+
+    if args.analysis == 'online':
+        # only running drift estimates are available, skip the history based analysis
+        from utils import saveload
+        saveload(args.datadir+'online_'+exptname, [result.drift, allrewards, latencys], 'save')
+        return result
+
+    from metrics import compute_metrics
+    metrics = compute_metrics(logparams, latencys, allrewards, allcoords, train_episodes//2, processes=args.processes)
+    result.metrics = metrics
+    print(f"Score {metrics['score']:.3f}, Drift {metrics['drift']:.3f}")
+
+    if args.csvfile:
+        from utils import store_csv
+        store_csv(args.csvfile, args, metrics['score'], metrics['drift'], watchdog.reason)
+
+    if args.plot:
+        from utils import plot_analysis
+        # plot figures
+        env.plot_trajectory()
+
+        f = plot_analysis(logparams, allrewards, allcoords, train_episodes//2, exptname=exptname, rsz=goalsize, metrics=metrics)
+        f.savefig(args.figdir+exptname+'.png')
+
+    return result
@@ -0,0 +1,286 @@
+import json
+import time
+from collections import deque
+from copy import deepcopy
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from model import predict_placecell
+
+
+def probe_placecell(params, xs):
+    # evaluate all fields on a grid of positions in one call, xs: (P,) -> (P, npc)
+    return predict_placecell(params, xs[:,None])
+
+
+class OnlineDrift:
+    # running drift estimators updated once per episode so that long drift runs (e.g. 200,000 episodes)
+    # do not need to keep logparams in memory. Mirrors get_param_changes, get_pvcorr and plot_active_frac.
+    def __init__(self, start=0, num=101, threshold=0.25, envsize=1):
+        self.start = start  # episode from which drift is measured, usually stable_perf
+        self.xs = np.linspace(-envsize,envsize,num)  # fixed probe grid
+        self.threshold = threshold  # activity threshold for a field to be considered active
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+        self.refvec = None
+        self.pv_corr = []
+        self.active_frac = []
+        self.episodes = []
+
+    def update(self, params, episode):
+        # params are the field parameters after the given episode
+        if episode < self.start:
+            return {}
+
+        # Welford update of per field mean and variance for lambda, sigma, alpha
+        self.n += 1
+        if self.mean is None:
+            self.mean = [np.array(params[p], dtype=float) for p in range(3)]
+            self.m2 = [np.zeros_like(self.mean[p]) for p in range(3)]
+        else:
+            for p in range(3):
+                delta = params[p] - self.mean[p]
+                self.mean[p] += delta / self.n
+                self.m2[p] += delta * (params[p] - self.mean[p])
+
+        # population vector correlation against the reference snapshot
+        pcacts = probe_placecell(params, self.xs)
+        vec = pcacts.flatten()
+        if self.refvec is None:
+            self.refvec = vec
+        R = np.corrcoef(self.refvec, vec)[0, 1]
+
+        af = np.mean(np.mean(pcacts,axis=0)>self.threshold)
+
+        self.episodes.append(episode)
+        self.pv_corr.append(R)
+        self.active_frac.append(af)
+
+        var = self.variance()
+        return {'pv_corr': R, 'active_frac': af,
+                'var_lambda': np.mean(var[0]), 'var_sigma': np.mean(var[1]), 'var_alpha': np.mean(var[2])}
+
+    def variance(self):
+        if self.mean is None:
+            return [0.0, 0.0, 0.0]
+        return [m2 / self.n for m2 in self.m2]  # population variance, same as np.var/np.std in get_param_changes analysis
+
+    def summary(self):
+        return {'start': self.start, 'episodes': np.array(self.episodes), 'n': self.n,
+                'mean': self.mean, 'var': self.variance(),
+                'pv_corr': np.array(self.pv_corr), 'active_frac': np.array(self.active_frac), 'xs': self.xs}
+
+
+class Watchdog:
+    # per episode divergence checks: non-finite parameters, TD blow-up, collapsing fields (sigma near the 1e-5
+    # bound) and, with patience > 0, no convergence of the moving average latency below threshold (as in
+    # evaluate_loss) after patience episodes. policy warn keeps training, abort stops the run and checkpoint also
+    # keeps the last parameters that passed. The first reason is kept for the results.
+    def __init__(self, policy='warn', tdmax=1e6, sigmamin=1e-4, patience=0, threshold=35, window=20):
+        self.policy = policy
+        self.tdmax = tdmax
+        self.sigmamin = sigmamin
+        self.patience = patience
+        self.threshold = threshold
+        self.latencys = deque(maxlen=window)
+        self.converged = False
+        self.reason = ''
+        self.episode = 0
+        self.stopped = False
+        self.lastparams = None
+
+    def get_reason(self, params, tds, latency, episode):
+        if not all(np.all(np.isfinite(p)) for p in params):
+            return 'nonfinite params'
+        if not np.isfinite(tds) or tds > self.tdmax:
+            return f'td blow-up {tds:.3g}'
+        sigmamin = np.min(np.abs(params[1]))
+        if sigmamin < self.sigmamin:
+            return f'sigma collapse {sigmamin:.3g}'
+        self.latencys.append(latency)
+        if len(self.latencys) == self.latencys.maxlen and np.mean(self.latencys) < self.threshold:
+            self.converged = True
+        if self.patience > 0 and episode >= self.patience and not self.converged:
+            return f'stalled, latency {np.mean(self.latencys):.1f} after {episode} trials'
+        return ''
+
+    def check(self, params, tds, latency, episode):
+        # returns the reason the run failed the checks after this episode, '' if it passed
+        if self.policy == 'off':
+            return ''
+        reason = self.get_reason(params, tds, latency, episode)
+        if not reason:
+            if self.policy == 'checkpoint':
+                self.lastparams = deepcopy(params)
+            return ''
+        if not self.reason:
+            self.reason, self.episode = reason, episode
+            print(f'Watchdog: {reason} at trial {episode}, {self.policy}')
+        self.stopped = self.policy in ['abort', 'checkpoint']
+        return reason
+
+    def summary(self):
+        return {'policy': self.policy, 'reason': self.reason, 'episode': self.episode, 'stopped': self.stopped}
+
+
+def write_telemetry(file, record):
+    # append one json line per episode to the telemetry stream
+    record = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in record.items()}
+    file.write(json.dumps(record) + '\n')
+
+
+# folded stack of each run_trial phase, noise and projection are timed inside learn
+PHASES = {'field': 'run_trial;field', 'policy': 'run_trial;policy', 'sample': 'run_trial;sample', 'env': 'run_trial;env',
+          'learn': 'run_trial;learn', 'noise': 'run_trial;learn;noise', 'projection': 'run_trial;learn;projection',
+          'logging': 'run_trial;logging'}
+
+
+class PhaseTimer:
+    # opt-in wall time per run_trial phase. lap(phase) adds the time since the previous lap to phase, so one
+    # perf_counter_ns call separates two phases. Callers hold timer=None when profiling is off, so that every
+    # lap is skipped by an `if timer is not None` check.
+    def __init__(self, phases=PHASES):
+        self.phases = phases
+        self.episode_ns = dict.fromkeys(phases, 0)
+        self.total_ns = dict.fromkeys(phases, 0)
+        self.calls = dict.fromkeys(phases, 0)
+        self.episodes = 0
+        self.last = time.perf_counter_ns()
+
+    def start(self):
+        # time before the first lap of a timed section is not assigned to any phase
+        self.last = time.perf_counter_ns()
+
+    def lap(self, phase):
+        now = time.perf_counter_ns()
+        self.episode_ns[phase] += now - self.last
+        self.calls[phase] += 1
+        self.last = now
+
+    def end_episode(self):
+        # milliseconds per phase of the finished episode, as telemetry fields
+        record = {}
+        for phase, ns in self.episode_ns.items():
+            record['ms_'+phase] = ns / 1e6
+            self.total_ns[phase] += ns
+            self.episode_ns[phase] = 0
+        self.episodes += 1
+        return record
+
+    def summary(self):
+        return {'episodes': self.episodes, 'seconds': {phase: ns / 1e9 for phase, ns in self.total_ns.items()}, 'calls': dict(self.calls)}
+
+    def dump(self, filename):
+        # collapsed stacks in microseconds, one "frame;frame value" line per phase, e.g. for flamegraph.pl or speedscope
+        with open(filename, 'w') as file:
+            for phase, ns in self.total_ns.items():
+                if ns > 0:
+                    file.write(f'{self.phases[phase]} {ns // 1000}\n')
+
+
+# headless metrics pipeline: computes the quantities drawn by plot_analysis as independent tasks
+def get_field_area(logparams, trials):
+    xs = np.linspace(-1,1,1001)
+    areas = []
+    for trial in trials:
+        areas.append(np.trapz(probe_placecell(logparams[trial], xs),axis=0))
+    areas = np.array(areas)
+    return areas/areas[0]
+
+def get_field_center(logparams, trials):
+    xs = np.linspace(-1,1,1001)
+    orig_center = xs[np.argmax(probe_placecell(logparams[trials[0]], xs),axis=0)]
+    deltas = []
+    for trial in trials:
+        deltas.append(xs[np.argmax(probe_placecell(logparams[trial], xs),axis=0)] - orig_center)
+    return np.array(deltas)
+
+def get_density(logparams, trials):
+    from scipy.stats import gaussian_kde
+    xs = np.linspace(-1,1,1001)
+    dxs = []
+    for trial in trials:
+        com = xs[np.argmax(probe_placecell(logparams[trial], xs),axis=0)]
+        kde = gaussian_kde(com,bw_method=1/11)
+        dxs.append(kde(xs))
+    return np.array(dxs)
+
+def get_fxdx_trials(allcoords, logparams, trials, gap):
+    from utils import get_1D_freq_density_corr
+    Rs = []
+    pvals = []
+    for trial in trials:
+        visits, frequency, density, R, pval = get_1D_freq_density_corr(allcoords, logparams, trial, gap=gap)
+        Rs.append(R)
+        pvals.append(pval)
+    return np.array(Rs), np.array(pvals)
+
+def get_amplitude_drift(logparams, total_trials, stable_perf):
+    from scipy import stats
+    from utils import get_param_changes, normalize_values
+    param_delta = get_param_changes(logparams, total_trials, stable_perf)
+    mean_amplitude = np.mean(param_delta[2]**2,axis=0)
+    delta_lambda = np.std(param_delta[0],axis=0)
+    delta_alpha = np.std(param_delta[2]**2,axis=0)
+    delta_sigma = np.std(param_delta[1]**2,axis=0)
+    deltas = normalize_values(delta_lambda) + normalize_values(delta_sigma) + normalize_values(delta_alpha)
+    R, pval = np.nan, np.nan
+    if np.std(mean_amplitude) != 0:
+        R, pval = stats.pearsonr(mean_amplitude, deltas)
+    return mean_amplitude, deltas, R, pval
+
+def subset(seq, indices):
+    # only send the snapshots a task needs to the worker process
+    return {i: seq[i] for i in sorted(set(int(i) for i in indices))}
+
+def get_metric_tasks(logparams, latencys, allrewards, allcoords, stable_perf, gap=25):
+    from utils import get_pvcorr, evaluate_loss, moving_average  # scipy and matplotlib are only loaded for analysis
+    total_trials = len(logparams)-1
+    gap = min(gap, total_trials)  # runs shorter than gap average over all their trials, indices stay >= 0
+    fxdx_trials = np.linspace(gap, total_trials,dtype=int, num=31)
+    shape_trials = np.linspace(0, total_trials, num=51, dtype=int)
+    pv_trials = np.linspace(stable_perf, total_trials-1, 101, dtype=int)
+    gap_idx = lambda trials: [trial-g-1 for trial in trials for g in range(gap)]
+    trials = [gap,total_trials//4, total_trials]
+
+    tasks = {
+        'score': (evaluate_loss, (latencys,)),
+        'G': (moving_average, (allrewards, 20)),
+        'pvcorr': (get_pvcorr, (subset(logparams, list(pv_trials)+[stable_perf]), stable_perf, total_trials, 101)),
+        'fxdx': (get_fxdx_trials, (subset(allcoords, gap_idx(fxdx_trials)), subset(logparams, gap_idx(fxdx_trials)), fxdx_trials, gap)),
+        'field_area': (get_field_area, (subset(logparams, shape_trials), shape_trials)),
+        'field_center': (get_field_center, (subset(logparams, shape_trials), shape_trials)),
+        'density': (get_density, (subset(logparams, trials), trials)),
+        'amplitude_drift': (get_amplitude_drift, (subset(logparams, range(stable_perf, total_trials)), total_trials, stable_perf)),
+    }
+    return tasks
+
+def compute_metrics(logparams, latencys, allrewards, allcoords, stable_perf, processes=None, gap=25):
+    # run every metric as an independent task on a process pool, processes=0 computes them serially in process
+    tasks = get_metric_tasks(logparams, latencys, allrewards, allcoords, stable_perf, gap=gap)
+    if processes == 0:
+        results = {name: func(*args) for name, (func, args) in tasks.items()}
+    else:
+        # fork so that workers do not re-execute the calling script, which is unguarded top level code
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            futures = {name: pool.submit(func, *args) for name, (func, args) in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
+
+    total_trials = len(logparams)-1
+    trials, pv_corr, rep_corr, startxcor, endxcor = results['pvcorr']
+    fxdx_R, fxdx_pval = results['fxdx']
+    mean_amplitude, deltas, amp_R, amp_pval = results['amplitude_drift']
+    metrics = {
+        'score': results['score'],
+        'drift': np.std(pv_corr)/np.std(np.array(latencys)[np.linspace(stable_perf, total_trials-1, num=1001, dtype=int)]),
+        'G': results['G'],
+        'pv_trials': trials, 'pv_corr': np.array(pv_corr), 'rep_corr': np.array(rep_corr),
+        'startxcor': startxcor, 'endxcor': endxcor,
+        'fxdx_R': fxdx_R, 'fxdx_pval': fxdx_pval,
+        'field_area': results['field_area'], 'field_center': results['field_center'],
+        'density': results['density'],
+        'mean_amplitude': mean_amplitude, 'param_drift': deltas, 'amplitude_drift_R': amp_R, 'amplitude_drift_pval': amp_pval,
+    }
+    return metrics
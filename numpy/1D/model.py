@@ -1,4 +1,5 @@
 import numpy as np
+from copy import deepcopy
 
 
 # main agent description
@@ -20,6 +21,93 @@ def random_all_pc_weights(npc, nact,seed,sigma=0.1, alpha=1,envsize=1):  # heter
     1e-5 * np.random.normal(size=(npc,nact)), 1e-5 * np.random.normal(size=(npc,1))]
 
 
+class PlaceFieldParams:
+    # params in one contiguous buffer of dtype, float64 by default. Indexing and unpacking give the views centers,
+    # sigmas, amps, actor and critic in the order of the params list, assigning to an index copies into the view.
+    # copy() is a single memcpy and the buffer can be shared with worker processes,
+    # e.g. from_flat(np.ndarray(n, buffer=shm.buf), shapes).
+    names = ('centers', 'sigmas', 'amps', 'actor', 'critic')
+
+    def __init__(self, params, dtype=float):
+        shapes = [np.shape(p) for p in params]
+        self.set_layout(np.empty(sum(int(np.prod(shape)) for shape in shapes), dtype=dtype), shapes)
+        for view, p in zip(self.views, params):
+            view[...] = p
+
+    @classmethod
+    def from_flat(cls, flat, shapes):
+        # views onto an existing buffer without copying
+        self = cls.__new__(cls)
+        self.set_layout(flat, shapes)
+        return self
+
+    def set_layout(self, flat, shapes):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.offsets = [0] + np.cumsum(self.sizes).tolist()
+        self.set_flat(flat)
+
+    def set_flat(self, flat):
+        self.flat = flat
+        self.views = [flat[start:end].reshape(shape) for start, end, shape in zip(self.offsets[:-1], self.offsets[1:], self.shapes)]
+        self.etas = None
+        self.gradbuf = None
+
+    centers = property(lambda self: self.views[0])
+    sigmas = property(lambda self: self.views[1])
+    amps = property(lambda self: self.views[2])
+    actor = property(lambda self: self.views[3])
+    critic = property(lambda self: self.views[4])
+
+    def __getitem__(self, p):
+        return self.views[p]
+
+    def __setitem__(self, p, value):
+        if value is not self.views[p]:  # params[p] += x has already updated the view in place
+            self.views[p][...] = value
+
+    def __len__(self):
+        return len(self.views)
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def copy(self):
+        other = PlaceFieldParams.__new__(PlaceFieldParams)
+        other.shapes, other.sizes, other.offsets = self.shapes, self.sizes, self.offsets
+        other.set_flat(self.flat.copy())
+        return other
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return PlaceFieldParams.from_flat, (self.flat, self.shapes)
+
+    def tolist(self):
+        return [view.copy() for view in self.views]
+
+    def update(self, etas, grads):
+        # params[p] += etas[p] * grads[p] for all p as one op over the buffer
+        if self.etas != tuple(etas):
+            self.etas = tuple(etas)
+            self.etavec = np.repeat(self.etas, self.sizes)
+            self.gradbuf = np.empty_like(self.flat)
+        np.concatenate([np.ravel(grad) for grad in grads], out=self.gradbuf)
+        self.gradbuf *= self.etavec
+        self.flat += self.gradbuf
+
+    def add(self, indices, flat):
+        # adds flat, laid out as the parameters in indices one after another, in one op when they are adjacent
+        if list(indices) == list(range(indices[0], indices[-1]+1)):
+            self.flat[self.offsets[indices[0]]:self.offsets[indices[-1]+1]] += flat
+        else:
+            start = 0
+            for p in indices:
+                self.flat[self.offsets[p]:self.offsets[p+1]] += flat[start:start+self.sizes[p]]
+                start += self.sizes[p]
+
+
 def predict_placecell(params, x):
     pc_centers, pc_sigmas, pc_constant, actor_weights,critic_weights = params
     exponent = ((x-pc_centers)/pc_sigmas)**2
@@ -56,10 +144,82 @@ def get_onehot_action(prob, nact=2):
     onehotg[A] = 1
     return onehotg
 
-def learn(params, reward, newstate,state, onehotg,aprob, gamma, etas,b_sig_alp=[0.0,0.0],clip_sig_alp=[0,0], noise=0.0, paramsindex=[], beta=1, bptype='both'):
+def get_onehot(action, nact, dtype=float):
+    onehotg = np.zeros(nact, dtype=dtype)
+    onehotg[action] = 1
+    return onehotg
+
+class ActionSampler:
+    # categorical action sampling by inverse CDF over blocks of uniforms drawn from a numpy Generator,
+    # returns integer action indices
+    def __init__(self, rng=None, block=4096):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.uniforms = self.rng.random(block)
+        self.i = 0
+
+    def sample(self, prob):
+        if self.i == len(self.uniforms):
+            self.rng.random(out=self.uniforms)
+            self.i = 0
+        u = self.uniforms[self.i]
+        self.i += 1
+        cdf = np.asarray(prob).cumsum()
+        return min(int(cdf.searchsorted(u * cdf[-1], side='right')), len(cdf)-1)
+
+class NoiseSource:
+    # Gaussian parameter noise pre-generated in blocks of steps from a numpy Generator. next() returns one view
+    # per noisy parameter, valid until the following call. scales multiply noise per parameter, float32 halves
+    # the generation cost. tau > 0 gives temporally correlated Ornstein-Uhlenbeck drift with correlation time tau
+    # steps and the same stationary std as the white noise.
+    def __init__(self, shapes, noise, rng=None, block=1024, dtype=np.float64, scales=None, tau=0.0):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.shapes = [tuple(shape) for shape in shapes]
+        sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+        scales = np.ones(len(sizes)) if scales is None or len(scales) == 0 else np.broadcast_to(scales, len(sizes))
+        self.scale = (noise * np.repeat(scales, sizes)).astype(dtype)
+        self.dtype = np.dtype(dtype)
+        self.tau = tau
+        self.decay = np.exp(-1/tau) if tau > 0 else 0.0
+        self.block = np.empty((block, self.offsets[-1]), dtype=dtype)
+        self.views = [self.block[:,start:end].reshape((block,)+shape) for start, end, shape in zip(self.offsets[:-1], self.offsets[1:], self.shapes)]
+        if tau > 0:
+            self.zi = (self.decay * self.rng.standard_normal(self.offsets[-1]))[None,:]  # stationary start
+        self.i = block
+
+    def refill(self):
+        self.rng.standard_normal(out=self.block, dtype=self.dtype)
+        if self.tau > 0:
+            from scipy.signal import lfilter
+            # x_t = decay x_t-1 + sqrt(1 - decay^2) eps_t along the steps of the block
+            self.block[:], self.zi = lfilter([np.sqrt(1 - self.decay**2)], [1, -self.decay], self.block, axis=0, zi=self.zi)
+        self.block *= self.scale
+        self.i = 0
+
+    def next(self):
+        if self.i == len(self.block):
+            self.refill()
+        i = self.i
+        self.i += 1
+        return [view[i] for view in self.views]
+
+    def next_flat(self):
+        # the noise of all parameters of one step as a single vector
+        if self.i == len(self.block):
+            self.refill()
+        self.i += 1
+        return self.block[self.i-1]
+
+def learn(params, reward, newstate,state, onehotg,aprob, gamma, etas,b_sig_alp=[0.0,0.0],clip_sig_alp=[0,0], noise=0.0, paramsindex=[], beta=1, bptype='both', lstd=None, rng=np.random, noisesource=None, timer=None):
     
+    if np.ndim(onehotg) == 0:  # action index from ActionSampler
+        onehotg = get_onehot(onehotg, len(aprob), aprob.dtype)
+
     pcact = predict_placecell(params, state)
     newpcact = predict_placecell(params, newstate)
+
+    if lstd is not None:
+        update_lstd(lstd, reward, pcact, newpcact, gamma)  # statistics for the least squares critic
     td = (reward + gamma * predict_value(params, newpcact) - predict_value(params, pcact))[0]  # TD error
 
     # get critic grads
@@ -98,13 +258,27 @@ def learn(params, reward, newstate,state, onehotg,aprob, gamma, etas,b_sig_alp=[
     grads = [dpcc, dpcs, dpca, dact, dcri]
 
     #update weights by gradient ascent
-    for p in range(len(params)):
-        params[p] += etas[p] * grads[p]
+    if isinstance(params, PlaceFieldParams):
+        params.update(etas, grads)
+    else:
+        for p in range(len(params)):
+            params[p] += etas[p] * grads[p]
+
+    if timer is not None:
+        timer.lap('learn')
 
     # add Gaussian noise to field parameters or actor-critic weights, define using paramsindex. 
-    for p in paramsindex:
-        ns = np.random.normal(size=params[p].shape) * noise
-        params[p] += ns
+    if noisesource is not None and isinstance(params, PlaceFieldParams):
+        params.add(paramsindex, noisesource.next_flat())
+    elif noisesource is not None:
+        for p, ns in zip(paramsindex, noisesource.next()):
+            params[p] += ns
+    elif noise > 0:  # no draws at all without noise
+        for p in paramsindex:
+            ns = rng.normal(size=params[p].shape) * noise
+            params[p] += ns
+    if timer is not None:
+        timer.lap('noise')
 
     # clip large fields. Not necessary but if you want to keep fields withing some upper bound. 
     # If sigma --> 0, fields will explode. hence lower bound is 1e-5.
@@ -112,9 +286,116 @@ def learn(params, reward, newstate,state, onehotg,aprob, gamma, etas,b_sig_alp=[
         params[1] = np.clip(params[1],1e-5, clip_sig_alp[0])
     if clip_sig_alp[1]>0:
         params[2] = np.clip(params[2], 1e-5,clip_sig_alp[1])
+    if timer is not None:
+        timer.lap('projection')
 
     return params, td
 
+def learn_batch(params, rewards, newstates, states, actions, aprobs, gamma, etas, b_sig_alp=[0.0,0.0], clip_sig_alp=[0,0], noise=0.0, paramsindex=[], beta=1, bptype='both', lstd=None, rng=np.random, noisesource=None):
+    # learn for k transitions with the parameters held fixed. The gradients are summed over the batch as matrix
+    # products, Phi^T td for the critic and Phi^T (td (onehot - pi)) for the actor, and applied as one update.
+    # Equal to k calls of learn to first order in the learning rates, see get_batch_error.
+    states, newstates = np.reshape(states, (-1,1)), np.reshape(newstates, (-1,1))
+    rewards = np.asarray(rewards, dtype=float)
+    k, nact = len(rewards), aprobs.shape[1]
+
+    pcacts = predict_placecell(params, states)  # (k, npc)
+    newpcacts = predict_placecell(params, newstates)
+
+    if lstd is not None:
+        for pcact, newpcact, reward in zip(pcacts, newpcacts, rewards):
+            update_lstd(lstd, reward, pcact, newpcact, gamma)
+    tds = rewards + gamma * predict_value(params, newpcacts)[:,0] - predict_value(params, pcacts)[:,0]  # TD errors
+
+    # critic and actor grads
+    dcri = pcacts.T @ tds[:,None]
+    onehots = np.eye(nact)[actions]
+    if bptype == 'actg':
+        decay = beta * onehots
+    else:
+        decay = beta * (onehots - aprobs)
+    dact = pcacts.T @ (tds[:,None] * decay)
+
+    # TD error backpropagated to each field for each transition, (k, npc)
+    if bptype == 'both':
+        post_td = (decay @ params[3].T + params[4].T) * tds[:,None]
+    elif bptype ==  'cri':
+        post_td = params[4].T * tds[:,None]
+    elif bptype in ['act', 'actg']:
+        post_td = (decay @ params[3].T) * tds[:,None]
+    elif bptype == 'none':
+        post_td = np.repeat(tds[:,None], len(params[0]), axis=1)
+    post_td = post_td * pcacts
+
+    l2_grad_alpha =  b_sig_alp[1] * 2*params[2]
+    l2_grad_sigma = b_sig_alp[0] * 2*params[1]
+
+    dx = states - params[0]
+    dpcc = np.sum(post_td * dx/params[1]**2, axis=0)
+    dpcs = np.sum(post_td * (dx**2/params[1]**3 - l2_grad_sigma), axis=0)
+    dpca = np.sum(post_td, axis=0) * (2 / params[2]) - k * l2_grad_alpha[0]  # learn applies the penalty of the first field to all
+
+    grads = [dpcc, dpcs, dpca, dact, dcri]
+
+    if isinstance(params, PlaceFieldParams):
+        params.update(etas, grads)
+    else:
+        for p in range(len(params)):
+            params[p] += etas[p] * grads[p]
+
+    # noise of the k steps
+    if noisesource is not None and isinstance(params, PlaceFieldParams):
+        params.add(paramsindex, np.sum([noisesource.next_flat() for _ in range(k)], axis=0))
+    elif noisesource is not None:
+        for _ in range(k):
+            for p, ns in zip(paramsindex, noisesource.next()):
+                params[p] += ns
+    elif noise > 0:  # no draws at all without noise
+        for p in paramsindex:
+            params[p] += rng.normal(size=(k,)+params[p].shape).sum(axis=0) * noise
+
+    if clip_sig_alp[0] > 0:
+        params[1] = np.clip(params[1],1e-5, clip_sig_alp[0])
+    if clip_sig_alp[1]>0:
+        params[2] = np.clip(params[2], 1e-5,clip_sig_alp[1])
+
+    return params, tds
+
+def get_batch_error(params, rewards, newstates, states, actions, aprobs, gamma, etas, b_sig_alp=[0.0,0.0], clip_sig_alp=[0,0], beta=1, bptype='both'):
+    # largest deviation of learn_batch from k per step learn updates, both without noise, relative to the
+    # magnitude of each parameter before or after the updates. The deviation is second order in the learning
+    # rates, so the error shrinks about linearly with them. At init the actor and critic weights are ~1e-5 and
+    # set the scale of their block from the updated values.
+    sequential = deepcopy(params)
+    for reward, newstate, state, action, aprob in zip(rewards, newstates, states, actions, aprobs):
+        sequential, td = learn(sequential, reward, newstate, state, action, aprob, gamma, etas, b_sig_alp, clip_sig_alp, beta=beta, bptype=bptype)
+    batched, tds = learn_batch(deepcopy(params), rewards, newstates, states, actions, aprobs, gamma, etas, b_sig_alp, clip_sig_alp, beta=beta, bptype=bptype)
+    error = 0.0
+    for p in range(len(params)):
+        scale = max(np.max(np.abs(params[p])), np.max(np.abs(sequential[p])))
+        if scale > 0:
+            error = max(error, np.max(np.abs(batched[p] - sequential[p])) / scale)
+    return error
+
+
+# least squares TD critic for fixed place fields. Keeps A^-1 and b, with A = ridge I + sum phi (phi - gamma phi')^T and
+# b = sum phi r, so that each step is a Sherman-Morrison rank-1 update and the critic weights are A^-1 b.
+def init_lstd(npc, ridge=1e-3):
+    return [np.eye(npc)/ridge, np.zeros((npc,1))]
+
+def update_lstd(lstd, reward, pcact, newpcact, gamma):
+    Ainv, b = lstd
+    u = pcact[:,None]
+    v = (pcact - gamma * newpcact)[:,None]
+    Au = Ainv @ u
+    vA = v.T @ Ainv
+    Ainv -= (Au @ vA) / (1 + vA @ u)
+    b += u * reward
+    return lstd
+
+def solve_lstd(lstd):
+    Ainv, b = lstd
+    return Ainv @ b
 
 
 def get_discounted_rewards(rewards, gamma=0.9, norm=False):
@@ -1,17 +1,66 @@
 from model import *
 from env import *
 from utils import *
+import itertools
+import inspect
+import hashlib
+import weakref
+from collections import OrderedDict
+from scipy import sparse
+from scipy.sparse.linalg import splu, bicgstab
+
+BICGSTAB_RTOL = 'rtol' if 'rtol' in inspect.signature(bicgstab).parameters else 'tol'  # tol before scipy 1.12
 
 
 def relu(x):
     return np.maximum(x,0)
 
 def get_ca1(ca3, U):
-    ca1_sr = []
-    for i in range(ca3.shape[0]):
-        ca1_sr.append(relu(U) @ ca3[i])
-    ca1_sr = np.array(ca1_sr)
-    return ca1_sr
+    # SR readout relu(U) @ ca3[i] for every position at once
+    return ca3 @ relu(U).T
+
+class ReadoutCache:
+    # least recently used SR readouts of one history, keyed by (ca3 digest, history length, trial). Only the
+    # readouts are held, so maxbytes bounds all the memory the cache retains
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, key):
+        ca1 = self.entries.get(key)
+        if ca1 is not None:
+            self.entries.move_to_end(key)
+        return ca1
+
+    def put(self, key, ca1):
+        self.entries[key] = ca1
+        self.nbytes += ca1.nbytes
+        while self.nbytes > self.maxbytes and len(self.entries) > 1:
+            self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+
+# one cache per SR history, dropped with the history. Histories that cannot be weakly referenced (dicts, lists) are not cached
+ca1_caches = weakref.WeakKeyDictionary()
+ca1_cache_maxbytes = 512 * 1024**2
+
+def get_ca1s(ca3, Us, trials, chunk=16):
+    # batched SR readout ca3 @ relu(U).T for many trials, returns (trials, positions, npc)
+    trials = [int(trial) for trial in trials]
+    try:
+        cache = ca1_caches.setdefault(Us, ReadoutCache(ca1_cache_maxbytes))
+    except TypeError:
+        cache = ReadoutCache(ca1_cache_maxbytes)  # scoped to this call
+    ca3 = np.ascontiguousarray(ca3)
+    prefix = (ca3.shape, hashlib.blake2b(ca3.view(np.uint8), digest_size=16).digest(), len(Us))
+    ca1s = {trial: cache.get(prefix + (trial,)) for trial in dict.fromkeys(trials)}
+    missing = [trial for trial, ca1 in ca1s.items() if ca1 is None]
+    for i in range(0, len(missing), chunk):
+        batch = missing[i:i+chunk]
+        relu_Us = relu(np.stack([Us[trial] for trial in batch]))
+        for trial, ca1 in zip(batch, np.matmul(ca3, relu_Us.transpose(0,2,1))):
+            ca1s[trial] = ca1
+            cache.put(prefix + (trial,), ca1)
+    return np.array([ca1s[trial] for trial in trials])
 
 def plot_sr_pc(Us, ca3, trial,title='', ax=None, goalcoord=[0.5], startcoord=[-0.75], goalsize=0.05, envsize=1,):
     if ax is None:
@@ -21,9 +70,9 @@ def plot_sr_pc(Us, ca3, trial,title='', ax=None, goalcoord=[0.5], startcoord=[-0
     cmap = cm.viridis
     num_curves = ca3.shape[1]
     xs = np.linspace(-1,1,1001)
+    ca1 = get_ca1s(ca3, Us, [trial])[0]
     for i in range(num_curves):
         color = cmap(i / num_curves)
-        ca1 = get_ca1(ca3, Us[trial])
         ax.plot(xs, ca1[:, i], color=color,zorder=1)
 
     ax.set_xlabel('x')
@@ -36,18 +85,15 @@ def plot_sr_pc(Us, ca3, trial,title='', ax=None, goalcoord=[0.5], startcoord=[-0
     ax.hlines(xmin=-envsize,xmax=envsize, y=0, colors='k',zorder=2)
     # plt.legend(frameon=False, fontsize=6)
 
+def get_sr_field_area(Us, ca3, trials):
+    areas = np.trapz(get_ca1s(ca3, Us, trials),axis=1)
+    return areas/areas[0]
+
 def plot_sr_field_area(Us, ca3, trials,ax=None):
     if ax is None:
         f,ax = plt.subplots()
     
-    areas = []
-    for trial in trials:
-        ca1 = get_ca1(ca3, Us[trial])
-        area = np.trapz(ca1,axis=0)
-        areas.append(area)
-    areas = np.array(areas)
-
-    norm_area = areas/areas[0]
+    norm_area = get_sr_field_area(Us, ca3, trials)
 
     mean_deltas = np.mean(norm_area,axis=1)
     sem_deltas = np.std(norm_area,axis=1)/np.sqrt(ca3.shape[1])
@@ -62,17 +108,16 @@ def plot_sr_field_area(Us, ca3, trials,ax=None):
 def plot_sr_center(Us,ca3, trials,ax=None):
     if ax is None:
         f,ax = plt.subplots()
-    ca1_init = get_ca1(ca3, Us[0])
+    ca1_init = get_ca1s(ca3, Us, [0])[0]
     xs = np.linspace(-1,1,1001)
+    orig_ca1_center = xs[np.argmax(ca1_init,axis=0)]
     deltas = []
-    for trial in trials:
-        ca1 = get_ca1(ca3, Us[trial])
+    for ca1 in get_ca1s(ca3, Us, trials):
         d = []
         for n in range(ca3.shape[1]):
             # ca3_center = xs[np.argmax(ca3[:,n])]
-            orig_ca1_center = xs[np.argmax(ca1_init[:,n])]
             ca1_center = xs[np.argmax(ca1[:,n])]
-            delta = ca1_center - orig_ca1_center # - ca3_center
+            delta = ca1_center - orig_ca1_center[n] # - ca3_center
             d.append(delta)
         deltas.append(np.array(d))
     deltas = np.array(deltas)
@@ -89,8 +134,7 @@ def plot_sr_density(Us,ca3, trials,ax=None, goalcoord=0.5, goalsize=0.05, startc
     if ax is None:
         f,ax=plt.subplots()
     xs = np.linspace(-1,1,1001)
-    for trial in trials:
-        ca1 = get_ca1(ca3, Us[trial])
+    for trial, ca1 in zip(trials, get_ca1s(ca3, Us, trials)):
         dx = np.sum(ca1,axis=1)/ca1.shape[1]
         ax.plot(xs, dx, label=f'T={trial}')
 
@@ -107,23 +151,17 @@ def plot_sr_density(Us,ca3, trials,ax=None, goalcoord=0.5, goalsize=0.05, startc
     return dx
 
 
-def get_sr_1D_kde_density_corr(allcoords, Us, param, trial, gap=25):
+def get_sr_1D_kde_density_corr(allcoords, Us, param, trial, gap=25, ca3=None):
     xs = np.linspace(-1,1,1001)
-    ca3 = predict_batch_placecell(param, xs)
+    if ca3 is None:
+        ca3 = predict_batch_placecell(param, xs)
 
-    dx = []
     fx = []
-
     for g in range(gap):
         fx.append(allcoords[trial-g-1])
 
-        ca1_sr = []
-        for i in range(ca3.shape[0]):
-            ca1_sr.append(relu(Us[trial-g-1]) @ ca3[i])
-        ca1_sr = np.array(ca1_sr)
-
-        density = np.sum(ca1_sr,axis=1)/ca1_sr.shape[1]
-        dx.append(density)
+    ca1_sr = get_ca1s(ca3, Us, [trial-g-1 for g in range(gap)])
+    dx = np.sum(ca1_sr,axis=2)/ca1_sr.shape[2]
     
     fx = np.array(flatten(fx))
     kde = gaussian_kde(fx.reshape(-1))
@@ -144,10 +182,175 @@ def plot_sr_fxdx_trials_kde(allcoords, Us, logparams, trials,gap, ax=None):
     Rs = []
     fxs = []
     dxs = []
+    ca3 = predict_batch_placecell(logparams[0], np.linspace(-1,1,1001))
     for trial in trials:
-        visits, frequency, density, R, pval = get_sr_1D_kde_density_corr(allcoords, Us,logparams[0], trial, gap=gap)
+        visits, frequency, density, R, pval = get_sr_1D_kde_density_corr(allcoords, Us,logparams[0], trial, gap=gap, ca3=ca3)
         Rs.append(R)
         fxs.append(frequency)
         dxs.append(density)
     ax.plot(trials, Rs, marker='s',color='tab:green')
     return np.array(fxs), np.array(dxs), Rs
+
+
+def get_trajectory_pcacts(params, coords):
+    # CA3 activations for every state of a recorded trajectory in one call, coords: (T, 1) -> (T, npc)
+    return predict_placecell(params, np.reshape(coords, (-1,1)))
+
+def learn_sr_episode(U, pcacts, lr, gamma, batch=0):
+    # SR TD update of the scripts' run_trial for consecutive states of one episode, U is updated in place.
+    # td[i,j] = phi_j + gamma M1_i - M_i and delu = td * phi_i, i.e. delu = phi phi^T + (phi * (gamma M1 - M)) 1^T
+    # batch=0 applies the updates sequentially (exact), batch=k holds U fixed for k steps and applies
+    # the summed update as one matrix product, batch=-1 does so for the whole episode (approximation for small lr)
+    phi = pcacts[:-1]
+    dphi = gamma * pcacts[1:] - pcacts[:-1]  # gamma M1 - M = relu(U) (gamma phi' - phi)
+    if batch == 0:
+        relu_U = np.empty_like(U)
+        for t in range(len(phi)):
+            np.maximum(U, 0, out=relu_U)
+            m = relu_U @ dphi[t]
+            U += (lr * phi[t])[:,None] * (phi[t][None,:] + m[:,None])
+        return U
+
+    batch = len(phi) if batch < 0 else batch
+    for t in range(0, len(phi), batch):
+        p = phi[t:t+batch]
+        m = dphi[t:t+batch] @ relu(U).T
+        U += lr * (p.T @ p + np.sum(p * m,axis=0)[:,None])
+    return U
+
+
+def learn_sr_offline(logparams, allcoords, lr, gamma, U=None, batch=0, trials=None, store=None):
+    # learn the SR from the trajectories recorded during training instead of re-simulating every episode.
+    # Episode e was run with logparams[e], so its CA3 activations are computed in one batched call.
+    # The transition from the last recorded state to the terminal state is not stored, so it is skipped.
+    # With a SnapshotStore, U is appended after every episode and the store, which applies its own snapshot
+    # policy and compression, is returned instead of the dict of trials.
+    npc = len(logparams[0][2])
+    U = np.eye(npc) if U is None else U.copy()
+    trials = set(range(len(allcoords)+1)) if trials is None else set(trials)
+    Us = {0: U.copy()} if 0 in trials and store is None else {}
+    if store is not None:
+        store.append(U.copy())
+    for episode, coords in enumerate(allcoords):
+        pcacts = get_trajectory_pcacts(logparams[episode], coords)
+        U = learn_sr_episode(U, pcacts, lr, gamma, batch=batch)
+        if store is not None:
+            store.append(U.copy())
+        elif episode+1 in trials:
+            Us[episode+1] = U.copy()
+    return U, Us if store is None else store
+
+
+def sweep_sr_offline(logparams, allcoords, lrs, gammas, batch=-1):
+    # minibatched SR learning for many (lr, gamma) pairs at once, sharing the CA3 activations of every episode.
+    # returns the final U of each pair, shape (len(lrs), len(gammas), npc, npc)
+    npc = len(logparams[0][2])
+    lrs = np.array(lrs, dtype=float)[:,None,None,None]
+    gammas = np.array(gammas, dtype=float)
+    Us = np.tile(np.eye(npc), (lrs.shape[0], len(gammas), 1, 1))
+    for episode, coords in enumerate(allcoords):
+        pcacts = get_trajectory_pcacts(logparams[episode], coords)
+        size = len(pcacts)-1 if batch < 0 else batch
+        for t in range(0, len(pcacts)-1, size):
+            end = min(t+size, len(pcacts)-1)
+            p = pcacts[t:end]
+            p1 = pcacts[t+1:end+1]
+            dphi = gammas[:,None,None] * p1[None] - p[None]  # (gammas, steps, npc)
+            m = np.matmul(dphi[None], relu(Us).transpose(0,1,3,2))  # (lrs, gammas, steps, npc)
+            Us += lrs * ((p.T @ p)[None,None] + np.einsum('tn,lgtn->lgn', p, m)[...,None])
+    return Us
+
+
+# closed form SR for fixed fields and policy on a discretized (position, velocity) state space.
+# The velocity smoothing tauact makes the dynamics second order, so velocity is part of the state.
+def get_interp_weights(points, grids):
+    # multilinear interpolation of points (N, k) onto a regular grid, returns flat state indices and weights (N, 2**k)
+    idx = []
+    frac = []
+    for d, grid in enumerate(grids):
+        f = np.clip((points[:,d] - grid[0])/(grid[1] - grid[0]), 0, len(grid)-1)
+        i = np.minimum(np.floor(f).astype(int), len(grid)-2)
+        idx.append(i)
+        frac.append(f - i)
+    shape = [len(grid) for grid in grids]
+    indices = []
+    weights = []
+    for corner in itertools.product([0,1], repeat=len(grids)):
+        indices.append(np.ravel_multi_index([idx[d] + c for d, c in enumerate(corner)], shape))
+        weights.append(np.prod([frac[d] if c else 1 - frac[d] for d, c in enumerate(corner)],axis=0))
+    return np.stack(indices,axis=1), np.stack(weights,axis=1)
+
+def get_sr_statespace(env, num=201, numv=21):
+    xs = np.linspace(env.minsize, env.maxsize, num)
+    vs = np.linspace(-env.maxspeed, env.maxspeed, numv)  # |v| never exceeds maxspeed
+    grids = [xs]*env.statesize + [vs]*env.statesize
+    states = np.stack([g.reshape(-1) for g in np.meshgrid(*grids, indexing='ij')],axis=1)
+    return states, grids
+
+def get_transition_matrix(params, env, num=201, numv=21, beta=1):
+    # P[s,s'] under the policy predict_action_prob and the env.step dynamics, returns P, states, grids
+    states, grids = get_sr_statespace(env, num, numv)
+    dim = env.statesize
+    x = states[:,:dim]
+    v = states[:,dim:]
+    aprob = predict_action_prob(params, predict_placecell(params, grids[0][:,None]), beta=beta)
+    aprob = aprob[np.arange(len(states)) // numv]  # policy only depends on position
+
+    rows = []
+    cols = []
+    vals = []
+    for a, direction in enumerate(env.onehot2dirmat):
+        newv = v + env.tauact * (-v + direction * env.maxspeed)
+        newx = x + newv
+        # crossing the boundary resets position and velocity, as in env.step
+        blocked = np.any(newx > env.maxsize,axis=1) | np.any(newx < env.minsize,axis=1)
+        newx[blocked] = x[blocked]
+        newv[blocked] = 0
+        indices, weights = get_interp_weights(np.concatenate([newx, newv],axis=1), grids)
+        rows.append(np.repeat(np.arange(len(states)), indices.shape[1]))
+        cols.append(indices.reshape(-1))
+        vals.append((weights * aprob[:,a:a+1]).reshape(-1))
+    P = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(len(states), len(states)))
+    return P, states, grids
+
+def get_occupancy(P, env, grids, tmax):
+    # expected visits of each state within tmax steps from the start states. Episodes ending early
+    # after max_reward are ignored since that depends on the accumulated reward, not on the state.
+    dim = env.statesize
+    starts = np.reshape(env.starts, (-1, dim))
+    v0 = np.ones((len(starts), dim)) * getattr(env, 'initvelocity', 0.0)
+    indices, weights = get_interp_weights(np.concatenate([starts, v0],axis=1), grids)
+    mu = np.bincount(indices.reshape(-1), weights=weights.reshape(-1), minlength=P.shape[0]) / len(starts)
+    occupancy = np.zeros(P.shape[0])
+    PT = P.T.tocsr()
+    for t in range(tmax):
+        occupancy += mu
+        mu = PT @ mu
+    return occupancy
+
+def solve_sr(params, env, gamma, num=201, numv=21, beta=1, method='direct', ridge=1e-6, maxiter=None, tol=1e-8):
+    # SR psi = (I - gamma P)^-1 phi over the state space, then U is the occupancy weighted least squares fit of
+    # psi(s) ~ U phi(s), which can be used as a reference or as a warm start for the TD learned U.
+    # Returns U, the reference CA1 fields on the position grid averaged over velocity, and the position grid.
+    P, states, grids = get_transition_matrix(params, env, num, numv, beta=beta)
+    phi = predict_placecell(params, grids[0][:,None])[np.arange(len(states)) // numv]
+    A = (sparse.identity(P.shape[0], format='csc') - gamma * P).tocsc()
+
+    if method == 'direct':
+        psi = splu(A).solve(phi)
+    else:
+        # bicgstab per place cell, memory stays linear in the number of states unlike the LU factors.
+        # tol is relative to the norm of each place cell's field
+        psi = np.zeros_like(phi)
+        for n in range(phi.shape[1]):
+            psi[:,n], info = bicgstab(A, phi[:,n], x0=phi[:,n], maxiter=maxiter, atol=0.0, **{BICGSTAB_RTOL: tol})
+
+    occupancy = get_occupancy(P, env, grids, env.tmax)
+    w = occupancy / np.sum(occupancy)
+    G = phi.T @ (w[:,None] * phi) + ridge * np.eye(phi.shape[1])
+    U = np.linalg.solve(G, phi.T @ (w[:,None] * psi)).T
+
+    # average over velocities, weighted by visits. Unvisited positions take the unweighted mean
+    vw = occupancy.reshape(-1, numv**env.statesize) + 1e-12
+    ca1 = np.sum(psi.reshape(vw.shape[0], vw.shape[1], -1) * vw[:,:,None],axis=1) / np.sum(vw,axis=1)[:,None]
+    return U, ca1, grids[0]
@@ -0,0 +1,163 @@
+# Parameter sweeps over the options of main.py, run on a process pool.
+# Every config is trained with run_experiment in a worker process, gets its own RNG stream spawned from
+# one SeedSequence, and is stored under outdir/runs so that an interrupted sweep resumes where it stopped. e.g.
+# python sweep.py --grid seed=0,1,2 noise=0.0,0.0001 --fixed "--episodes 5000 --llr 0.0001" --processes 8
+
+import os
+import sys
+import csv
+import time
+import zlib
+import argparse
+import pickle
+import itertools
+import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+    os.environ.setdefault(var, '1')  # runs are parallel already, threaded BLAS in every worker oversubscribes the cores
+os.environ.setdefault('MPLBACKEND', 'Agg')
+import numpy as np
+from experiment import get_parser, run_experiment
+
+
+def parse_grid(grid):
+    # ['seed=0,1,2', 'noise=0.0,0.001'] -> {'seed': ['0','1','2'], 'noise': ['0.0','0.001']}
+    # spaces separate the tokens of nargs='+' options, e.g. paramsindex="0 1 2,0"
+    options = {}
+    for item in grid:
+        name, values = item.split('=', 1)
+        options[name.lstrip('-')] = values.split(',')
+    return options
+
+def get_configs(options):
+    names = list(options)
+    return [dict(zip(names, values)) for values in itertools.product(*options.values())]
+
+def get_runname(config):
+    return '_'.join(f"{name}{value.replace(' ', '-')}" for name, value in config.items()) or 'default'
+
+def get_stream(rootseed, runname):
+    # child of SeedSequence(rootseed) as spawn() would make it, keyed by the run name instead of the
+    # position in the grid so that a run keeps its stream when the grid is extended
+    return np.random.SeedSequence(rootseed, spawn_key=(zlib.crc32(runname.encode()),))
+
+def get_argv(config, fixed, rngstate):
+    # plotting and the metrics process pool are off unless fixed turns them back on, the last occurrence of an
+    # option wins. The sweep already runs one worker per core, nested pools would oversubscribe them
+    argv = ['--plot', '0', '--processes', '0'] + fixed.split()
+    for name, value in config.items():
+        argv += [f'--{name}'] + value.split()
+    argv += ['--rngstate'] + [str(s) for s in rngstate]
+    return argv
+
+def run_config(runname, config, argv, outdir):
+    # train in this process and store the result, exceptions are recorded instead of stopping the sweep
+    start = time.time()
+    result = {'run': runname, 'config': config, 'argv': argv, 'status': 'ok', 'error': ''}
+    with open(os.path.join(outdir, 'logs', runname + '.log'), 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            args, unknown = get_parser().parse_known_args(argv)
+            if unknown:
+                raise ValueError(f'unrecognized arguments {unknown}')
+            run = run_experiment(args)
+            metrics = run.metrics or {}
+            result['args'] = vars(run.args)
+            result['score'] = metrics.get('score', np.nan)
+            result['drift'] = metrics.get('drift', np.nan)
+            result['allrewards'] = np.array(run.allrewards)
+            result['latencys'] = np.array(run.latencys)
+            result['flag'] = run.watchdog['reason']
+            if run.watchdog['stopped']:
+                result['status'] = 'flagged'  # stopped by the watchdog, not retried
+        except (Exception, SystemExit) as e:
+            traceback.print_exc(file=log)
+            result['status'] = 'failed'
+            result['error'] = repr(e)
+        finally:
+            if 'matplotlib.pyplot' in sys.modules:
+                sys.modules['matplotlib.pyplot'].close('all')
+        result['runtime'] = time.time() - start
+    with open(os.path.join(outdir, 'runs', runname + '.pickle'), 'wb') as file:
+        pickle.dump(result, file)
+    return result
+
+def load_result(outdir, runname):
+    filename = os.path.join(outdir, 'runs', runname + '.pickle')
+    if not os.path.isfile(filename):
+        return None
+    try:
+        with open(filename, 'rb') as file:
+            return pickle.load(file)
+    except Exception:
+        return None  # partially written by an interrupted run
+
+def store_summary(csvfile, results):
+    # one row per run with the full experiment options, like store_csv, rewritten from the run store
+    rows = []
+    for result in results:
+        row = {'run': result['run'], 'status': result['status'], 'runtime': result.get('runtime', np.nan), 'error': result['error']}
+        row.update(result.get('args', result['config']))
+        row['score'] = result.get('score', np.nan)
+        row['drift'] = result.get('drift', np.nan)
+        row['flag'] = result.get('flag', '')
+        rows.append(row)
+    csv_columns = list(dict.fromkeys(name for row in rows for name in row))
+    with open(csvfile, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=csv_columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def sweep(options, fixed='', outdir='./data/sweep/', processes=None, rootseed=0):
+    os.makedirs(os.path.join(outdir, 'runs'), exist_ok=True)
+    os.makedirs(os.path.join(outdir, 'logs'), exist_ok=True)
+
+    configs = get_configs(options)
+    runnames = [get_runname(config) for config in configs]
+    streams = [get_stream(rootseed, runname) for runname in runnames]
+
+    results = {}
+    tasks = []
+    for runname, config, stream in zip(runnames, configs, streams):
+        result = load_result(outdir, runname)
+        if result is not None and result['status'] in ['ok', 'flagged']:
+            results[runname] = result  # finished before, failed runs are retried
+        else:
+            tasks.append((runname, config, get_argv(config, fixed, stream.generate_state(4)), outdir))
+    print(f'{len(configs)} configs, {len(results)} done, {len(tasks)} to run')
+
+    def report(result):
+        results[result['run']] = result
+        print(f"{result['run']} {result['status']} score {result.get('score', np.nan):.3f} drift {result.get('drift', np.nan):.3f} {result['runtime']:.1f}s {result['error']}")
+
+    if processes == 0:
+        for task in tasks:
+            report(run_config(*task))
+    else:
+        # fork so that workers reuse the imports of this process and do not re-import the calling script
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            futures = {pool.submit(run_config, *task): task for task in tasks}
+            for future in as_completed(futures):
+                runname, config, argv, outdir = futures[future]
+                try:
+                    report(future.result())
+                except Exception as e:  # the worker itself died
+                    report({'run': runname, 'config': config, 'argv': argv, 'status': 'failed', 'error': repr(e), 'runtime': np.nan})
+
+    results = [results[runname] for runname in runnames]
+    store_summary(os.path.join(outdir, 'summary.csv'), results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grid', type=str, nargs='+', required=False, help='option=value1,value2 ... to sweep over', default=[])
+    parser.add_argument('--fixed', type=str, required=False, help='main.py options shared by all runs', default='')
+    parser.add_argument('--outdir', type=str, required=False, help='run store and summary.csv directory', default='./data/sweep/')
+    parser.add_argument('--processes', type=int, required=False, help='worker processes, 0 to run serially', default=None)
+    parser.add_argument('--rootseed', type=int, required=False, help='root of the per run SeedSequence streams', default=0)
+    args = parser.parse_args()
+
+    sweep(parse_grid(args.grid), args.fixed, args.outdir, args.processes, args.rootseed)
@@ -4,6 +4,8 @@ from scipy import stats
 from scipy.optimize import curve_fit
 import matplotlib.cm as cm
 from io import BytesIO
+import os
+import csv
 from model import *
 from scipy.stats import gaussian_kde
     
@@ -82,7 +84,8 @@ def flatten(xss):
     return np.array([x for xs in xss for x in xs],dtype=np.float32)
 
 
-def plot_analysis(logparams,rewards, allcoords, stable_perf, exptname=None , rsz=0.05):
+def plot_analysis(logparams,rewards, allcoords, stable_perf, exptname=None , rsz=0.05, metrics=None):
+    # metrics: optional output of compute_metrics, reused instead of recomputing the drift analysis
     f, axs = plt.subplots(7,3,figsize=(12,21))
     total_trials = len(logparams)-1
     gap = 25
@@ -122,7 +125,10 @@ def plot_analysis(logparams,rewards, allcoords, stable_perf, exptname=None , rsz
 
 
     ## drift
-    trials, pv_corr,rep_corr, startxcor, endxcor = get_pvcorr(logparams, stable_perf, total_trials, num=101)
+    if metrics is None:
+        trials, pv_corr,rep_corr, startxcor, endxcor = get_pvcorr(logparams, stable_perf, total_trials, num=101)
+    else:
+        trials, pv_corr,rep_corr, startxcor, endxcor = [metrics[k] for k in ['pv_trials', 'pv_corr', 'rep_corr', 'startxcor', 'endxcor']]
 
     plot_rep_sim(startxcor, stable_perf, ax=axs[4,0])
 
@@ -676,6 +682,46 @@ def saveload(filename, variable, opt):
             return pickle.load(file)
     
 
+def store_csv(csv_file, args, score, drift, flag=''):
+    # Extract all arguments from args namespace
+    arg_dict = dict(vars(args))
+    
+    # Add score, drift and the watchdog reason to the dictionary
+    arg_dict['score'] = score
+    arg_dict['drift'] = drift
+    arg_dict['flag'] = flag
+
+    # Create csv_columns from the keys of arg_dict
+    csv_columns = list(arg_dict.keys())
+
+    file_exists = os.path.isfile(csv_file)
+    
+    with open(csv_file, 'a' if file_exists else 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=csv_columns)
+        if not file_exists:
+            writer.writeheader()  # file doesn't exist yet, write a header
+        writer.writerow(arg_dict)
+
+
+def evaluate_loss(latencys, threshold=35, stability_window=10000, w1=1,w2=1, w3=1):
+    loss_vector = np.array(moving_average(latencys,20))
+    # Calculate convergence speed
+    try:
+        convergence_epoch = next(i for i, v in enumerate(loss_vector) if v < threshold)
+    except StopIteration:
+        convergence_epoch = len(loss_vector)
+    
+    # Calculate stability
+    stability = np.std(loss_vector[-stability_window:]) if len(loss_vector) >= stability_window else np.std(loss_vector)
+    
+    # Final loss value
+    final_loss = loss_vector[-1]
+
+    score = convergence_epoch*final_loss*stability
+    
+    return score
+
+
 def get_pvcorr(params, start, end, num):
     xs = np.linspace(-1,1,1001)
     startpcs = predict_batch_placecell(params[start], xs)
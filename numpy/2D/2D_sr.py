@@ -6,7 +6,7 @@ from env import *
 from utils import *
 from sr_utils import *
 import numpy as np
-from copy import deepcopy
+from store import SnapshotStore
 import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument('--episodes', type=int, required=False, help='episodes', default=50000)
@@ -23,6 +23,8 @@ parser.add_argument('--pcinit', type=str, required=False, help='pcinit', default
 parser.add_argument('--balpha', type=float, required=False, help='balpha', default=0.0)
 parser.add_argument('--noise', type=float, required=False, help='noise', default=0.000)
 parser.add_argument('--paramsindex', type=int,nargs='+', required=False, help='paramsindex', default=[])
+parser.add_argument('--srsnapshots', type=str, required=False, help='SR snapshot policy between the analysed trials: all, every:k or log:n', default='log:1000')
+parser.add_argument('--srcodec', type=str, required=False, help='compression of U-I: none, delta (sparse changes, best with all or every:k) or lowrank:r', default='none')
 args, unknown = parser.parse_known_args()
 
 
@@ -67,6 +69,8 @@ exptname = f'2D_obs_td_multi_0.0ns_012p_{npc}n_0.01plr_0.01clr_0.0llr_0.0alr_0.0
 # choose param 
 lr = 0.0025
 gamma = 0.999
+offline = True  # learn SR from the trajectories recorded during training instead of re-simulating each episode
+warmstart = False  # start TD from the closed form SR of the final policy instead of the identity
 
 # inner loop training loop
 def run_trial(params, env, U):
@@ -105,26 +109,41 @@ def run_trial(params, env, U):
     return U, np.array(coords)
 
 
-allcoords = []
-Us = []
-ca1s = []
-U = np.eye(npc)
-Us.append(deepcopy(U))
-env = NDimNav(startcoord=startcoord, goalcoord=goalcoord, goalsize=goalsize, tmax=tmax, 
+if warmstart:
+    env = NDimNav(startcoord=startcoord, goalcoord=goalcoord, goalsize=goalsize, tmax=tmax, 
                     maxspeed=maxspeed,envsize=envsize, nact=nact, max_reward=max_reward, obstacles=obs)
+    U0, ca1_ref, xs_ref = solve_sr(logparams[train_episodes-1], env, gamma)
+else:
+    U0 = np.eye(npc)
 
-for episode in range(train_episodes):
+# float32 snapshots of U-I, 441x441 per episode does not fit in memory for 50000 episodes
+# trials read from Us below are kept under any srsnapshots policy
+srtrials = [0, 1000, 5000, 10000, 50000, train_episodes]
+Us = SnapshotStore('Us', args.srsnapshots, train_episodes+1, dtype=np.float32, base=np.eye(npc), codec=args.srcodec, keep=srtrials)
+if offline:
+    allcoords = allcoords[:train_episodes]
+    U, Us = learn_sr_offline(logparams, allcoords, lr, gamma, U=U0, store=Us)
+    print(f'Trial {train_episodes}, U {np.max(U)}, {Us.nbytes/1024**2:.0f} MB')
+else:
+    allcoords = []
+    ca1s = []
+    U = U0.copy()
+    Us.append(U)
+    env = NDimNav(startcoord=startcoord, goalcoord=goalcoord, goalsize=goalsize, tmax=tmax, 
+                        maxspeed=maxspeed,envsize=envsize, nact=nact, max_reward=max_reward, obstacles=obs)
 
-    params = logparams[episode]
+    for episode in range(train_episodes):
 
-    U, coords = run_trial(params, env,U)
+        params = logparams[episode]
 
-    Us.append(deepcopy(U))
-    allcoords.append(coords)
+        U, coords = run_trial(params, env,U)
 
-    print(f'Trial {episode+1}, U {np.max(Us[-1])}')
+        Us.append(U)
+        allcoords.append(coords)
 
-# saveload(f'./data/2D_sr_{lr}_{exptname}',[Us], 'save')
+        print(f'Trial {episode+1}, U {np.max(U)}')
+
+saveload(f'./data/2D_sr_{lr}_{exptname}',[Us], 'save')  # thinned float32 history, loads with store.py on the path
 
 plot_trajectory(allcoords, -1)
 
@@ -134,7 +153,7 @@ plot_all_sr_pc(Us, ca3, train_episodes)
 
 
 some_Us = []
-for trial in [0, 1000,5000,10000,50000]:
+for trial in srtrials[:-1]:
     some_Us.append(Us[trial])
 saveload(f'./data/2D_some_sr_{lr}_{exptname}',[some_Us], 'save')
 
@@ -1,17 +1,18 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 class NDimNav:
-    def __init__(self,nact=4,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=300, goalcoord=[0.8,0.8], startcoord=[[-0.8,-0.8]], max_reward=5, obstacles=True, obscoord=[-0.2,0.2,-1,0.5],rtype='gauss') -> None:
+    def __init__(self,nact=4,maxspeed=0.1, envsize=1, goalsize=0.1, tmax=300, goalcoord=[0.8,0.8], startcoord=[[-0.8,-0.8]], max_reward=5, obstacles=True, obscoord=[-0.2,0.2,-1,0.5],rtype='gauss', rng=None, dtype=np.float64) -> None:
         self.tmax = tmax  # maximum steps per trial
+        self.rng = np.random if rng is None else rng  # numpy Generator, the global numpy RNG by default
         self.minsize = -envsize  # arena size
         self.maxsize = envsize
-        self.state = np.zeros(2)
+        self.dtype = dtype  # of states, velocities and rewards
+        self.state = np.zeros(2, dtype=dtype)
         self.done = False
         self.goalsize = goalsize
-        self.goals = np.array(goalcoord)
-        self.starts = np.array(startcoord)
+        self.goals = np.array(goalcoord, dtype=dtype)
+        self.starts = np.array(startcoord, dtype=dtype)
         self.statesize = 2
         self.actionsize = nact
         self.maxspeed = maxspeed  # max agent speed per step
@@ -31,20 +32,22 @@ class NDimNav:
             [1,0],  # right
             [0,-1],  # down
             [-1,0]  # left
-        ])
+        ], dtype=dtype)
 
     def reward_func(self,x, threshold=0):
         rx =  self.amp * np.exp(-0.5 * np.sum(((x - self.goal) / self.goalsize) ** 2))
         return rx * (rx>threshold)
     
     def action2velocity(self, g):
-        # convert onehot action vector from actor to velocity
+        # convert onehot action vector or action index from actor to velocity
+        if np.ndim(g) == 0:
+            return self.onehot2dirmat[g]
         return np.matmul(g, self.onehot2dirmat)
 
     
     def reset(self):
         if len(self.starts) > 1:
-            startidx = np.random.choice(np.arange(len(self.starts)),1)
+            startidx = self.rng.choice(np.arange(len(self.starts)),1)
             self.state = self.starts[startidx].copy()[0]
         else:
             self.state = self.starts.copy()
@@ -61,7 +64,7 @@ class NDimNav:
         self.track.append(self.goal.copy())
         self.track.append(self.state.copy())
 
-        self.velocity = np.zeros(self.statesize)
+        self.velocity = np.zeros(self.statesize, dtype=self.dtype)
 
         #print(f"State: {self.state}, Goal: {self.goal}")
         return self.state, self.goal, self.reward, self.done
@@ -78,13 +81,13 @@ class NDimNav:
         # check if new state crosses boundary
         if (newstate > self.maxsize).any() or (newstate < self.minsize).any():
             newstate = self.state.copy()
-            self.velocity = np.zeros(self.statesize)
+            self.velocity = np.zeros(self.statesize, dtype=self.dtype)
 
         # check if new state crosses obstacles if initalized
         if self.obstacles:
             if self.obscoords[0]<newstate[0] <self.obscoords[1] and self.obscoords[2]<newstate[1] <self.obscoords[3]:
                 newstate = self.state.copy()
-                self.velocity = np.zeros(self.statesize)
+                self.velocity = np.zeros(self.statesize, dtype=self.dtype)
 
         # if new state does not violate boundary or obstacles, update new state
         self.state = newstate.copy()
@@ -111,6 +114,7 @@ class NDimNav:
         return self.state, self.reward, self.done
 
     def plot_trajectory(self, title=None):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(3,2))
         plt.title(f'2D {title}')
         plt.axis([self.minsize, self.maxsize, self.minsize, self.maxsize])
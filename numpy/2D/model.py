@@ -1,10 +1,5 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import stats
-from scipy.optimize import curve_fit
-import os
-import csv
-import matplotlib.cm as cm
+from copy import deepcopy
 
 def invert_matrices(tensor):
     """ Compute the inverse for each 2x2 matrix in an N x 2 x 2 tensor efficiently using vectorized operations. """
@@ -18,7 +13,7 @@ def invert_matrices(tensor):
     determinant = a * d - b * c
     
     # Compute the inverse of each matrix
-    inv_tensor = np.empty((tensor.shape[0], 2, 2))
+    inv_tensor = np.empty((tensor.shape[0], 2, 2), dtype=tensor.dtype)
     inv_tensor[:, 0, 0] = d / determinant
     inv_tensor[:, 0, 1] = -b / determinant
     inv_tensor[:, 1, 0] = -c / determinant
@@ -51,6 +46,92 @@ def random_all_pc_weights(npc, nact,seed,sigma=0.1, alpha=1,envsize=1):
     return [np.array(pc_cent), np.array(pc_sigma), np.array(pc_constant), 
     1e-5 * np.random.normal(size=(npc,nact)), 1e-5 * np.random.normal(size=(npc,1))]
 
+class PlaceFieldParams:
+    # params in one contiguous buffer of dtype, float64 by default. Indexing and unpacking give the views centers,
+    # sigmas, amps, actor and critic in the order of the params list, assigning to an index copies into the view.
+    # copy() is a single memcpy and the buffer can be shared with worker processes,
+    # e.g. from_flat(np.ndarray(n, buffer=shm.buf), shapes).
+    names = ('centers', 'sigmas', 'amps', 'actor', 'critic')
+
+    def __init__(self, params, dtype=float):
+        shapes = [np.shape(p) for p in params]
+        self.set_layout(np.empty(sum(int(np.prod(shape)) for shape in shapes), dtype=dtype), shapes)
+        for view, p in zip(self.views, params):
+            view[...] = p
+
+    @classmethod
+    def from_flat(cls, flat, shapes):
+        # views onto an existing buffer without copying
+        self = cls.__new__(cls)
+        self.set_layout(flat, shapes)
+        return self
+
+    def set_layout(self, flat, shapes):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.offsets = [0] + np.cumsum(self.sizes).tolist()
+        self.set_flat(flat)
+
+    def set_flat(self, flat):
+        self.flat = flat
+        self.views = [flat[start:end].reshape(shape) for start, end, shape in zip(self.offsets[:-1], self.offsets[1:], self.shapes)]
+        self.etas = None
+        self.gradbuf = None
+
+    centers = property(lambda self: self.views[0])
+    sigmas = property(lambda self: self.views[1])
+    amps = property(lambda self: self.views[2])
+    actor = property(lambda self: self.views[3])
+    critic = property(lambda self: self.views[4])
+
+    def __getitem__(self, p):
+        return self.views[p]
+
+    def __setitem__(self, p, value):
+        if value is not self.views[p]:  # params[p] += x has already updated the view in place
+            self.views[p][...] = value
+
+    def __len__(self):
+        return len(self.views)
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def copy(self):
+        other = PlaceFieldParams.__new__(PlaceFieldParams)
+        other.shapes, other.sizes, other.offsets = self.shapes, self.sizes, self.offsets
+        other.set_flat(self.flat.copy())
+        return other
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return PlaceFieldParams.from_flat, (self.flat, self.shapes)
+
+    def tolist(self):
+        return [view.copy() for view in self.views]
+
+    def update(self, etas, grads):
+        # params[p] += etas[p] * grads[p] for all p as one op over the buffer
+        if self.etas != tuple(etas):
+            self.etas = tuple(etas)
+            self.etavec = np.repeat(self.etas, self.sizes)
+            self.gradbuf = np.empty_like(self.flat)
+        np.concatenate([np.ravel(grad) for grad in grads], out=self.gradbuf)
+        self.gradbuf *= self.etavec
+        self.flat += self.gradbuf
+
+    def add(self, indices, flat):
+        # adds flat, laid out as the parameters in indices one after another, in one op when they are adjacent
+        if list(indices) == list(range(indices[0], indices[-1]+1)):
+            self.flat[self.offsets[indices[0]]:self.offsets[indices[-1]+1]] += flat
+        else:
+            start = 0
+            for p in indices:
+                self.flat[self.offsets[p]:self.offsets[p+1]] += flat[start:start+self.sizes[p]]
+                start += self.sizes[p]
+
 def predict_placecell(params, x):
     pc_centers, pc_sigmas, pc_constant, actor_weights, critic_weights = params
     inv_sigma = invert_matrices(pc_sigmas)  # Shape: (npc, dim, dim)
@@ -88,12 +169,253 @@ def get_onehot_action(prob, nact=4):
     onehotg[A] = 1
     return onehotg
 
-def learn(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha=0.0, noise=0.0, paramsindex=[], beta=1):
+def get_onehot(action, nact, dtype=float):
+    onehotg = np.zeros(nact, dtype=dtype)
+    onehotg[action] = 1
+    return onehotg
+
+class ActionSampler:
+    # categorical action sampling by inverse CDF over blocks of uniforms drawn from a numpy Generator,
+    # returns integer action indices
+    def __init__(self, rng=None, block=4096):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.uniforms = self.rng.random(block)
+        self.i = 0
+
+    def sample(self, prob):
+        if self.i == len(self.uniforms):
+            self.rng.random(out=self.uniforms)
+            self.i = 0
+        u = self.uniforms[self.i]
+        self.i += 1
+        cdf = np.asarray(prob).cumsum()
+        return min(int(cdf.searchsorted(u * cdf[-1], side='right')), len(cdf)-1)
+
+class NoiseSource:
+    # Gaussian parameter noise pre-generated in blocks of steps from a numpy Generator. next() returns one view
+    # per noisy parameter, valid until the following call. scales multiply noise per parameter, float32 halves
+    # the generation cost. tau > 0 gives temporally correlated Ornstein-Uhlenbeck drift with correlation time tau
+    # steps and the same stationary std as the white noise.
+    def __init__(self, shapes, noise, rng=None, block=1024, dtype=np.float64, scales=None, tau=0.0):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.shapes = [tuple(shape) for shape in shapes]
+        sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int)
+        scales = np.ones(len(sizes)) if scales is None or len(scales) == 0 else np.broadcast_to(scales, len(sizes))
+        self.scale = (noise * np.repeat(scales, sizes)).astype(dtype)
+        self.dtype = np.dtype(dtype)
+        self.tau = tau
+        self.decay = np.exp(-1/tau) if tau > 0 else 0.0
+        self.block = np.empty((block, self.offsets[-1]), dtype=dtype)
+        self.views = [self.block[:,start:end].reshape((block,)+shape) for start, end, shape in zip(self.offsets[:-1], self.offsets[1:], self.shapes)]
+        if tau > 0:
+            self.zi = (self.decay * self.rng.standard_normal(self.offsets[-1]))[None,:]  # stationary start
+        self.i = block
+
+    def refill(self):
+        self.rng.standard_normal(out=self.block, dtype=self.dtype)
+        if self.tau > 0:
+            from scipy.signal import lfilter
+            # x_t = decay x_t-1 + sqrt(1 - decay^2) eps_t along the steps of the block
+            self.block[:], self.zi = lfilter([np.sqrt(1 - self.decay**2)], [1, -self.decay], self.block, axis=0, zi=self.zi)
+        self.block *= self.scale
+        self.i = 0
+
+    def next(self):
+        if self.i == len(self.block):
+            self.refill()
+        i = self.i
+        self.i += 1
+        return [view[i] for view in self.views]
+
+    def next_flat(self):
+        # the noise of all parameters of one step as a single vector
+        if self.i == len(self.block):
+            self.refill()
+        self.i += 1
+        return self.block[self.i-1]
+
+class LearnWorkspace:
+    # preallocated buffers for learn and learn_diag with ws=LearnWorkspace(npc, nact). Every intermediate is written
+    # through out= or in place, so the per step path allocates no arrays. The two operand einsums run as single pass
+    # contractions, the sigma gradient einsum is factored into a row sum of inv_sigma and a batched matmul, which is
+    # 4x faster and equal up to rounding. The returned grads are views into the workspace, overwritten by the next step.
+    def __init__(self, npc, nact, dtype=float):
+        self.inv_sigma = np.empty((npc, 2, 2), dtype=dtype)
+        self.det = np.empty(npc, dtype=dtype)
+        self.mask = np.empty(npc, dtype=bool)
+        self.tmp = np.empty(npc, dtype=dtype)
+        self.diff = np.empty((npc, 2), dtype=dtype)
+        self.exponent = np.empty(npc, dtype=dtype)
+        self.amp2 = np.empty(npc, dtype=dtype)
+        self.pcact = np.empty(npc, dtype=dtype)
+        self.newpcact = np.empty(npc, dtype=dtype)
+        self.value = np.empty(1, dtype=dtype)
+        self.newvalue = np.empty(1, dtype=dtype)
+        self.onehot = np.zeros(nact, dtype=dtype)
+        self.decay = np.empty((nact, 1), dtype=dtype)
+        self.post_td = np.empty((npc, 1), dtype=dtype)
+        self.pcpost = np.empty((npc, 1), dtype=dtype)
+        self.outer = np.empty((npc, 2, 2), dtype=dtype)
+        self.rowsum = np.empty((npc, 2), dtype=dtype)
+        self.l1_grad = np.empty(npc, dtype=dtype)
+        self.dpcc = np.empty((npc, 2), dtype=dtype)
+        self.dpcs = np.empty((npc, 2, 2), dtype=dtype)
+        self.dpca = np.empty(npc, dtype=dtype)
+        self.dact = np.empty((npc, nact), dtype=dtype)
+        self.dcri = np.empty((npc, 1), dtype=dtype)
+        self.grads = [self.dpcc, self.dpcs, self.dpca, self.dact, self.dcri]
+        self.noise = [np.empty_like(g) for g in self.grads]  # parameter noise drawn without a NoiseSource
+
+    def invert(self, pc_sigmas):
+        # invert_matrices into inv_sigma
+        a, b, c, d = pc_sigmas[:, 0, 0], pc_sigmas[:, 0, 1], pc_sigmas[:, 1, 0], pc_sigmas[:, 1, 1]
+        np.multiply(a, d, out=self.det)
+        np.multiply(b, c, out=self.tmp)
+        self.det -= self.tmp
+        np.divide(d, self.det, out=self.inv_sigma[:, 0, 0])
+        np.divide(b, self.det, out=self.inv_sigma[:, 0, 1])
+        np.negative(self.inv_sigma[:, 0, 1], out=self.inv_sigma[:, 0, 1])
+        np.divide(c, self.det, out=self.inv_sigma[:, 1, 0])
+        np.negative(self.inv_sigma[:, 1, 0], out=self.inv_sigma[:, 1, 0])
+        np.divide(a, self.det, out=self.inv_sigma[:, 1, 1])
+        return self.inv_sigma
+
+    def placecell(self, pc_centers, pc_constant, x, out):
+        # predict_placecell with inv_sigma from invert
+        np.subtract(x, pc_centers, out=self.diff)
+        np.einsum('ni,nij,nj->n', self.diff, self.inv_sigma, self.diff, out=self.exponent)
+        self.exponent *= -0.5
+        np.exp(self.exponent, out=out)
+        np.square(pc_constant, out=self.amp2)
+        out *= self.amp2
+        return out
+
+    def correct_covariance(self, matrices, min_val=1e-5, max_val=0.5):
+        # correct_covariance_matrices in place
+        a, b, c, d = matrices[:, 0, 0], matrices[:, 0, 1], matrices[:, 1, 0], matrices[:, 1, 1]
+        np.add(b, c, out=self.tmp)  # symmetrize, (m + m^T)/2 leaves the diagonal unchanged
+        self.tmp /= 2
+        b[...] = self.tmp
+        c[...] = self.tmp
+        np.clip(a, min_val, max_val, out=a)
+        np.clip(d, min_val, max_val, out=d)
+        np.clip(b, -max_val, max_val, out=b)
+        np.clip(c, -max_val, max_val, out=c)
+        np.multiply(a, d, out=self.det)
+        np.square(b, out=self.tmp)
+        self.det -= self.tmp
+        if np.less_equal(self.det, 0, out=self.mask).any():
+            matrices[...] = correct_covariance_matrices(matrices, min_val, max_val)  # rare, adjust off-diagonals
+        return matrices
+
+def learn_ws(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha, noise, paramsindex, beta, lstd, rng, noisesource, ws, diag=False, timer=None):
+    # learn and learn_diag on the buffers of a LearnWorkspace
     pc_centers, pc_sigmas, pc_constant, actor_weights, critic_weights = params
+    if np.ndim(onehotg) == 0:  # action index from ActionSampler
+        ws.onehot[:] = 0
+        ws.onehot[onehotg] = 1
+        onehotg = ws.onehot
+
+    # Predict place cell activations, the fields do not change before the gradients so invert once
+    inv_sigma = ws.invert(pc_sigmas)
+    pcact = ws.placecell(pc_centers, pc_constant, state, ws.pcact)
+    newpcact = ws.placecell(pc_centers, pc_constant, newstate, ws.newpcact)
+
+    if lstd is not None:
+        update_lstd(lstd, reward, pcact, newpcact, gamma)  # statistics for the least squares critic
+
+    # Predict values
+    value = np.dot(pcact, critic_weights, out=ws.value)[0]
+    newvalue = np.dot(newpcact, critic_weights, out=ws.newvalue)[0]
+    td = reward + gamma * newvalue - value
+
+    np.sign(pc_constant, out=ws.l1_grad)
+    ws.l1_grad *= balpha
+
+    # Critic grads
+    np.multiply(pcact[:, None], td, out=ws.dcri)
+
+    # Actor grads
+    np.subtract(onehotg, aprob, out=ws.decay[:, 0])
+    ws.decay *= beta
+    np.dot(pcact[:, None], ws.decay.T, out=ws.dact)
+    ws.dact *= td
+
+    # Grads for field parameters
+    np.dot(actor_weights, ws.decay, out=ws.post_td)
+    ws.post_td += critic_weights
+    ws.post_td *= td
+    np.multiply(ws.post_td, pcact[:, None], out=ws.pcpost)
+
+    np.subtract(state, pc_centers, out=ws.diff)
+    np.einsum('nj,nk->njk', ws.diff, ws.diff, out=ws.outer)
+    # einsum('njl,njk,nik->nji', inv_sigma, outer, inv_sigma) = sum_l inv_sigma[n,j,l] * (outer @ inv_sigma^T)[n,j,i]
+    np.add(inv_sigma[:, :, 0], inv_sigma[:, :, 1], out=ws.rowsum)
+    np.matmul(ws.outer, inv_sigma.transpose(0, 2, 1), out=ws.dpcs)
+    ws.dpcs *= ws.rowsum[:, :, None]
+    np.multiply(ws.pcpost, 0.5, out=ws.post_td)  # post_td is not needed any more
+    ws.dpcs *= ws.post_td[:, :, None]
+    if diag:
+        ws.dpcs[:, 0, 1] = 0
+        ws.dpcs[:, 1, 0] = 0
+
+    np.einsum('nji,nj->ni', inv_sigma, ws.diff, out=ws.dpcc)
+    ws.dpcc *= ws.pcpost
+    np.divide(2, pc_constant, out=ws.dpca)
+    ws.dpca *= ws.pcpost[:, 0]
+    ws.dpca -= ws.l1_grad
+
+    grads = ws.grads
+
+    if isinstance(params, PlaceFieldParams):
+        params.update(etas, grads)
+    else:
+        for p in range(len(params)):
+            params[p] += etas[p] * grads[p]
+
+    if timer is not None:
+        timer.lap('learn')
+
+    if noisesource is not None and isinstance(params, PlaceFieldParams):
+        params.add(paramsindex, noisesource.next_flat())
+    elif noisesource is not None:
+        for p, ns in zip(paramsindex, noisesource.next()):
+            params[p] += ns
+    elif noise > 0:
+        for p in paramsindex:
+            ns = ws.noise[p]
+            if isinstance(rng, np.random.Generator):
+                rng.standard_normal(out=ns, dtype=ns.dtype)
+            else:  # np.random has no out=
+                ns[...] = rng.normal(size=ns.shape)
+            ns *= noise
+            params[p] += ns
+    if timer is not None:
+        timer.lap('noise')
+
+    if not diag:
+        # clip large fields
+        np.clip(params[2], 1e-5, 2, out=params[2])
+        ws.correct_covariance(params[1], 1e-5, 0.5)
+        if timer is not None:
+            timer.lap('projection')
+
+    return params, grads, td
+
+def learn(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha=0.0, noise=0.0, paramsindex=[], beta=1, lstd=None, rng=np.random, noisesource=None, ws=None, timer=None):
+    if ws is not None:
+        return learn_ws(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha, noise, paramsindex, beta, lstd, rng, noisesource, ws, timer=timer)
+    pc_centers, pc_sigmas, pc_constant, actor_weights, critic_weights = params
+    if np.ndim(onehotg) == 0:  # action index from ActionSampler
+        onehotg = get_onehot(onehotg, len(aprob), aprob.dtype)
     
     # Predict place cell activations
     pcact = predict_placecell(params, state)
     newpcact = predict_placecell(params, newstate)
+
+    if lstd is not None:
+        update_lstd(lstd, reward, pcact, newpcact, gamma)  # statistics for the least squares critic
     
     # Predict values
     value = np.dot(pcact, critic_weights)
@@ -122,20 +444,137 @@ def learn(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha=0
 
     grads = [dpcc, dpcs, dpca, dact, dcri]  # dpcc needs to be transposed back
     
-    for p in range(len(params)):
-        params[p] += etas[p] * grads[p]
+    if isinstance(params, PlaceFieldParams):
+        params.update(etas, grads)
+    else:
+        for p in range(len(params)):
+            params[p] += etas[p] * grads[p]
     
-    for p in paramsindex:
-        ns = np.random.normal(size=params[p].shape) * noise
-        params[p] += ns
+    if timer is not None:
+        timer.lap('learn')
+
+    if noisesource is not None and isinstance(params, PlaceFieldParams):
+        params.add(paramsindex, noisesource.next_flat())
+    elif noisesource is not None:
+        for p, ns in zip(paramsindex, noisesource.next()):
+            params[p] += ns
+    elif noise > 0:  # no draws at all without noise
+        for p in paramsindex:
+            ns = rng.normal(size=params[p].shape) * noise
+            params[p] += ns
+    if timer is not None:
+        timer.lap('noise')
 
     # clip large fields
     params[2] = np.clip(params[2], 1e-5,2)
     params[1] = correct_covariance_matrices(params[1],1e-5, 0.5)
+    if timer is not None:
+        timer.lap('projection')
     
     return params, grads, td
 
 
+def learn_batch(params, rewards, newstates, states, actions, aprobs, gamma, etas, balpha=0.0, noise=0.0, paramsindex=[], beta=1, lstd=None, rng=np.random, noisesource=None):
+    # learn for k transitions with the parameters held fixed. The gradients are summed over the batch as matrix
+    # products, Phi^T td for the critic, Phi^T (td (onehot - pi)) for the actor and td weighted sums of the
+    # displacements for the fields, and applied as one update. Equal to k calls of learn to first order in the
+    # learning rates, see get_batch_error.
+    pc_centers, pc_sigmas, pc_constant, actor_weights, critic_weights = params
+    rewards = np.asarray(rewards, dtype=float)
+    k, nact = len(rewards), aprobs.shape[1]
+
+    inv_sigma = invert_matrices(pc_sigmas)
+    def batch_placecell(xs):
+        diff = xs[:,None,:] - pc_centers  # (k, npc, dim)
+        return np.exp(-0.5 * np.einsum('kni,nij,knj->kn', diff, inv_sigma, diff)) * pc_constant**2, diff
+    pcacts, df = batch_placecell(np.asarray(states))
+    newpcacts, _ = batch_placecell(np.asarray(newstates))
+
+    if lstd is not None:
+        for pcact, newpcact, reward in zip(pcacts, newpcacts, rewards):
+            update_lstd(lstd, reward, pcact, newpcact, gamma)
+
+    tds = rewards + gamma * (newpcacts @ critic_weights)[:,0] - (pcacts @ critic_weights)[:,0]
+
+    l1_grad = balpha * np.sign(pc_constant)
+
+    # Critic and actor grads
+    dcri = pcacts.T @ tds[:,None]
+    decay = beta * (np.eye(nact)[actions] - aprobs)
+    dact = pcacts.T @ (tds[:,None] * decay)
+
+    # Grads for field parameters, post_td * pcact for every transition (k, npc)
+    post_td = (decay @ actor_weights.T + critic_weights.T) * tds[:,None] * pcacts
+
+    # sums over the batch of post_td df and post_td df df^T, then the same contractions as learn
+    wdf = np.einsum('kn,knj->nj', post_td, df)
+    wouter = np.einsum('kn,knj,knl->njl', post_td, df, df)
+    dpcs = 0.5 * np.sum(inv_sigma, axis=2)[:,:,None] * np.matmul(wouter, inv_sigma.transpose(0,2,1))
+    dpcc = np.einsum('nji,nj->ni', inv_sigma, wdf)
+    dpca = np.sum(post_td, axis=0) * (2/pc_constant) - k * l1_grad
+
+    grads = [dpcc, dpcs, dpca, dact, dcri]
+
+    if isinstance(params, PlaceFieldParams):
+        params.update(etas, grads)
+    else:
+        for p in range(len(params)):
+            params[p] += etas[p] * grads[p]
+
+    # noise of the k steps
+    if noisesource is not None and isinstance(params, PlaceFieldParams):
+        params.add(paramsindex, np.sum([noisesource.next_flat() for _ in range(k)], axis=0))
+    elif noisesource is not None:
+        for _ in range(k):
+            for p, ns in zip(paramsindex, noisesource.next()):
+                params[p] += ns
+    elif noise > 0:  # no draws at all without noise
+        for p in paramsindex:
+            params[p] += rng.normal(size=(k,)+params[p].shape).sum(axis=0) * noise
+
+    # clip large fields
+    params[2] = np.clip(params[2], 1e-5,2)
+    params[1] = correct_covariance_matrices(params[1],1e-5, 0.5)
+
+    return params, tds
+
+def get_batch_error(params, rewards, newstates, states, actions, aprobs, gamma, etas, balpha=0.0, beta=1):
+    # largest deviation of learn_batch from k per step learn updates, both without noise, relative to the
+    # magnitude of each parameter before or after the updates. The deviation is second order in the learning
+    # rates, so the error shrinks about linearly with them. At init the actor and critic weights are ~1e-5 and
+    # set the scale of their block from the updated values.
+    sequential = deepcopy(params)
+    for reward, newstate, state, action, aprob in zip(rewards, newstates, states, actions, aprobs):
+        sequential, grads, td = learn(sequential, reward, newstate, state, action, aprob, gamma, etas, balpha, beta=beta)
+    batched, tds = learn_batch(deepcopy(params), rewards, newstates, states, actions, aprobs, gamma, etas, balpha, beta=beta)
+    error = 0.0
+    for p in range(len(params)):
+        scale = max(np.max(np.abs(params[p])), np.max(np.abs(sequential[p])))
+        if scale > 0:
+            error = max(error, np.max(np.abs(batched[p] - sequential[p])) / scale)
+    return error
+
+
+# least squares TD critic for fixed place fields. Keeps A^-1 and b, with A = ridge I + sum phi (phi - gamma phi')^T and
+# b = sum phi r, so that each step is a Sherman-Morrison rank-1 update and the critic weights are A^-1 b.
+def init_lstd(npc, ridge=1e-3):
+    return [np.eye(npc)/ridge, np.zeros((npc,1))]
+
+def update_lstd(lstd, reward, pcact, newpcact, gamma):
+    Ainv, b = lstd
+    u = pcact[:,None]
+    v = (pcact - gamma * newpcact)[:,None]
+    Au = Ainv @ u
+    vA = v.T @ Ainv
+    Ainv -= (Au @ vA) / (1 + vA @ u)
+    b += u * reward
+    return lstd
+
+def solve_lstd(lstd):
+    Ainv, b = lstd
+    return Ainv @ b
+
+
 def get_discounted_rewards(rewards, gamma=0.9, norm=False):
     discounted_rewards = []
     cumulative = 0
@@ -175,13 +614,20 @@ def correct_covariance_matrices(matrices, min_val=1e-5, max_val=0.5):
 
     return matrices
 
-def learn_diag(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha=0.0, noise=0.0, paramsindex=[], beta=1):
+def learn_diag(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha=0.0, noise=0.0, paramsindex=[], beta=1, lstd=None, rng=np.random, noisesource=None, ws=None, timer=None):
     # update only diagonal elements
+    if ws is not None:
+        return learn_ws(params, reward, newstate, state, onehotg, aprob, gamma, etas, balpha, noise, paramsindex, beta, lstd, rng, noisesource, ws, diag=True, timer=timer)
     pc_centers, pc_sigmas, pc_constant, actor_weights, critic_weights = params
+    if np.ndim(onehotg) == 0:  # action index from ActionSampler
+        onehotg = get_onehot(onehotg, len(aprob), aprob.dtype)
     
     # Predict place cell activations
     pcact = predict_placecell(params, state)
     newpcact = predict_placecell(params, newstate)
+
+    if lstd is not None:
+        update_lstd(lstd, reward, pcact, newpcact, gamma)  # statistics for the least squares critic
     
     # Predict values
     value = np.dot(pcact, critic_weights)
@@ -210,11 +656,25 @@ def learn_diag(params, reward, newstate, state, onehotg, aprob, gamma, etas, bal
 
     grads = [dpcc, dpcs, dpca, dact, dcri]  # dpcc needs to be transposed back
     
-    for p in range(len(params)):
-        params[p] += etas[p] * grads[p]
+    if isinstance(params, PlaceFieldParams):
+        params.update(etas, grads)
+    else:
+        for p in range(len(params)):
+            params[p] += etas[p] * grads[p]
     
-    for p in paramsindex:
-        ns = np.random.normal(size=params[p].shape) * noise
-        params[p] += ns
+    if timer is not None:
+        timer.lap('learn')
+
+    if noisesource is not None and isinstance(params, PlaceFieldParams):
+        params.add(paramsindex, noisesource.next_flat())
+    elif noisesource is not None:
+        for p, ns in zip(paramsindex, noisesource.next()):
+            params[p] += ns
+    elif noise > 0:  # no draws at all without noise
+        for p in paramsindex:
+            ns = rng.normal(size=params[p].shape) * noise
+            params[p] += ns
+    if timer is not None:
+        timer.lap('noise')
 
     return params, grads, td
\ No newline at end of file
@@ -0,0 +1,245 @@
+import sys
+import numpy as np
+
+# per episode histories (logparams, allcoords, SR matrices) with a snapshot policy and memory accounting.
+# Policies: 'all' keeps every snapshot, 'every:k' every k-th, 'log:n' about n log spaced ones, 'none' only the last.
+# Positions in keep (e.g. the trials an analysis reads) are kept under any policy.
+# Array snapshots and PlaceFieldParams can be stored as dtype (float32, or bfloat16 emulated as uint16) relative to a base (e.g. the identity for SR matrices U-I),
+# and compressed with codec 'lowrank:r' (rank r SVD factors) or 'delta' (sparse changes from the previous kept
+# snapshot, entries below tol dropped, with a full keyframe every keyframe snapshots).
+
+
+def get_nbytes(x):
+    # bytes held by a snapshot: arrays, PlaceFieldParams (one flat buffer) and lists of them
+    if isinstance(x, np.ndarray):
+        return x.nbytes
+    if hasattr(x, 'flat') and isinstance(x.flat, np.ndarray):
+        return x.flat.nbytes
+    if isinstance(x, (list, tuple)):
+        return sum(get_nbytes(v) for v in x)
+    if isinstance(x, np.generic):
+        return x.itemsize
+    return sys.getsizeof(x)
+
+
+def get_itemsize(dtype):
+    # bytes per stored number, bfloat16 keeps the upper half of a float32
+    return 2 if dtype == 'bfloat16' else np.dtype(dtype).itemsize
+
+
+def to_bfloat16(x):
+    # float32 rounded to nearest even at 8 mantissa bits, as the upper 16 bits. For finite values
+    bits = np.ascontiguousarray(x, dtype=np.float32).view(np.uint32)
+    return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+
+
+def from_bfloat16(x):
+    return (x.astype(np.uint32) << 16).view(np.float32)
+
+
+def set_dtype(x, dtype, copy=True):
+    return to_bfloat16(x) if dtype == 'bfloat16' else x.astype(dtype, copy=copy)
+
+
+def get_float(x):
+    return from_bfloat16(x) if x.dtype == np.uint16 else x
+
+
+def get_kept(policy, total, keep=()):
+    # indices below total that a policy keeps, the last index and those in keep are always kept
+    keep = [k for k in keep if 0 <= k < total]
+    if policy == 'all':
+        return np.arange(total)
+    if policy == 'none':
+        return np.union1d(keep, [total-1]).astype(int) if total > 0 else np.array([], dtype=int)
+    name, num = policy.split(':')
+    if name == 'every':
+        kept = np.arange(0, total, int(num))
+    elif name == 'log':
+        kept = np.unique(np.geomspace(1, total, int(num)).astype(int)) - 1 if total > 0 else np.array([], dtype=int)
+        kept = np.union1d([0], kept) if total > 0 else kept
+    else:
+        raise ValueError(f'unknown snapshot policy {policy}')
+    return np.union1d(kept, keep + [total-1]).astype(int) if total > 0 else kept
+
+
+class SnapshotStore:
+    # list like history indexed by append position. Skipped positions return the latest kept snapshot before
+    # them, so analyses indexing logparams[trial] still run on a thinned history. With total, the policy is
+    # resolved against the final length, otherwise 'log' is not available.
+    def __init__(self, name, policy='all', total=None, dtype=None, base=None, codec='none', tol=1e-6, keyframe=64, keep=()):
+        self.name = name
+        self.total = total
+        self.keep = set(int(k) for k in keep)
+        self.dtype = dtype
+        self.base = base
+        self.codec = codec
+        self.tol = tol
+        self.keyframe = keyframe
+        self.recon = None  # delta codec: decoded value of the last kept snapshot
+        self.cache = None  # delta codec: (item index, decoded value) of the last read
+        self.layout = None  # class and shapes of encoded PlaceFieldParams
+        self.set_policy(policy)
+        self.positions = []
+        self.items = []
+        self.nbytes = 0  # live bytes of the kept snapshots
+        self.length = 0
+
+    def set_policy(self, policy):
+        if policy.startswith('log') and self.total is None:
+            raise ValueError('log snapshot policy needs the total number of snapshots')
+        self.policy = policy
+        self.kept = set(get_kept(policy, self.total, self.keep).tolist()) if self.total is not None else None
+
+    def wants(self, position):
+        if self.policy in ['all', 'none'] or position in self.keep:
+            return True
+        if self.kept is not None:
+            return position in self.kept
+        return position % int(self.policy.split(':')[1]) == 0
+
+    def append(self, x):
+        position = self.length
+        self.length += 1
+        if self.policy == 'none' and self.items and self.positions[-1] not in self.keep:
+            self.nbytes -= get_nbytes(self.items[-1])
+            self.positions.pop()
+            self.items.pop()
+        if self.wants(position):
+            item = self.encode(x) if self.dtype is not None or self.base is not None or self.codec != 'none' else x
+            self.positions.append(position)
+            self.items.append(item)
+            self.nbytes += get_nbytes(item)
+
+    def encode(self, x):
+        if hasattr(x, 'from_flat'):  # PlaceFieldParams, stored as its flat buffer
+            self.layout = (type(x), x.shapes)
+            x = x.flat
+        x = np.asarray(x, dtype=float)
+        if self.base is not None:
+            x = x - self.base
+        dtype = x.dtype if self.dtype is None else self.dtype
+        if self.codec.startswith('lowrank'):
+            rank = int(self.codec.split(':')[1])
+            u, s, vt = np.linalg.svd(x, full_matrices=False)
+            return set_dtype(u[:,:rank] * s[:rank], dtype), set_dtype(vt[:rank], dtype)
+        if self.codec == 'delta':
+            if len(self.items) % self.keyframe == 0 or self.policy == 'none':
+                key = set_dtype(x, dtype)
+                self.recon = get_float(key).astype(float)
+                return (key,)
+            # the change is taken from the decoded previous snapshot, so dropped entries do not accumulate
+            d = (x - self.recon).ravel()
+            idx = np.flatnonzero(np.abs(d) > self.tol).astype(np.int32)
+            values = set_dtype(d[idx], dtype)
+            self.recon.flat[idx] += get_float(values)
+            return idx, values
+        return set_dtype(x, dtype, copy=self.base is None)
+
+    def decode(self, i):
+        item = self.items[i]
+        if self.codec.startswith('lowrank'):
+            x = get_float(item[0]).astype(float) @ get_float(item[1]).astype(float)
+        elif self.codec == 'delta':
+            start = i - i % self.keyframe if self.policy != 'none' else i
+            if self.cache is not None and start <= self.cache[0] <= i:
+                start, x = self.cache[0], self.cache[1].copy()
+            else:
+                x = get_float(self.items[start][0]).astype(float)
+            for j in range(start+1, i+1):
+                idx, values = self.items[j]
+                x.flat[idx] += get_float(values)
+            self.cache = (i, x.copy())
+        else:
+            x = get_float(item)
+        x = x + self.base if self.base is not None else x
+        if self.layout is not None:
+            return self.layout[0].from_flat(x, self.layout[1])
+        return x
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[p] for p in range(*position.indices(self.length))]
+        if position < 0:
+            position += self.length
+        if not 0 <= position < self.length:
+            raise IndexError(f'{self.name} index {position} out of range')
+        if self.policy == 'all':
+            i = position
+        else:
+            i = max(np.searchsorted(self.positions, position, side='right') - 1, 0)
+        if self.dtype is not None or self.base is not None or self.codec != 'none':
+            return self.decode(i)
+        return self.items[i]
+
+    def __iter__(self):
+        for position in range(self.length):
+            yield self[position]
+
+    def tolist(self):
+        # plain list for saving, with repeated references at the skipped positions (copies when encoded)
+        return list(self)
+
+    def project(self, itembytes, total=None):
+        # bytes held at the end of a run of total snapshots of itembytes each under the current policy
+        total = self.total if total is None else total
+        return itembytes * len(get_kept(self.policy, total, self.keep))
+
+
+class MemoryBudget:
+    # projects the final footprint of the stores from the episode budget before training and, when it exceeds
+    # cap bytes, raises MemoryError ('refuse') or thins the stores to every k-th snapshot ('downgrade')
+    def __init__(self, cap=0, action='downgrade'):
+        self.cap = cap
+        self.action = action
+        self.stores = {}
+        self.itembytes = {}
+
+    def add(self, store, itembytes):
+        self.stores[store.name] = store
+        self.itembytes[store.name] = itembytes
+        return store
+
+    def projected(self):
+        return sum(store.project(self.itembytes[name]) for name, store in self.stores.items())
+
+    def check(self):
+        projected = self.projected()
+        if self.cap <= 0 or projected <= self.cap:
+            return projected
+        message = f'history needs {projected/1024**2:.1f} MB, more than the cap of {self.cap/1024**2:.1f} MB'
+        if self.action == 'refuse':
+            raise MemoryError(message)
+        low, k = 1, 1
+        while self.projected() > self.cap:
+            low = k
+            k = max(k+1, int(np.ceil(k * self.projected() / self.cap)))
+            if k >= max(store.total for store in self.stores.values()):
+                raise MemoryError(message + ', even keeping only the first and last snapshots')
+            self.thin(k)
+        # the ratio step can overshoot, bisect for the smallest k that fits between the last one that did not and k
+        while k - low > 1:
+            mid = (low + k) // 2
+            self.thin(mid)
+            if self.projected() <= self.cap:
+                k = mid
+            else:
+                low = mid
+        self.thin(k)
+        print(f'{message}, keeping every {k} snapshots')
+        return self.projected()
+
+    def thin(self, k):
+        for store in self.stores.values():
+            if store.policy != 'none':
+                store.set_policy(f'every:{k}')
+
+    def report(self):
+        # live bytes per store, as telemetry fields
+        return {'bytes_'+name: store.nbytes for name, store in self.stores.items()}
+
+    def summary(self):
+        return {'cap': self.cap, 'projected': self.projected(), 'policies': {name: store.policy for name, store in self.stores.items()}, **self.report()}
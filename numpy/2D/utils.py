@@ -8,7 +8,8 @@ from io import BytesIO
 from model import predict_batch_placecell, softmax
 from matplotlib.patches import Rectangle
 
-def plot_analysis(logparams,latencys,allrewards, allcoords, stable_perf, exptname=None , rsz=0.05):
+def plot_analysis(logparams,latencys,allrewards, allcoords, stable_perf, exptname=None , rsz=0.05, metrics=None):
+    # metrics: optional output of compute_metrics, reused instead of recomputing score and drift
     f, axs = plt.subplots(7,3,figsize=(12,21))
     total_trials = len(latencys)
     gap = 25
@@ -46,13 +47,16 @@ def plot_analysis(logparams,latencys,allrewards, allcoords, stable_perf, exptnam
     plot_field_center(logparams, np.linspace(0, total_trials, num=21, dtype=int), ax=axs[3,2])
 
     ## drift
-    trials, pv_corr,rep_corr, startxcor, endxcor = get_pvcorr(logparams, stable_perf, total_trials, num=101)
+    if metrics is None:
+        trials, pv_corr,rep_corr, startxcor, endxcor = get_pvcorr(logparams, stable_perf, total_trials, num=101)
+        drift = (np.std(pv_corr))/(np.std(np.array(latencys)[np.linspace(stable_perf, total_trials-1, num=1001, dtype=int)]))
+    else:
+        trials, pv_corr,rep_corr, startxcor, endxcor = [metrics[k] for k in ['pv_trials', 'pv_corr', 'rep_corr', 'startxcor', 'endxcor']]
+        drift = metrics['drift']
 
     plot_rep_sim(startxcor, stable_perf, ax=axs[5,0])
 
     plot_rep_sim(endxcor, total_trials, ax=axs[5,1])
-    
-    drift = (np.std(pv_corr))/(np.std(np.array(latencys)[np.linspace(stable_perf, total_trials-1, num=1001, dtype=int)]))
 
     plot_pv_rep_corr(trials, pv_corr, rep_corr,title=f"D={drift:.3f}",ax=axs[5,2])
 
@@ -93,13 +97,14 @@ def plot_maps(actor_weights,critic_weights, env, npc, title=None):
     plt.tight_layout()
 
 
-def store_csv(csv_file, args, score, drift):
+def store_csv(csv_file, args, score, drift, flag=''):
     # Extract all arguments from args namespace
     arg_dict = vars(args)
     
-    # Add score and drift to the dictionary
+    # Add score, drift and the watchdog reason to the dictionary
     arg_dict['score'] = score
     arg_dict['drift'] = drift
+    arg_dict['flag'] = flag
 
     # Create csv_columns from the keys of arg_dict
     csv_columns = list(arg_dict.keys())
@@ -423,7 +428,7 @@ def plot_velocity(logparams, trial, goalcoord=[0.75,-0.75], startcoord=[-0.7,-0.
 
     pcacts = predict_batch_placecell(logparams[trial], xs)
     actout = pcacts @ logparams[trial][3] 
-    aprob = nn.softmax(actout)
+    aprob = softmax(actout)
     onehot2dirmat = np.array([
     [0,1],  # up
     [1,0],  # right
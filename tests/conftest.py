@@ -0,0 +1,28 @@
+# The backend folders are not packages and share module names (model, env, experiment, ...), so each test imports
+# them through the folder fixture, which puts one folder first on sys.path and drops the modules of the others.
+
+import os
+import sys
+import importlib
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['model', 'env', 'experiment', 'store', 'metrics', 'utils', 'sr_utils', 'sweep', 'cache', 'history']
+
+
+@pytest.fixture
+def folder(monkeypatch):
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+
+    def load(name, *modules):
+        path = os.path.join(ROOT, name)
+        for module in MODULES:
+            monkeypatch.delitem(sys.modules, module, raising=False)
+        monkeypatch.syspath_prepend(path)
+        monkeypatch.chdir(path)
+        loaded = [importlib.import_module(module) for module in modules]
+        return loaded[0] if len(loaded) == 1 else loaded
+
+    yield load
+    for module in MODULES:
+        sys.modules.pop(module, None)
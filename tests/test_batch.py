@@ -0,0 +1,72 @@
+from copy import deepcopy
+import numpy as np
+import pytest
+
+
+def get_transitions(name, model, k, seed=0, weights=0.1):
+    # k transitions from random states under the current policy, with per field alphas and actor and critic
+    # weights of the given scale (1e-5 at init)
+    rng = np.random.default_rng(seed)
+    if name == 'numpy/1D':
+        params = model.uniform_pc_weights(16, 2, seed, sigma=0.1, alpha=0.5)
+        dim = 1
+    else:
+        params = model.uniform_2D_pc_weights(16, 4, seed, sigma=0.1, alpha=0.5)
+        dim = 2
+    params = [np.array(p, dtype=float) for p in params]
+    params[2] = rng.uniform(0.3, 0.7, params[2].shape)
+    params[3] = weights * rng.normal(size=params[3].shape)
+    params[4] = weights * rng.normal(size=params[4].shape)
+    states = rng.uniform(-0.8, 0.8, (k, dim))
+    newstates = states + rng.uniform(-0.1, 0.1, (k, dim))
+    aprobs = np.array([model.predict_action_prob(params, model.predict_placecell(params, s)) for s in states]).reshape(k, -1)
+    actions = rng.integers(0, aprobs.shape[1], k)
+    rewards = rng.uniform(0, 1, k)
+    return params, rewards, newstates, states, actions, aprobs
+
+
+def learn_step(name, model, params, transition, etas, penalty):
+    reward, newstate, state, action, aprob = transition
+    if name == 'numpy/1D':
+        return model.learn(params, reward, newstate, state, action, aprob, 0.9, etas, penalty)[0]
+    return model.learn(params, reward, newstate, state, action, aprob, 0.9, etas, penalty[1])[0]
+
+
+def batch_error(name, model, transitions, etas, penalty=(0.0, 0.0)):
+    if name == 'numpy/1D':
+        return model.get_batch_error(*transitions, 0.9, etas, list(penalty))
+    return model.get_batch_error(*transitions, 0.9, etas, penalty[1])
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_batch_of_one_equals_learn(folder, name):
+    model = folder(name, 'model')
+    params, *batch = get_transitions(name, model, 1)
+    etas = [1e-3, 1e-3, 1e-3, 0.01, 0.01]
+    penalty = [0.01, 0.02]
+    sequential = learn_step(name, model, deepcopy(params), [x[0] for x in batch], etas, penalty)
+    if name == 'numpy/1D':
+        batched, tds = model.learn_batch(deepcopy(params), *batch, 0.9, etas, penalty)
+    else:
+        batched, tds = model.learn_batch(deepcopy(params), *batch, 0.9, etas, penalty[1])
+    for s, b in zip(sequential, batched):
+        np.testing.assert_allclose(b, s, rtol=1e-10, atol=1e-14)
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_batch_error_shrinks_with_learning_rates(folder, name):
+    model = folder(name, 'model')
+    transitions = get_transitions(name, model, 5, weights=1e-5)
+    etas = np.array([1e-4, 1e-4, 1e-4, 0.01, 0.01])
+    errors = [batch_error(name, model, transitions, list(etas * scale)) for scale in [1, 0.1, 0.01]]
+    assert 0 < errors[0] < 0.5
+    assert errors[1] < 0.2 * errors[0] and errors[2] < 0.2 * errors[1]
+
+
+@pytest.mark.parametrize('name, config', [
+    ('numpy/1D', {'episodes': 30, 'tmax': 20, 'balpha': 0.01}),
+    ('numpy/2D', {'episodes': 30, 'npc': 4, 'tmax': 20, 'balpha': 0.01}),
+])
+def test_batchtol_accepts_default_learning_rates(folder, tmp_path, name, config):
+    experiment = folder(name, 'experiment')
+    experiment.run_experiment(config, batch=5, batchtol=0.5, plot=0, processes=0, datadir=str(tmp_path)+'/')
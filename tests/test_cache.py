@@ -0,0 +1,35 @@
+import importlib.util
+import numpy as np
+import pytest
+
+
+def load_module(path):
+    spec = importlib.util.spec_from_file_location(path.stem + '_' + str(abs(hash(str(path)))), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_dependency_edit_misses_the_cache(folder, tmp_path, name):
+    cache = folder(name, 'cache')
+    code = tmp_path / 'code'
+    code.mkdir()
+    (code / 'analysis.py').write_text('def get_total(x, scale=1):\n    return scale * float(x.sum())\n')
+    (code / 'model.py').write_text('SCALE = 1\n')
+    get_total = load_module(code / 'analysis.py').get_total
+
+    store = cache.AnalysisCache(str(tmp_path / 'cache'))
+    cached = store.memoize(get_total)
+    x = np.arange(4.0)
+    cached(x, run='run0')
+    cached(x, run='run0')
+    assert (store.hits, store.misses) == (1, 1)
+
+    (code / 'model.py').write_text('SCALE = 2\n')  # a module the analysis may call changed
+    cached(x, run='run0')
+    assert (store.hits, store.misses) == (1, 2)
+
+    salted = cache.AnalysisCache(str(tmp_path / 'cache'), version='v2').memoize(get_total)
+    salted(x, run='run0')
+    assert store.hits == 1 and len(store.entries()) == 3
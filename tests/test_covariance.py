@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def get_matrices(rng, n=200):
+    # random and edge case 2x2 matrices: asymmetric, singular, negative determinant, negative or large diagonals
+    matrices = rng.uniform(-0.7, 0.7, (n, 2, 2))
+    edge = np.array([
+        [[0.1, 0.1], [0.1, 0.1]],  # singular, det 0
+        [[0.04, 0.02], [0.02, 0.01]],  # singular, det 0
+        [[0.1, 0.3], [0.3, 0.1]],  # negative det
+        [[0.1, -0.3], [-0.3, 0.2]],  # negative det, negative off-diagonal
+        [[-0.1, 0.05], [0.05, 0.2]],  # negative diagonal
+        [[1.0, 0.9], [0.8, 2.0]],  # large and asymmetric
+        [[1e-6, 0.0], [0.0, 1e-6]],  # below min_val, zero off-diagonal
+        [[0.2, 0.0], [0.0, 0.0]],  # singular diagonal
+    ])
+    return np.concatenate([edge, matrices])
+
+
+def test_correct_covariance_matrices_matches_numpy(folder):
+    model = folder('jax/2D', 'model')
+    import jax
+    matrices = get_matrices(np.random.default_rng(0))
+    corrected = np.asarray(jax.jit(model.correct_covariance_matrices)(matrices))
+    expected = np.asarray(model.correct_covariance_matrices_np(matrices))
+    np.testing.assert_allclose(corrected, expected, rtol=1e-6, atol=1e-7)
+
+    # projected matrices are symmetric with positive determinant and entries in range
+    np.testing.assert_array_equal(corrected, np.transpose(corrected, (0, 2, 1)))
+    det = corrected[:, 0, 0] * corrected[:, 1, 1] - corrected[:, 0, 1]**2
+    assert np.all(det > 0)
+    assert np.all(np.abs(corrected) <= 0.5)
+
+
+def test_update_td_params_projects_the_fields(folder):
+    model = folder('jax/2D', 'model')
+    import jax.numpy as jnp
+    params = model.uniform_2D_pc_weights(4, 4, 0, sigma=0.1, alpha=1)
+    # invertible so the gradients are finite, but out of range, with det 0 once the diagonal is clipped
+    sigma = np.array([[[0.8, 0.6], [0.6, 0.8]], [[0.3, 0.1], [0.1, 0.2]], [[0.02, 0.0], [0.0, 0.9]], [[0.6, -0.55], [-0.55, 0.6]]])
+    alpha = np.array([3.0, -1.0, 0.5, 2.5])
+    params = [jnp.array(p, dtype=jnp.float32) for p in [params[0], sigma, alpha, params[3], params[4]]]
+    coords = jnp.array(np.random.default_rng(0).uniform(-0.5, 0.5, (11, 2)), dtype=jnp.float32)
+    actions = jnp.eye(4)[np.arange(10) % 4]
+    rewards = jnp.linspace(0, 1, 10)
+    # without learning the update is the projection of the params
+    newparams, grads, loss = model.update_td_params(params, coords, actions, rewards, [0.0]*5, 0.9, [0.5, 0.0])
+    np.testing.assert_array_equal(np.asarray(newparams[2]), np.float32([2.0, 1e-5, 0.5, 2.0]))
+    np.testing.assert_allclose(np.asarray(newparams[1]), np.asarray(model.correct_covariance_matrices_np(sigma)),
+                               rtol=1e-6, atol=1e-7)
@@ -0,0 +1,86 @@
+import time
+import threading
+import numpy as np
+import pytest
+
+
+def get_snapshots(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [[rng.normal(size=4).astype(np.float32), rng.normal(size=(4, 2)).astype(np.float32)] for _ in range(n)]
+
+
+@pytest.mark.parametrize('name', ['jax/1D', 'jax/2D'])
+def test_param_history_indexes_like_a_list(folder, name):
+    history = folder(name, 'history')
+    snapshots = get_snapshots(7)
+    params = history.ParamHistory(snapshots[0], 3)  # grows past the expected total
+    for snapshot in snapshots:
+        params.append(snapshot)
+
+    assert len(params) == len(snapshots)
+    for i in [0, 3, 6, -1, -7]:
+        for p, s in zip(params[i], snapshots[i]):
+            np.testing.assert_array_equal(p, s)
+    assert [len(s) for s in params[2:5]] == [2, 2, 2]
+    assert all(np.array_equal(p[1], s[1]) for p, s in zip(params.tolist(), snapshots))
+    assert params.nbytes == sum(p.nbytes for s in snapshots for p in s)
+    with pytest.raises(IndexError):
+        params[7]
+
+
+@pytest.mark.parametrize('name', ['jax/1D', 'jax/2D'])
+def test_param_history_bfloat16(folder, name):
+    history = folder(name, 'history')
+    snapshots = get_snapshots(3)
+    params = history.ParamHistory(snapshots[0], 3, 'bfloat16')
+    for snapshot in snapshots:
+        params.append(snapshot)
+    assert params.nbytes == sum(p.nbytes for s in snapshots for p in s) // 2
+    for p, s in zip(params[1], snapshots[1]):
+        np.testing.assert_allclose(p, s, rtol=2**-8)
+
+
+class GatedHistory:
+    # appends block until the gate opens, to observe the copier queue
+    def __init__(self):
+        self.gate = threading.Event()
+        self.items = []
+
+    def append(self, params):
+        self.gate.wait()
+        self.items.append(params)
+
+
+@pytest.mark.parametrize('name', ['jax/1D', 'jax/2D'])
+def test_host_copier_depth_order_and_close(folder, name):
+    history = folder(name, 'history')
+    import jax.numpy as jnp
+    gated = GatedHistory()
+    copier = history.HostCopier(gated, depth=2)
+    snapshots = [[jnp.full(3, i)] for i in range(6)]
+
+    done = []
+    def put_all():
+        for snapshot in snapshots:
+            copier.put(snapshot)
+            done.append(len(done))
+    thread = threading.Thread(target=put_all)
+    thread.start()
+    time.sleep(0.5)
+    assert len(done) == 3  # one snapshot in append, depth in the queue, the next put blocks
+
+    gated.gate.set()
+    thread.join()
+    copier.close()  # drains the queue before returning
+    assert [int(s[0][0]) for s in gated.items] == list(range(6))
+
+
+@pytest.mark.parametrize('name', ['jax/1D', 'jax/2D'])
+def test_host_copier_reraises_append_errors(folder, name):
+    history = folder(name, 'history')
+    params = history.ParamHistory([np.zeros(3)], 2)
+    copier = history.HostCopier(params)
+    copier.put([np.zeros(3)])
+    copier.put([np.zeros(4)])  # wrong shape
+    with pytest.raises(ValueError):
+        copier.sync()
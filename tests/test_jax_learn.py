@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def step(folder):
+    model = folder('jax/1D', 'model')
+    import jax.numpy as jnp
+    rng = np.random.default_rng(0)
+    npc, nact = 16, 2
+    params = model.uniform_pc_weights(npc, nact, 0, sigma=0.2, alpha=0.8)
+    params[1] = params[1] * jnp.asarray(rng.uniform(0.5, 1.5, npc))
+    params[2] = params[2] * jnp.asarray(rng.uniform(0.5, 1.5, npc))
+    params[3] = jnp.asarray(rng.normal(size=(npc, nact)))
+    params[4] = jnp.asarray(rng.normal(size=(npc, 1)))
+    state, newstate = jnp.array([0.1]), jnp.array([0.15])
+    onehotg = jnp.array([0.0, 1.0])
+    aprob = model.predict_action_prob(params, model.predict_placecell(params, state))
+
+    def run(bptype, b_sig_alp):
+        # unit learning rates, so the change of params is the gradient
+        newparams, td = model.learn(params, 0.5, newstate, state, onehotg, aprob, 0.9, [1.0]*5, b_sig_alp, [0, 0], 1, bptype)
+        return [np.asarray(n - p) for n, p in zip(newparams, params)], float(td)
+    return model, params, state, onehotg, aprob, run
+
+
+def test_autodiff_matches_both_without_penalty(step):
+    model, params, state, onehotg, aprob, run = step
+    both, td = run('both', [0.0, 0.0])
+    auto, _ = run('autodiff', [0.0, 0.0])
+    for b, a in zip(both, auto):
+        np.testing.assert_allclose(a, b, rtol=1e-4, atol=1e-6)
+
+
+def test_autodiff_penalty_is_weight_decay(step):
+    # the documented difference: plain weight decay against the post_td * pcact scaled sigma penalty and the
+    # alpha penalty of the first field on every field
+    model, params, state, onehotg, aprob, run = step
+    b_sig_alp = [0.01, 0.02]
+    both, td = run('both', b_sig_alp)
+    auto, _ = run('autodiff', b_sig_alp)
+    pcact = np.asarray(model.predict_placecell(params, state))
+    decay = onehotg - np.asarray(aprob)
+    post_td = (np.asarray(params[3]) @ decay + np.asarray(params[4])[:,0]) * td
+    l2_sigma = b_sig_alp[0] * 2*np.asarray(params[1])
+    l2_alpha = b_sig_alp[1] * 2*np.asarray(params[2])
+    np.testing.assert_allclose(both[1] - auto[1], l2_sigma - post_td * pcact * l2_sigma, rtol=1e-3, atol=1e-6)
+    np.testing.assert_allclose(both[2] - auto[2], l2_alpha - l2_alpha[0], rtol=1e-3, atol=1e-6)
+    for i in [0, 3, 4]:
+        np.testing.assert_allclose(auto[i], both[i], rtol=1e-4, atol=1e-6)
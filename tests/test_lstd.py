@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_sherman_morrison_equals_direct_solve(folder, name):
+    model = folder(name, 'model')
+    rng = np.random.default_rng(0)
+    npc, gamma, ridge = 12, 0.9, 1e-2
+    lstd = model.init_lstd(npc, ridge)
+    A, b = ridge * np.eye(npc), np.zeros((npc, 1))
+    for step in range(200):
+        pcact, newpcact, reward = rng.random(npc), rng.random(npc), rng.random()
+        model.update_lstd(lstd, reward, pcact, newpcact, gamma)
+        A += np.outer(pcact, pcact - gamma * newpcact)
+        b += pcact[:, None] * reward
+    critic = model.solve_lstd(lstd)
+    assert critic.shape == (npc, 1)
+    np.testing.assert_allclose(critic, np.linalg.solve(A, b), rtol=1e-6)
+
+
+@pytest.mark.parametrize('name, config', [
+    ('numpy/1D', {'episodes': 30, 'tmax': 20}),
+    ('numpy/2D', {'episodes': 30, 'npc': 4, 'tmax': 20}),
+])
+def test_lstd_needs_fixed_fields(folder, tmp_path, name, config):
+    experiment = folder(name, 'experiment')
+    config = dict(config, critic='lstd', plot=0, processes=0, datadir=str(tmp_path)+'/')
+    with pytest.raises(ValueError, match='fixed fields'):
+        experiment.run_experiment(config)  # default llr, slr and alr are nonzero
+    result = experiment.run_experiment(config, llr=0.0, slr=0.0, alr=0.0)
+    assert np.all(np.isfinite(result.params[4]))
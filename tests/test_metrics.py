@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('name, config', [
+    ('numpy/1D', {'episodes': 10, 'tmax': 50}),
+    ('numpy/2D', {'episodes': 10, 'npc': 6, 'tmax': 50}),
+])
+def test_metrics_of_run_shorter_than_gap(folder, tmp_path, name, config):
+    experiment = folder(name, 'experiment')
+    result = experiment.run_experiment(config, plot=0, processes=0, datadir=str(tmp_path)+'/')
+    assert len(result.latencys) < 25  # the default gap of compute_metrics
+    assert np.isfinite(result.metrics['score'])
+    assert len(result.metrics['fxdx_R']) > 0
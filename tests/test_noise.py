@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_white_noise_equals_per_step_draws(folder, name):
+    # blocks are filled in the order of per step draws, so the same Generator gives the same noise
+    model = folder(name, 'model')
+    shapes = [(6, 2), (6,), (6, 3)]
+    noise = 1e-3
+    source = model.NoiseSource(shapes, noise, np.random.default_rng(3), block=16)
+    rng = np.random.default_rng(3)
+    for step in range(40):  # across two block refills
+        for ns, shape in zip(source.next(), shapes):
+            np.testing.assert_allclose(ns, rng.normal(size=shape) * noise, rtol=1e-12)
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_noise_scales_and_float32(folder, name):
+    model = folder(name, 'model')
+    source = model.NoiseSource([(50,), (50,)], 1e-3, np.random.default_rng(0), block=100, dtype=np.float32, scales=[1, 0.5])
+    steps = np.array([np.concatenate(source.next()) for _ in range(1000)])
+    assert steps.dtype == np.float32
+    np.testing.assert_allclose(steps[:, :50].std(), 1e-3, rtol=0.02)
+    np.testing.assert_allclose(steps[:, 50:].std(), 0.5e-3, rtol=0.02)
+    assert abs(steps.mean()) < 1e-5
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_ou_drift_statistics(folder, name):
+    # stationary std of the white noise and lag one correlation exp(-1/tau), also across block boundaries
+    model = folder(name, 'model')
+    tau = 10
+    source = model.NoiseSource([(200,)], 1e-3, np.random.default_rng(1), block=64, tau=tau)
+    steps = np.array([source.next()[0].copy() for _ in range(2000)])
+    np.testing.assert_allclose(steps.std(), 1e-3, rtol=0.05)
+    lag1 = lambda x, y: np.mean(x * y) / np.mean(x * x)
+    np.testing.assert_allclose(lag1(steps[:-1], steps[1:]), np.exp(-1/tau), atol=0.01)
+    boundary = np.arange(63, 1999, 64)  # last step of a block and the first of the next
+    np.testing.assert_allclose(lag1(steps[boundary], steps[boundary+1]), np.exp(-1/tau), atol=0.03)
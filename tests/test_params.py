@@ -0,0 +1,65 @@
+import pickle
+from copy import deepcopy
+import numpy as np
+import pytest
+
+
+def get_params(name, model):
+    rng = np.random.default_rng(0)
+    if name == 'numpy/1D':
+        params = model.uniform_pc_weights(8, 2, 0, sigma=0.1, alpha=0.5)
+    else:
+        params = model.uniform_2D_pc_weights(9, 4, 0, sigma=0.1, alpha=0.5)
+    params = [np.array(p, dtype=float) for p in params]
+    params[3] = 0.1 * rng.normal(size=params[3].shape)
+    params[4] = 0.1 * rng.normal(size=params[4].shape)
+    return params
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_views_share_one_buffer(folder, name):
+    model = folder(name, 'model')
+    params = get_params(name, model)
+    pf = model.PlaceFieldParams(params)
+    assert pf.flat.size == sum(p.size for p in params)
+    for view, p in zip(pf, params):
+        np.testing.assert_array_equal(view, p)
+        assert np.shares_memory(view, pf.flat)
+    assert pf.critic is pf[4]
+
+    pf[2] = 0.25  # assignment copies into the view
+    assert np.all(pf.flat[pf.offsets[2]:pf.offsets[3]] == 0.25)
+    pf[4] += 1.0
+    np.testing.assert_array_equal(pf[4], params[4] + 1.0)
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_flat_round_trip(folder, name):
+    model = folder(name, 'model')
+    pf = model.PlaceFieldParams(get_params(name, model))
+    for other in [model.PlaceFieldParams.from_flat(pf.flat, pf.shapes), pickle.loads(pickle.dumps(pf)), pf.copy(), deepcopy(pf)]:
+        assert [np.shape(v) for v in other] == pf.shapes
+        for a, b in zip(other, pf.tolist()):
+            np.testing.assert_array_equal(a, b)
+    assert np.shares_memory(model.PlaceFieldParams.from_flat(pf.flat, pf.shapes)[0], pf.flat)
+    copied = pf.copy()
+    copied[0] += 1
+    assert not np.array_equal(copied[0], pf[0])
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_learn_on_buffer_equals_list(folder, name):
+    model = folder(name, 'model')
+    params = get_params(name, model)
+    pf = model.PlaceFieldParams(params)
+    rng = np.random.default_rng(1)
+    etas = [1e-3, 1e-3, 1e-3, 0.01, 0.01]
+    for step in range(20):
+        state = rng.uniform(-0.5, 0.5, np.shape(params[0])[1:] or 1)
+        newstate = state + 0.05
+        aprob = model.predict_action_prob(params, model.predict_placecell(params, state))
+        action = int(rng.integers(len(np.ravel(aprob))))
+        params = model.learn(params, 0.5, newstate, state, action, aprob, 0.9, etas)[0]
+        pf = model.learn(pf, 0.5, newstate, state, action, aprob, 0.9, etas)[0]
+    for a, b in zip(pf, params):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-15)
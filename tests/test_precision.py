@@ -0,0 +1,16 @@
+import pytest
+
+
+@pytest.mark.parametrize('name, config', [
+    ('jax/1D', {'episodes': 2, 'tmax': 20, 'npc': 8}),
+    ('jax/2D', {'episodes': 2, 'tmax': 20, 'npc': 3}),
+])
+def test_float64_run_does_not_leak_x64(folder, tmp_path, name, config):
+    experiment = folder(name, 'experiment')
+    import jax
+    runs = {precision: experiment.run_experiment(config, precision=precision, plot=0, datadir=str(tmp_path)+'/')
+            for precision in ['float64', 'float32']}
+    assert not jax.config.jax_enable_x64
+    for precision, result in runs.items():
+        assert all(p.dtype == precision for p in result.params)
+        assert all(p.dtype == precision for p in result.logparams[-1])
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+
+def get_problem(name, model, env):
+    # fields of the folder's uniform population with a non uniform policy, on a tiny grid
+    rng = np.random.default_rng(0)
+    if name == 'numpy/1D':
+        params = model.uniform_pc_weights(8, 2, 0, sigma=0.2, alpha=0.5)
+        arena = env.OneDimNav(nact=2, tmax=20, goalcoord=[0.5], startcoord=[-0.75])
+        grid = {'num': 21, 'numv': 5}
+    else:
+        params = model.uniform_2D_pc_weights(9, 4, 0, sigma=0.3, alpha=0.5)
+        arena = env.NDimNav(nact=4, tmax=20, startcoord=[[-0.75, -0.75]], obstacles=True)
+        grid = {'num': 7, 'numv': 3}
+    params[3] = rng.normal(size=params[3].shape)
+    return params, arena, grid
+
+
+def get_features(name, sr_utils, params, arena, states, numv):
+    # phi of every (position, velocity) state, as solve_sr evaluates it
+    nv = numv**arena.statesize
+    if name == 'numpy/1D':
+        return sr_utils.predict_placecell(params, states[::nv,:1])[np.arange(len(states)) // nv]
+    return sr_utils.probe_placecell(params, states[::nv,:2])[np.arange(len(states)) // nv]
+
+
+def td_fixed_point(P, phi, gamma, lr=0.5, tol=1e-13):
+    # expected TD iteration of the SR over all states, psi += lr (phi + gamma P psi - psi)
+    psi = phi.copy()
+    while True:
+        delta = lr * (phi + gamma * (P @ psi) - psi)
+        psi += delta
+        if np.max(np.abs(delta)) < tol:
+            return psi
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_solve_sr_is_the_td_fixed_point(folder, name):
+    model, env, sr_utils = folder(name, 'model', 'env', 'sr_utils')
+    params, arena, grid = get_problem(name, model, env)
+    gamma = 0.9
+    P, states, grids = sr_utils.get_transition_matrix(params, arena, **grid)
+    np.testing.assert_allclose(np.asarray(P.sum(axis=1)).reshape(-1), 1, atol=1e-12)  # rows are distributions
+
+    phi = get_features(name, sr_utils, params, arena, states, grid['numv'])
+    psi = td_fixed_point(P, phi, gamma)
+    occupancy = sr_utils.get_occupancy(P, arena, grids, arena.tmax)
+    w = occupancy / np.sum(occupancy)
+    G = phi.T @ (w[:,None] * phi) + 1e-6 * np.eye(phi.shape[1])
+    U_td = np.linalg.solve(G, phi.T @ (w[:,None] * psi)).T
+
+    U, ca1, xs = sr_utils.solve_sr(params, arena, gamma, method='direct', **grid)
+    np.testing.assert_allclose(U, U_td, rtol=1e-8, atol=1e-8)
+    assert ca1.shape == (len(xs), phi.shape[1])
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_solve_sr_direct_and_iterative_agree(folder, name):
+    model, env, sr_utils = folder(name, 'model', 'env', 'sr_utils')
+    params, arena, grid = get_problem(name, model, env)
+    U, ca1, xs = sr_utils.solve_sr(params, arena, 0.9, method='direct', **grid)
+    U_it, ca1_it, xs_it = sr_utils.solve_sr(params, arena, 0.9, method='iterative', **grid)
+    np.testing.assert_allclose(ca1_it, ca1, rtol=1e-6, atol=1e-7)
+    np.testing.assert_allclose(U_it, U, rtol=1e-4, atol=1e-6)  # the fit of U amplifies the solver error
+    np.testing.assert_array_equal(xs_it, xs)
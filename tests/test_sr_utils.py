@@ -0,0 +1,28 @@
+import gc
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_ca1_cache_is_lru_and_released_with_history(folder, name):
+    store, sr_utils = folder(name, 'store', 'sr_utils')
+    rng = np.random.default_rng(0)
+    npc, total = 8, 6
+    ca3 = rng.random((50, npc))
+    us = store.SnapshotStore('Us', 'all', total)
+    for _ in range(total):
+        us.append(rng.normal(size=(npc, npc)))
+
+    ca1s = sr_utils.get_ca1s(ca3, us, [3, 1, 3])
+    assert np.allclose(ca1s[0], sr_utils.get_ca1(ca3, us[3]))
+    cache = sr_utils.ca1_caches[us]
+    assert cache.nbytes == 2 * ca1s[0].nbytes
+
+    cache.maxbytes = 2 * ca1s[0].nbytes
+    sr_utils.get_ca1s(ca3, us, [3])  # 3 becomes the most recent, 1 is evicted next
+    sr_utils.get_ca1s(ca3, us, [5])
+    assert [key[-1] for key in cache.entries] == [3, 5]
+
+    del us, cache
+    gc.collect()
+    assert len(sr_utils.ca1_caches) == 0
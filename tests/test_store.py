@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_keep_survives_thinning(folder, name):
+    store = folder(name, 'store')
+    total = 2000
+    keep = [t-g for t in np.linspace(50, total-1, dtype=int, num=11) for g in range(51)]
+    us = store.SnapshotStore('Us', 'all', total, dtype=np.float32, keep=keep)
+    budget = store.MemoryBudget(cap=800*8)
+    budget.add(us, 8)
+    budget.check()  # downgrades to every:k
+    for i in range(total):
+        us.append(np.full(3, i, dtype=float))
+    assert us.policy.startswith('every')
+    assert all(us[k][0] == k for k in keep)
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_budget_downgrades_to_the_smallest_k_that_fits(folder, name):
+    store = folder(name, 'store')
+    for total, cap in [(1000, 10), (1000, 334), (5000, 37), (20000, 999)]:
+        budget = store.MemoryBudget(cap=cap*8)
+        history = budget.add(store.SnapshotStore('logparams', 'all', total), 8)
+        projected = budget.check()
+        k = int(history.policy.split(':')[1])
+        assert projected == history.project(8) <= cap*8
+        assert store.SnapshotStore('logparams', f'every:{k-1}', total).project(8) > cap*8 or k == 2
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_budget_refuses(folder, name):
+    store = folder(name, 'store')
+    budget = store.MemoryBudget(cap=100*8, action='refuse')
+    history = budget.add(store.SnapshotStore('logparams', 'all', 1000), 8)
+    with pytest.raises(MemoryError):
+        budget.check()
+    assert history.policy == 'all'
+    with pytest.raises(MemoryError):  # not even the first and last snapshots fit
+        budget = store.MemoryBudget(cap=8)
+        budget.add(store.SnapshotStore('logparams', 'all', 1000), 8)
+        budget.check()
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_delta_round_trip_across_keyframes(folder, name):
+    store = folder(name, 'store')
+    rng = np.random.default_rng(0)
+    tol = 1e-4
+    snapshots = [rng.normal(size=(6, 6))]
+    for _ in range(10):
+        change = rng.normal(scale=1e-3, size=(6, 6)) * (rng.random((6, 6)) < 0.3)  # sparse, some below tol
+        snapshots.append(snapshots[-1] + change)
+    us = store.SnapshotStore('Us', 'all', len(snapshots), base=np.eye(6), codec='delta', tol=tol, keyframe=4)
+    for u in snapshots:
+        us.append(u)
+    assert sum(len(item) == 1 for item in us.items) == 3  # keyframes at 0, 4 and 8
+    for i in [10, 3, 4, 5, 0, 7, 8, 9, 2]:  # out of order, across the keyframes and the read cache
+        np.testing.assert_allclose(us[i], snapshots[i], rtol=0, atol=tol)
+    assert us.nbytes < sum(u.nbytes for u in snapshots)
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_lowrank_reconstruction(folder, name):
+    store = folder(name, 'store')
+    rng = np.random.default_rng(0)
+    rank = 3
+    low = rng.normal(size=(20, rank)) @ rng.normal(size=(rank, 20))
+    full = rng.normal(size=(20, 20))
+    us = store.SnapshotStore('Us', 'all', 2, base=np.eye(20), codec=f'lowrank:{rank}')
+    us.append(np.eye(20) + low)
+    us.append(np.eye(20) + full)
+    np.testing.assert_allclose(us[0], np.eye(20) + low, atol=1e-10)  # rank r changes are exact
+    s = np.linalg.svd(full, compute_uv=False)
+    np.testing.assert_allclose(np.linalg.norm(us[1] - np.eye(20) - full, 2), s[rank])  # best rank r, Eckart-Young
+    assert us.nbytes == 2 * 2 * 20 * rank * 8
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_bfloat16_rounds_to_nearest_even(folder, name):
+    store = folder(name, 'store')
+    one = 0x3F80  # 1.0
+    halfway = np.float32(1 + 2**-8)  # between 1 and 1 + 2**-7, ties to the even 1
+    assert store.to_bfloat16(np.float32([1, halfway, 1 + 3 * 2**-8, 1 + 2**-8 + 2**-20])).tolist() == [one, one, one+2, one+1]
+    assert store.to_bfloat16(np.float32([-halfway])).tolist() == [0xBF80]
+    ml_dtypes = pytest.importorskip('ml_dtypes')
+    x = np.random.default_rng(0).normal(scale=100, size=10000).astype(np.float32)
+    np.testing.assert_array_equal(store.to_bfloat16(x), x.astype(ml_dtypes.bfloat16).view(np.uint16))
+    np.testing.assert_array_equal(store.from_bfloat16(store.to_bfloat16(x)), x.astype(ml_dtypes.bfloat16).astype(np.float32))
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.mark.parametrize('name', ['numpy/1D', 'numpy/2D'])
+def test_sweep_workers_compute_metrics_serially(folder, tmp_path, name):
+    sweep = folder(name, 'sweep')
+    argv = sweep.get_argv({'seed': '0'}, '--episodes 30', [1, 2, 3, 4])
+    args = sweep.get_parser().parse_args(argv)
+    assert args.processes == 0 and args.plot == 0
+
+    fixed = '--episodes 30 --tmax 20' + (' --npc 4' if name == 'numpy/2D' else '')
+    results = sweep.sweep({'seed': ['0']}, fixed=fixed, outdir=str(tmp_path)+'/', processes=0)
+    result, = results
+    assert result['status'] == 'ok', result['error']
+    assert result['args']['processes'] == 0
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('learn_name', ['learn', 'learn_diag'])
+@pytest.mark.parametrize('buffer', [False, True])
+def test_workspace_equals_allocating_learn(folder, learn_name, buffer):
+    model = folder('numpy/2D', 'model')
+    learn = getattr(model, learn_name)
+    npc, nact = 16, 4
+    rng = np.random.default_rng(0)
+    params = [np.array(p, dtype=float) for p in model.uniform_2D_pc_weights(npc, nact, 0, sigma=0.1, alpha=0.5)]
+    params[3] = 0.1 * rng.normal(size=params[3].shape)
+    params[4] = 0.1 * rng.normal(size=params[4].shape)
+    plain = [p.copy() for p in params]
+    fast = model.PlaceFieldParams(params) if buffer else [p.copy() for p in params]
+    ws = model.LearnWorkspace(npc, nact)
+    etas = [1e-3, 1e-3, 1e-3, 0.01, 0.01]
+    for step in range(30):
+        state = rng.uniform(-0.5, 0.5, 2)
+        newstate = state + rng.uniform(-0.1, 0.1, 2)
+        aprob = model.predict_action_prob(plain, model.predict_placecell(plain, state))
+        action = int(rng.integers(nact))
+        reward = float(step % 7 == 0)
+        plain, grads, td = learn(plain, reward, newstate, state, action, aprob, 0.9, etas, 0.01)
+        fast, wsgrads, wstd = learn(fast, reward, newstate, state, action, aprob, 0.9, etas, 0.01, ws=ws)
+        assert wstd == pytest.approx(td, rel=1e-12, abs=1e-15)
+        for g, w in zip(grads, wsgrads):
+            np.testing.assert_allclose(np.reshape(w, np.shape(g)), g, rtol=1e-10, atol=1e-14)
+    for a, b in zip(fast, plain):
+        np.testing.assert_allclose(a, b, rtol=1e-10, atol=1e-14)
+
+
+def test_workspace_noise_equals_learn(folder):
+    # without a NoiseSource both draw the same noise from the same Generator
+    model = folder('numpy/2D', 'model')
+    params = [np.array(p, dtype=float) for p in model.uniform_2D_pc_weights(9, 4, 0, sigma=0.1, alpha=0.5)]
+    state, newstate = np.array([0.1, 0.2]), np.array([0.15, 0.2])
+    aprob = model.predict_action_prob(params, model.predict_placecell(params, state))
+    args = (0.0, newstate, state, 1, aprob, 0.9, [1e-3]*5, 0.0, 1e-3, [0, 1, 2])
+    plain = model.learn([p.copy() for p in params], *args, rng=np.random.default_rng(5))[0]
+    fast = model.learn([p.copy() for p in params], *args, rng=np.random.default_rng(5), ws=model.LearnWorkspace(9, 4))[0]
+    for a, b in zip(fast, plain):
+        np.testing.assert_array_equal(a, b)